@@ -46,6 +46,9 @@ class Instrument(Base):
     type = odm.SymbolField()
     description = odm.CharField()
 
+    class Meta:
+        indexes = [('ccy', 'type')]
+
 
 class Instrument2(Base):
     type = odm.SymbolField()
@@ -222,6 +225,11 @@ class Statistics3(odm.StdModel):
     data = odm.JSONField(as_string=False)
 
 
+class Measurement(odm.StdModel):
+    name = odm.SymbolField()
+    data = odm.JSONField(as_string=False, index=['pv__mean', 'region'])
+
+
 class ComplexModel(odm.StdModel):
     name = odm.SymbolField()
     timestamp = odm.DateTimeField(as_cache=True)
@@ -234,6 +242,45 @@ class Environment(odm.StdModel):
     data = odm.PickleObjectField()
 
 
+class TaskData(odm.StdModel):
+    name = odm.SymbolField()
+    timestamp = odm.DateTimeField(lazy=True)
+    args = odm.PickleObjectField(lazy=True)
+    result = odm.JSONField(lazy=True, required=False)
+
+
+class Archive(odm.StdModel):
+    name = odm.SymbolField()
+    body = odm.ByteField(compress=True)
+    data = odm.PickleObjectField(compress=9, compress_threshold=64)
+    info = odm.JSONField(compress=True, required=False)
+
+
+class Counterparty(odm.StdModel):
+    name = odm.SymbolField(trigram=True)
+    description = odm.CharField(trigram=True)
+
+
+class Ticket(odm.StdModel):
+    title = odm.SymbolField()
+    status = odm.SymbolField(index='bitmap')
+    urgent = odm.BooleanField(index='bitmap')
+    priority = odm.IntegerField(default=0, index='bitmap')
+
+
+class Venue(odm.StdModel):
+    name = odm.SymbolField()
+    kind = odm.SymbolField()
+    location = odm.GeoField()
+
+
+class Venue2(Venue):
+    rating = odm.FloatField()
+
+    class Meta:
+        ordering = 'rating'
+
+
 ##############################################
 # Numeric Data
 
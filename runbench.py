@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+'''Stdnet benchmarks. Requires pulsar and a running redis-server.
+
+Run all scenarios and save the results::
+
+    python runbench.py run -o baseline.json
+
+List the available scenarios::
+
+    python runbench.py list
+
+Run the concurrent load test with 1, 2, 4 and 8 processes::
+
+    python runbench.py load -c 1,2,4,8 --mode process -o load.json
+
+Compare a new run against a baseline, the exit status is 1 when regressions
+are found::
+
+    python runbench.py run -o results.json
+    python runbench.py compare baseline.json results.json
+'''
+import sys
+import json
+import argparse
+
+from stdnet import settings
+
+
+def write(results, output):
+    data = json.dumps(results, indent=4, sort_keys=True)
+    if output:
+        with open(output, 'w') as f:
+            f.write(data)
+    else:
+        sys.stdout.write(data + '\n')
+
+
+def run(args):
+    from tests.all.benchmarks import run
+    results = run(args.server, size=args.size, repeat=args.repeat,
+                  warmup=args.warmup, pattern=args.filter, stream=sys.stderr)
+    write(results, args.output)
+    return 0
+
+
+def compare(args):
+    from tests.all.benchmarks import compare, format_comparison
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.tolerance)
+    for line in format_comparison(rows):
+        sys.stdout.write(line + '\n')
+    regressions = [row for row in rows if row.regression]
+    if regressions:
+        sys.stdout.write('\n%s regressions found\n' % len(regressions))
+        return 1
+    return 0
+
+
+def load(args):
+    from tests.all.benchmarks.load import run_load, DEFAULT_MIX
+    concurrency = [int(c) for c in args.concurrency.split(',')]
+    results = run_load(args.server, concurrency=concurrency, mode=args.mode,
+                       duration=args.duration, rate=args.rate,
+                       mix=args.mix or DEFAULT_MIX,
+                       size=args.size, stream=sys.stderr)
+    write(results, args.output)
+    return 0
+
+
+def list_scenarios(args):
+    from tests.all.benchmarks import scenarios
+    for scenario in scenarios(args.filter):
+        sys.stdout.write(scenario.name + '\n')
+    return 0
+
+
+def parser():
+    p = argparse.ArgumentParser(description='Stdnet benchmarks')
+    commands = p.add_subparsers()
+    #
+    r = commands.add_parser('run', help='run benchmark scenarios')
+    r.add_argument('-s', '--server', default='redis://127.0.0.1:6379?db=7',
+                   help='redis connection string')
+    r.add_argument('--size', default='small',
+                   choices=('tiny', 'small', 'normal', 'big', 'huge'),
+                   help='size of the data generated by scenarios')
+    r.add_argument('--repeat', type=int, default=20,
+                   help='number of timed repetitions')
+    r.add_argument('--warmup', type=int, default=2,
+                   help='number of repetitions before timing')
+    r.add_argument('-f', '--filter', help='regular expression on names')
+    r.add_argument('-o', '--output', help='JSON file for results')
+    r.set_defaults(command=run)
+    #
+    c = commands.add_parser('compare', help='compare two benchmark runs')
+    c.add_argument('baseline', help='JSON file of the baseline run')
+    c.add_argument('current', help='JSON file of the run to check')
+    c.add_argument('-t', '--tolerance', type=float, default=0.1,
+                   help='relative change flagged as a regression')
+    c.set_defaults(command=compare)
+    #
+    d = commands.add_parser('load', help='run the concurrent load test')
+    d.add_argument('-s', '--server', default='redis://127.0.0.1:6379?db=7',
+                   help='redis connection string')
+    d.add_argument('-c', '--concurrency', default='1,2,4,8',
+                   help='comma separated numbers of concurrent clients')
+    d.add_argument('--mode', default='thread', choices=('thread', 'process'),
+                   help='run clients as threads or processes')
+    d.add_argument('--duration', type=float, default=10,
+                   help='seconds of load for each concurrency level')
+    d.add_argument('--rate', type=float,
+                   help='total target of operations per second')
+    d.add_argument('--mix', default=None,
+                   help='weighted operations, for example get:3,update:1')
+    d.add_argument('--size', default='small',
+                   choices=('tiny', 'small', 'normal', 'big', 'huge'),
+                   help='size of the finance data')
+    d.add_argument('-o', '--output', help='JSON file for results')
+    d.set_defaults(command=load)
+    #
+    l = commands.add_parser('list', help='list benchmark scenarios')
+    l.add_argument('-f', '--filter', help='regular expression on names')
+    l.set_defaults(command=list_scenarios)
+    return p
+
+
+if __name__ == '__main__':
+    settings.ASYNC_BINDINGS = False
+    args = parser().parse_args()
+    sys.exit(args.command(args))
@@ -1,6 +1,12 @@
+import os
 import sys
-from collections import namedtuple
+import time
+import logging
+import weakref
+from collections import namedtuple, deque
+from functools import partial
 from inspect import isgenerator
+from timeit import default_timer
 
 try:
     from pulsar import maybe_async as async
@@ -13,8 +19,8 @@ except ImportError:     # pragma    noproxy
 from stdnet.utils.exceptions import *
 from stdnet.utils import raise_error_trace
 from stdnet.utils.importer import import_module
-from stdnet.utils import (iteritems, int_or_float, to_string, urlencode,
-                          urlparse)
+from stdnet.utils import (iteritems, itervalues, int_or_float, to_string,
+                          urlencode, urlparse, JSPLITTER)
 
 
 __all__ = ['BackendStructure',
@@ -25,6 +31,8 @@ __all__ = ['BackendStructure',
            'instance_session_result',
            'query_result',
            'range_lookups',
+           'slow_operation',
+           'SlowLog',
            'getdb',
            'settings',
            'async']
@@ -39,6 +47,12 @@ instance_session_result = namedtuple('instance_session_result',
 session_data = namedtuple('session_data',
                           'meta dirty deletes queries structures')
 session_result = namedtuple('session_result', 'meta results')
+# An operation recorded by the SlowLog
+slow_operation = namedtuple('slow_operation', 'timestamp operation model '
+                            'fingerprint size duration site')
+
+LOGGER = logging.getLogger('stdnet.slowlog')
+STDNET_PATH = os.path.dirname(os.path.dirname(__file__))
 
 pass_through = lambda x: x
 str_lower_case = lambda x: to_string(x).lower()
@@ -54,7 +68,9 @@ range_lookups = {
     'endswith': pass_through,
     'icontains': str_lower_case,
     'istartswith': str_lower_case,
-    'iendswith': str_lower_case}
+    'iendswith': str_lower_case,
+    'within': pass_through,
+    'box': pass_through}
 
 
 def get_connection_string(scheme, address, params):
@@ -74,11 +90,155 @@ class Settings(object):
         self.CHARSET = 'utf-8'
         self.REDIS_PY_PARSER = False
         self.ASYNC_BINDINGS = False
+        self.SLOWLOG_THRESHOLD = None
+        self.SLOWLOG_SIZE = 128
 
 
 settings = Settings()
 
 
+def calling_site():
+    '''The first frame, outside the stdnet package, in the current stack as
+a ``filename:lineno in function`` string.'''
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if not code.co_filename.startswith(STDNET_PATH):
+            return '%s:%s in %s' % (code.co_filename, frame.f_lineno,
+                                    code.co_name)
+        frame = frame.f_back
+
+
+def to_bool(value):
+    if hasattr(value, 'lower'):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def related_field(meta, path):
+    '''The field at the end of a, possibly nested, ``load_related`` path.
+The model holding the field is ``field.model``.'''
+    bits = path.split(JSPLITTER)
+    for name in bits[:-1]:
+        meta = meta.dfields[name].relmodel._meta
+    return meta.dfields[bits[-1]]
+
+
+class SlowLog(object):
+    '''A bounded log of :class:`BackendDataServer` operations which took
+longer than :attr:`threshold` seconds to complete.
+
+:parameter threshold: time in seconds above which an operation is recorded.
+:parameter size: maximum number of operations kept in the log. When the log
+    is full the oldest operations are discarded.
+:parameter log: if ``True`` slow operations are also emitted, as warnings,
+    via the ``stdnet.slowlog`` logger.
+
+.. attribute:: records
+
+    A ``deque`` of :class:`slow_operation` namedtuples.
+
+.. attribute:: fingerprints
+
+    Dictionary mapping ``(operation, model, fingerprint)`` tuples to a two
+    elements list containing the number of slow operations and their total
+    duration in seconds.
+'''
+    def __init__(self, threshold=0.1, size=128, log=False):
+        self.threshold = float(threshold)
+        self.log = to_bool(log)
+        self.records = deque(maxlen=int(size))
+        self.fingerprints = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def clear(self):
+        self.records.clear()
+        self.fingerprints.clear()
+
+    def start(self):
+        '''Start timing an operation. Return the clock value to pass to the
+:meth:`record` method.'''
+        return default_timer()
+
+    def record(self, start, operation, model=None, fingerprint=None,
+               size=None):
+        '''Record *operation* if it took longer than :attr:`threshold`.
+
+:parameter start: the value returned by :meth:`start`.
+:parameter operation: the operation type, ``load``, ``count``, ``facets``,
+    ``commit`` or ``structure``.
+:parameter model: optional model metaclass or name.
+:parameter fingerprint: a string, or a callable returning a string, which
+    identifies the shape of the operation. A callable is evaluated only when
+    the operation is recorded.
+:parameter size: optional size of the operation.
+:return: a :class:`slow_operation` or ``None``.
+
+The calling site is looked up in the stack only when the operation is
+recorded.
+'''
+        duration = default_timer() - start
+        if duration < self.threshold:
+            return
+        site = calling_site()
+        if hasattr(fingerprint, '__call__'):
+            fingerprint = fingerprint()
+        if model is not None:
+            model = str(model)
+        record = slow_operation(time.time(), operation, model, fingerprint,
+                                size, duration, site)
+        self.records.append(record)
+        key = (operation, model, fingerprint)
+        aggregate = self.fingerprints.get(key)
+        if aggregate is None:
+            aggregate = [0, 0.0]
+            self.fingerprints[key] = aggregate
+        aggregate[0] += 1
+        aggregate[1] += duration
+        if self.log:
+            LOGGER.warning('%s %s on %s took %.4f seconds (size %s) at %s',
+                           operation, fingerprint, model, duration, size,
+                           site)
+        return record
+
+    def most_common(self, n=None):
+        '''Return a list of ``(operation, model, fingerprint, count, total)``
+tuples, ordered by total duration, from the :attr:`fingerprints`
+aggregates.'''
+        data = sorted((key + tuple(value) for key, value in
+                       iteritems(self.fingerprints)),
+                      key=lambda v: v[-1], reverse=True)
+        return data[:n] if n else data
+
+
+class TimedStructure(object):
+    '''A proxy for a :class:`BackendStructure` which records slow structure
+operations in the :attr:`BackendDataServer.slowlog`.'''
+    def __init__(self, structure):
+        self.structure = structure
+
+    def __getattr__(self, name):
+        attr = getattr(self.structure, name)
+        if hasattr(attr, '__call__'):
+            return partial(self._call, name, attr)
+        return attr
+
+    def _call(self, name, method, *args, **kwargs):
+        structure = self.structure
+        backend = structure.backend
+        start = backend.timer()
+        result = method(*args, **kwargs)
+        meta = structure.instance._meta
+        callback = backend.timing_callback(start, 'structure', meta.name,
+                                           '%s.%s' % (meta.name, name))
+        return backend.execute(result, callback)
+
+
 class BackendStructure(object):
 
     '''Interface for :class:`stdnet.odm.Structure` backends.
@@ -160,6 +320,14 @@ class BackendDataServer(object):
         The default model Manager for this backend. If not
         provided, the :class:`stdnet.odm.Manager` is used.
         Default ``None``.
+
+    .. attribute:: slowlog
+
+        The :class:`SlowLog` for this backend or ``None``. It is enabled by
+        passing the ``slowlog`` threshold (in seconds) in the connection
+        string, for example ``redis://127.0.0.1:6379?slowlog=0.05``.
+        ``slowlog_size`` and ``slowlog_log`` control the size of the log and
+        the logging of slow operations. Default ``None``.
     '''
     Query = None
     structure_module = None
@@ -183,6 +351,12 @@ class BackendDataServer(object):
             else:
                 address[1] = int(address[1])
         self.charset = charset or 'utf-8'
+        threshold = params.pop('slowlog', settings.SLOWLOG_THRESHOLD)
+        size = params.pop('slowlog_size', settings.SLOWLOG_SIZE)
+        log = params.pop('slowlog_log', False)
+        self.slowlog = None
+        if threshold not in (None, ''):
+            self.slowlog = SlowLog(threshold, size, log)
         self.params = params
         self.namespace = namespace
         self.client = self.setup_connection(address)
@@ -227,27 +401,49 @@ class BackendDataServer(object):
         return self.connection_string
     __str__ = __repr__
 
-    def make_objects(self, meta, data, related_fields=None):
+    def make_objects(self, meta, data, related_fields=None, compact=False,
+                     prefetch=None):
         '''Generator of :class:`stdnet.odm.StdModel` instances with data
 from database.
 
 :parameter meta: instance of model :class:`stdnet.odm.Metaclass`.
 :parameter data: iterator over instances data.
+:parameter compact: if ``True`` instances of the
+    :meth:`stdnet.odm.ModelMeta.compact_model` are created.
+:parameter prefetch: optional list of two elements tuples containing a
+    related manager and a dictionary mapping primary keys to lists of
+    instances loaded by the manager.
 '''
-        make_object = meta.make_object
+        if compact:
+            make_object = meta.make_compact_object
+        else:
+            make_object = meta.make_object
         related_data = []
         if related_fields:
-            for fname, fdata in iteritems(related_fields):
-                field = meta.dfields[fname]
-                if field in meta.multifields:
+            loaded = {}
+            # parent levels are loaded before nested levels
+            for path in sorted(related_fields,
+                               key=lambda p: p.count(JSPLITTER)):
+                fdata = related_fields[path]
+                field = related_field(meta, path)
+                if field in field.model._meta.multifields:
                     related = dict(fdata)
                     multi = True
                 else:
                     multi = False
                     relmodel = field.relmodel
                     related = dict(((obj.id, obj) for obj in
-                                    self.make_objects(relmodel._meta, fdata)))
-                related_data.append((field, related, multi))
+                                    self.make_objects(relmodel._meta, fdata,
+                                                      compact=compact)))
+                    loaded[path] = related
+                if JSPLITTER in path:
+                    parent = path[:path.rfind(JSPLITTER)]
+                    for obj in itervalues(loaded.get(parent, {})):
+                        rid = getattr(obj, field.attname, None)
+                        if rid is not None:
+                            setattr(obj, field.name, related.get(rid))
+                else:
+                    related_data.append((field, related, multi))
         for state in data:
             instance = make_object(state, self)
             for field, rdata, multi in related_data:
@@ -258,10 +454,23 @@ from database.
                     if rid is not None:
                         value = rdata.get(rid)
                         setattr(instance, field.name, value)
+            if prefetch:
+                id = instance.pkvalue()
+                for manager, rdata in prefetch:
+                    setattr(instance, manager.get_cache_name(),
+                            rdata.get(id, []))
             yield instance
 
-    def objects_from_db(self, meta, data, related_fields=None):
-        return list(self.make_objects(meta, data, related_fields))
+    def objects_from_db(self, meta, data, related_fields=None,
+                        compact=False, prefetch=None):
+        return list(self.make_objects(meta, data, related_fields, compact,
+                                      prefetch))
+
+    def values_from_db(self, meta, data, fields):
+        '''List of tuples with the python values of *fields* from database
+*data*. No :class:`stdnet.odm.StdModel` instance is created.'''
+        load_values = meta.load_values
+        return [load_values(state, fields, self) for state in data]
 
     def structure(self, instance, client=None):
         '''Create a backend :class:`stdnet.odm.Structure` handler.
@@ -273,8 +482,10 @@ from database.
         if struct is None:
             raise ModelNotAvailable('"%s" is not available for backend '
                                     '"%s"' % (instance._meta.name, self))
-        client = client if client is not None else self.client
-        return struct(instance, self, client)
+        if client is not None:
+            return struct(instance, self, client)
+        struct = struct(instance, self, self.client)
+        return TimedStructure(struct) if self.slowlog is not None else struct
 
     def execute(self, result, callback=None):
         if self.is_async():
@@ -288,6 +499,30 @@ from database.
                 result = execute_generator(result)
             return callback(result) if callback else result
 
+    def timer(self):
+        '''Start timing an operation for the :attr:`slowlog`. Return ``None``
+if the :attr:`slowlog` is not enabled.'''
+        if self.slowlog is not None:
+            return self.slowlog.start()
+
+    def timing_callback(self, start, operation, model=None, fingerprint=None,
+                        callback=None):
+        '''Wrap *callback* so that *operation* is recorded in the
+:attr:`slowlog` once the result is available.
+
+:parameter start: the value returned by :meth:`timer`. If ``None``,
+    *callback* is returned unchanged.
+'''
+        if start is None:
+            return callback
+        return partial(self._timed, start, operation, model, fingerprint,
+                       callback)
+
+    def _timed(self, start, operation, model, fingerprint, callback, result):
+        size = len(result) if hasattr(result, '__len__') else None
+        self.slowlog.record(start, operation, model, fingerprint, size)
+        return callback(result) if callback else result
+
     # VIRTUAL METHODS
     def is_async(self):
         '''Check if the backend handler is asynchronous.'''
@@ -331,6 +566,21 @@ must return a instance of the backend handler.'''
         '''Return a list of database keys used by model *model*'''
         raise NotImplementedError()
 
+    def memory_report(self, meta, sample=100):
+        '''Return a dictionary with the memory and key footprint of the
+model with :class:`stdnet.odm.ModelMeta` ``meta``.
+
+:parameter sample: maximum number of keys sampled for each category of keys.
+'''
+        raise NotImplementedError()
+
+    def rebuild_facets(self, meta):
+        '''Rebuild the registries of index values used by
+:meth:`stdnet.odm.Query.facets` for the model with
+:class:`stdnet.odm.ModelMeta` ``meta``. Return the number of registered
+values.'''
+        raise NotImplementedError()
+
     def flush(self, meta=None):
         '''Flush the database or drop all instances of a model/collection'''
         raise NotImplementedError()
@@ -405,7 +655,11 @@ class BackendQuery(object):
 
     def execute_query(self):
         if not self.executed:
-            return self.backend.execute(self._execute_query(), self._got_count)
+            backend = self.backend
+            callback = backend.timing_callback(
+                backend.timer(), 'count', self.meta,
+                self.queryelem.fingerprint, self._got_count)
+            return backend.execute(self._execute_query(), callback)
         return self.__count
 
     def __getitem__(self, slic):
@@ -414,7 +668,39 @@ class BackendQuery(object):
         return self.backend.execute(self.items(), lambda r: r[slic])
 
     def items(self, slic=None, callback=None):
-        return self.backend.execute(self._slice_items(slic), callback)
+        backend = self.backend
+        callback = backend.timing_callback(backend.timer(), 'load', self.meta,
+                                           self.queryelem.fingerprint,
+                                           callback)
+        return backend.execute(self._slice_items(slic), callback)
+
+    def values(self, fields, callback=None):
+        '''Retrieve a list of tuples with the values of *fields* for all
+items in the query, without creating model instances or adding them to the
+session.
+
+:parameter fields: list of :class:`stdnet.odm.Field`.
+'''
+        backend = self.backend
+        callback = backend.timing_callback(backend.timer(), 'load', self.meta,
+                                           self.queryelem.fingerprint,
+                                           callback)
+        return backend.execute(self._load_values(fields), callback)
+
+    def facets(self, fields, limit=None, callback=None):
+        '''Count the elements in the query for each value of *fields*.
+The result is a list, one element for each field, of flat lists of
+value, count pairs sorted by decreasing count.
+
+:parameter fields: list of :class:`stdnet.odm.Field` with a non unique index.
+:parameter limit: optional maximum number of values for each field.
+'''
+        backend = self.backend
+        callback = backend.timing_callback(backend.timer(), 'facets',
+                                           self.meta,
+                                           self.queryelem.fingerprint,
+                                           callback)
+        return backend.execute(self._facets(fields, limit), callback)
 
     def delete(self, qs):
         with self.session.begin() as t:
@@ -427,12 +713,15 @@ class BackendQuery(object):
     def _has(self, val):    # pragma: no cover
         raise NotImplementedError
 
-    def _items(self, slic):     # pragma: no cover
+    def _items(self, slic, values=None):     # pragma: no cover
         raise NotImplementedError
 
     def _build(self, **kwargs):     # pragma: no cover
         raise NotImplementedError
 
+    def _facets(self, fields, limit):     # pragma: no cover
+        raise NotImplementedError
+
     def _execute_query(self):       # pragma: no cover
         '''Execute the query without fetching data from server.
 
@@ -446,6 +735,13 @@ class BackendQuery(object):
         self.__count = c
         return c
 
+    def _load_values(self, fields):
+        result = yield self.execute_query()
+        values = []
+        if result:
+            values = yield self._items(None, values=fields)
+        yield values
+
     def _slice_items(self, slic):
         key = None
         seq = self.__slice_cache.get(None)
@@ -462,15 +758,63 @@ class BackendQuery(object):
             if result:
                 items = yield self._items(slic)
             session = self.session
-            seq = []
-            model = self.model
-            for el in items:
-                if isinstance(el, model):
-                    session.add(el, modified=False)
-                seq.append(el)
+            readonly = self.queryelem.data.get('readonly')
+            if readonly is None:
+                readonly = session.readonly
+            identity_map = session.identity_map
+            if readonly:
+                # instances are not tracked by the session
+                session = session.readonly_session
+                identity_map = None
+            data = self.queryelem.data
+            batch = data.get('batch_related') is not False
+            seq = self._attach(self.meta, items, session, readonly,
+                               identity_map, batch)
+            prefetch = data.get('prefetch_related')
+            if prefetch and seq:
+                # instances loaded by related managers
+                related = self.meta.related
+                for name in prefetch:
+                    manager = related[name]
+                    cache_name = manager.get_cache_name()
+                    ritems = {}
+                    for el in seq:
+                        for r in getattr(el, cache_name, ()):
+                            ritems[id(r)] = r
+                    self._attach(manager.prefetch_model._meta,
+                                 ritems.values(), session, readonly,
+                                 identity_map, batch)
             self.__slice_cache[key] = seq
             yield seq
 
+    def _attach(self, meta, items, session, readonly, identity_map, batch):
+        # Attach loaded instances to the session and group siblings
+        seq = []
+        model = meta.model
+        compact_model = meta._compact_model
+        siblings = None
+        if batch and any((f.type == 'related object'
+                          for f in meta.scalarfields)):
+            siblings = []
+        for el in items:
+            if isinstance(el, model):
+                if readonly or el.__class__ is compact_model:
+                    # state is allocated only if the instance changes
+                    el.session = session
+                else:
+                    session.add(el, modified=False)
+                if identity_map is not None and el._loadedfields is None:
+                    identity_map.add(el)
+                if siblings is not None and el.__class__ is not compact_model:
+                    siblings.append(el)
+            seq.append(el)
+        if siblings and len(siblings) > 1:
+            # foreign keys are loaded for all siblings on first access
+            group = [weakref.ref(el) for el in siblings]
+            for el in siblings:
+                el.dbdata['siblings'] = group
+        return seq
+
 
 def parse_backend(backend):
     """Converts the "backend" into the database connection parameters.
@@ -1,15 +1,16 @@
 '''Redis backend implementation'''
 import json
+from random import Random
 from functools import partial
 
 from .client import *
 
 import stdnet
 from stdnet import FieldValueError, CommitException, QuerySetError
-from stdnet.utils import (gen_unique_id, zip, ispy3k,
+from stdnet.utils import (gen_unique_id, zip, ispy3k, itervalues, JSPLITTER,
                           native_str, flat_mapping, unique_tuple)
 from stdnet.backends import (BackendStructure, session_result,
-                             instance_session_result)
+                             instance_session_result, to_bool, related_field)
 
 MIN_FLOAT = -1.e99
 
@@ -18,6 +19,8 @@ MIN_FLOAT = -1.e99
 OBJ = 'obj'     # the hash table for a instance
 TMP = 'tmp'     # temorary key
 ODM_SCRIPTS = ('odmrun', 'move2set', 'zdiffstore')
+# encodings of hashes, sets, sorted sets and lists which are not compact
+NON_COMPACT_ENCODINGS = ('hashtable', 'skiplist', 'linkedlist')
 ############################################################################
 
 if ispy3k:
@@ -39,6 +42,39 @@ def pairs_to_dict(response, encoding):
     return dict(((k.decode(encoding), v) for k, v in zip(it, it)))
 
 
+def key_category(key):
+    '''The category of a model ``key`` with the model base key removed, used
+by :meth:`RedisBackend.memory_report`.'''
+    bits = key.split(':')
+    prefix = bits[0]
+    if prefix == OBJ:
+        return 'structure:%s' % bits[-1] if len(bits) > 2 else 'objects'
+    elif prefix == 'struct' and len(bits) > 1:
+        return 'structure:%s' % bits[1]
+    elif prefix == 'id' and len(bits) == 1:
+        return 'ids'
+    elif prefix == 'ids' and len(bits) == 1:
+        return 'autoid'
+    elif prefix == 'idx' and len(bits) > 1:
+        return 'index:%s' % bits[1]
+    elif prefix == 'bmp' and len(bits) > 1:
+        return 'bitmap:%s' % bits[1]
+    elif prefix == 'cdx' and len(bits) > 1:
+        return 'composite:%s' % bits[1]
+    elif prefix == 'tri' and len(bits) > 1:
+        return 'trigram:%s' % bits[1]
+    elif prefix == 'val' and len(bits) > 1:
+        return 'values:%s' % bits[1]
+    elif prefix == 'geo' and len(bits) > 1:
+        return 'geo:%s' % bits[1]
+    elif prefix == 'uni' and len(bits) > 1:
+        return 'unique:%s' % bits[1]
+    elif prefix == TMP:
+        return 'temp'
+    else:
+        return 'other'
+
+
 class odmrun(RedisScript):
     script = (read_lua_file('tabletools'),
               # timeseries must be included before utils
@@ -74,12 +110,17 @@ class odmrun(RedisScript):
                 yield CommitException(msg)
 
     def load_query(self, response, backend, meta, get=None, fields=None,
-                   fields_attributes=None, redis_client=None, **options):
+                   fields_attributes=None, values=None, compact=False,
+                   redis_client=None, **options):
         if get:
             tpy = meta.dfields.get(get).to_python
             return [tpy(v, backend) for v in response]
+        elif values:
+            data = self.build(response[0], meta, fields, fields_attributes,
+                              redis_client.encoding)
+            return backend.values_from_db(meta, data, values)
         else:
-            data, related = response
+            data, related, prefetch = response
             encoding = redis_client.encoding
             data = self.build(data, meta, fields, fields_attributes, encoding)
             related_fields = {}
@@ -89,7 +130,12 @@ class odmrun(RedisScript):
                     fields = tuple(native_str(f, encoding) for f in fields)
                     related_fields[fname] =\
                         self.load_related(meta, fname, rdata, fields, encoding)
-            return backend.objects_from_db(meta, data, related_fields)
+            if prefetch:
+                prefetch = [self.load_prefetch(backend, meta, name, links,
+                                               rdata, compact, encoding)
+                            for name, links, rdata in prefetch]
+            return backend.objects_from_db(meta, data, related_fields,
+                                           compact, prefetch)
 
     def build(self, response, meta, fields, fields_attributes, encoding):
         fields = tuple(fields) if fields else None
@@ -106,8 +152,8 @@ class odmrun(RedisScript):
 
     def load_related(self, meta, fname, data, fields, encoding):
         '''Parse data for related objects.'''
-        field = meta.dfields[fname]
-        if field in meta.multifields:
+        field = related_field(meta, fname)
+        if field in field.model._meta.multifields:
             fmeta = field.structure_class()._meta
             if fmeta.name in ('hashtable', 'zset'):
                 return ((native_str(id, encoding),
@@ -117,8 +163,30 @@ class odmrun(RedisScript):
                 return ((native_str(id, encoding), fdata) for
                         id, fdata in data)
         else:
-            # this is data for stdmodel instances
-            return self.build(data, meta, fields, fields, encoding)
+            # this is data for stdmodel instances, fields are attribute names
+            rfields = field.relmodel._meta.dfields
+            names = dict(((f.attname, f.name) for f in itervalues(rfields)))
+            names = tuple((names.get(f, f) for f in fields))
+            return self.build(data, meta, names, fields, encoding)
+
+    def load_prefetch(self, backend, meta, name, links, data, compact,
+                      encoding):
+        '''Parse data for instances loaded by a related manager. Return a
+two elements tuple containing the manager and a dictionary mapping primary
+keys of ``meta`` instances to lists of related instances.'''
+        manager = meta.related[native_str(name, encoding)]
+        rmeta = manager.prefetch_model._meta
+        data = self.build(data, rmeta, None, None, encoding)
+        rpk = rmeta.pk
+        items = dict(((rpk.to_python(obj.pkvalue(), backend), obj) for obj in
+                      backend.objects_from_db(rmeta, data, compact=compact)))
+        pk = meta.pk
+        related = {}
+        for id, rids in links:
+            rel = (items.get(rpk.to_python(rid, backend)) for rid in rids)
+            related[pk.to_python(id, backend)] = [r for r in rel
+                                                  if r is not None]
+        return manager, related
 
 
 class check_structures(RedisScript):
@@ -154,7 +222,11 @@ class RedisQuery(stdnet.BackendQuery):
         backend = self.backend
         key, meta, keys, args = None, self.meta, [], []
         pkname = meta.pkname()
-        for child in qs:
+        bitmap_args = []
+        plan = self.bitmap_plan(qs, bitmap_args)
+        # the query key is a bitmap of ids for models without ordering
+        self.bitmap = bool(plan) and not meta.ordering
+        for child in () if plan else qs:
             if getattr(child, 'backend', None) == backend:
                 lookup, value = 'set', child
             else:
@@ -168,7 +240,12 @@ class RedisQuery(stdnet.BackendQuery):
                     value = self.dump_nested(*value)
                 args.extend((lookup, '' if value is None else value))
         temp_key = True
-        if qs.keyword == 'set':
+        if plan:
+            # the whole query is resolved with bitmap indices
+            key = backend.tempkey(meta)
+            backend.odmrun(pipe, 'bitmap', meta, (key,), self.meta_info,
+                           json.dumps(plan), *bitmap_args)
+        elif qs.keyword == 'set':
             if qs.name == pkname and not args:
                 key = backend.basekey(meta, 'id')
                 temp_key = False
@@ -202,6 +279,25 @@ class RedisQuery(stdnet.BackendQuery):
             # key if it is temporary key)
             keys.insert(0, key)
             backend.where_run(pipe, self.meta_info, keys, *where)
+        after = qs.data.get('after')
+        if after:
+            # keep the ids which come after the cursor, so that counting,
+            # deleting and subqueries see the same elements as loading
+            order = self.order(qs.ordering or meta.ordering)
+            if (qs.data.get('then_by') or qs.data.get('distance') or
+                    not self.is_sort_index(order)):
+                raise QuerySetError('Cannot select elements after a cursor '
+                                    'when not ordering by "%s"' %
+                                    meta.ordering.name)
+            bkey = key
+            if not temp_key:
+                temp_key = True
+                key = backend.tempkey(meta)
+            score, pk = after
+            # a string so that lua does not round the score
+            score = repr(MIN_FLOAT if score is None else float(score))
+            backend.odmrun(pipe, 'after', meta, (key, bkey), self.meta_info,
+                           1 if order['desc'] else 0, score, pk)
         #
         # If we are getting a field (for a subsequent query maybe)
         # unwind the query and store the result
@@ -219,12 +315,54 @@ class RedisQuery(stdnet.BackendQuery):
             pipe.expire(key, self.expire)
         self.query_key = key
 
+    def bitmap_plan(self, qs, args):
+        '''Compile ``qs`` into a plan for the ``bitmap`` lua command when all
+its lookups are values of fields with bitmap indices. Lookup values are
+appended to ``args``. Return ``None`` if ``qs`` cannot be compiled.'''
+        meta = self.meta
+        if (not meta.bitmap_indices or qs._meta is not meta or
+                qs.data.get('where') or qs._get_field):
+            return
+        if qs.keyword == 'set':
+            if qs.name not in meta.bitmap_indices or not len(qs):
+                return
+            values = []
+            for lookup, value in qs:
+                if lookup != 'value':
+                    return
+                values.append(value)
+            plan = ['field', qs.name, len(args) + 1, len(values)]
+            args.extend(values)
+            return plan
+        elif qs.keyword in ('intersect', 'union', 'diff'):
+            plan = [qs.keyword]
+            for child in qs:
+                child_plan = self.bitmap_plan(child, args)
+                if not child_plan:
+                    return
+                plan.append(child_plan)
+            return plan
+
+    def _facets(self, fields, limit):
+        # The facets are computed in the pipeline which builds the query,
+        # so that a query not yet executed needs one roundtrip only.
+        pipe = self.pipe
+        attnames = [field.attname for field in fields]
+        self.backend.odmrun(pipe, 'facets', self.meta, (self.query_key,),
+                            self.meta_info, limit or 0, *attnames)
+        result = yield pipe.execute()
+        yield result[-1]
+
     def _execute_query(self):
         '''Execute the query without fetching data. Returns the number of
 elements in the query.'''
         pipe = self.pipe
         if not self.card:
-            if self.meta.ordering:
+            if self.bitmap:
+                self.ismember = getattr(self.backend.client, 'getbit')
+                self.card = getattr(pipe, 'bitcount')
+                self._check_member = self.sism
+            elif self.meta.ordering:
                 self.ismember = getattr(self.backend.client, 'zrank')
                 self.card = getattr(pipe, 'zcard')
                 self._check_member = self.zism
@@ -257,6 +395,17 @@ elements in the query.'''
                 'desc': desc,
                 'nested': nested_args}
 
+    def is_sort_index(self, order):
+        '''``True`` if the scores of the model id set are the values of the
+``order`` field, so that it can be used as a sort index.'''
+        ordering = self.meta.ordering
+        if not ordering or ordering.auto or order['nested']:
+            return False
+        field = ordering.field
+        return (field.internal_type == 'numeric' and
+                not getattr(field, 'relmodel', None) and
+                order['field'] == ordering.name)
+
     def dump_nested(self, value, nested):
         nested_args = []
         if nested:
@@ -267,6 +416,13 @@ elements in the query.'''
         return json.dumps((value, nested_args))
 
     def _has(self, val):
+        if self.bitmap:
+            try:
+                val = int(val)
+            except (TypeError, ValueError):
+                return False
+            if val < 0:
+                return False
         r = self.ismember(self.query_key, val)
         return self._check_member(r)
 
@@ -279,7 +435,7 @@ elements in the query.'''
             stop = None
         return start, stop
 
-    def _items(self, slic):
+    def _items(self, slic, values=None):
         # Unwind the database query by creating a list of arguments for
         # the load_query lua script
         backend = self.backend
@@ -287,16 +443,45 @@ elements in the query.'''
         name = ''
         order = ()
         start, stop = self.get_redis_slice(slic)
-        if self.queryelem.ordering:
+        # the cursor of Query.page, selected while loading
+        cursor = self.queryelem.data.get('cursor')
+        then_by = self.queryelem.data.get('then_by')
+        distance = self.queryelem.data.get('distance')
+        if distance:
+            field, lat, lon = distance
+            order = {'field': field, 'lat': lat, 'lon': lon}
+        elif self.queryelem.ordering:
             order = self.order(self.queryelem.ordering)
+        elif cursor:
+            order = self.order(meta.ordering)
         elif meta.ordering:
             name = 'DESC' if meta.ordering.desc else 'ASC'
         elif start or stop is not None:
             order = self.order(meta.get_sorting(meta.pkname()))
         # Wen using the sort algorithm redis requires the number of element
         # not the stop index
-        if order:
-            name = 'explicit'
+        if cursor:
+            if then_by or distance or not self.is_sort_index(order):
+                raise QuerySetError('Cannot load elements after a cursor '
+                                    'when not ordering by "%s"' %
+                                    meta.ordering.name)
+            if start < 0 or (stop is not None and stop < 0):
+                raise QuerySetError('Negative indices are not supported '
+                                    'after a cursor')
+            name = 'after'
+            score, pk = cursor
+            # a string so that lua does not round the score
+            score = repr(MIN_FLOAT if score is None else float(score))
+            order['after'] = (score, pk)
+            stop = -1 if stop is None else stop - start
+        elif order:
+            if distance:
+                name = 'distance'
+            elif then_by:
+                name = 'multi'
+                order = [order] + [self.order(o) for o in then_by]
+            else:
+                name = 'index' if self.is_sort_index(order) else 'explicit'
             N = self.execute_query()
             if stop is None:
                 stop = N
@@ -307,7 +492,10 @@ elements in the query.'''
             stop -= start
         elif stop is None:
             stop = -1
-        get = self.queryelem._get_field
+        else:
+            # the stop index of zrange is inclusive
+            stop -= 1
+        get = None if values else self.queryelem._get_field
         fields_attributes = None
         pkname_tuple = (meta.pk.name,)
         # if the get_field is available, we only load that field
@@ -321,9 +509,10 @@ elements in the query.'''
                 fields, fields_attributes = meta.backend_fields((get,))
         else:
             fields = self.queryelem.fields or None
-            if fields:
-                fields = unique_tuple(fields,
-                                      self.queryelem.select_related or ())
+            if fields and not values:
+                related = self.queryelem.select_related or ()
+                fields = unique_tuple(fields, (r.split(JSPLITTER)[0]
+                                               for r in related))
             if fields == pkname_tuple:
                 fields_attributes = fields
             elif fields:
@@ -335,32 +524,81 @@ elements in the query.'''
                    'start': start,
                    'stop': stop,
                    'fields': fields_attributes,
-                   'related': dict(self.related_lua_args()),
+                   'related': {} if values else dict(self.related_lua_args()),
+                   'prefetch': {} if values else
+                   dict(self.prefetch_lua_args()),
                    'get': get}
         joptions = json.dumps(options)
+        compact = self.queryelem.data.get('compact')
+        if compact is None:
+            compact = meta.compact
         options.update({'fields': fields,
-                        'fields_attributes': fields_attributes})
+                        'fields_attributes': fields_attributes,
+                        'values': values,
+                        'compact': compact})
         return backend.odmrun(backend.client, 'load', meta, (self.query_key,),
                               self.meta_info, joptions, **options)
 
     def related_lua_args(self):
-        '''Generator of load_related arguments'''
+        '''Generator of load_related arguments. Nested relationships have
+the ``parent`` path, their ``depth`` and the base key ``pbk`` of the model
+holding the foreign key.'''
         related = self.queryelem.select_related
         if related:
+            backend = self.backend
             meta = self.meta
             for rel in related:
-                field = meta.dfields[rel]
+                field = related_field(meta, rel)
+                fmeta = field.model._meta
                 relmodel = field.relmodel
-                bk = self.backend.basekey(relmodel._meta) if relmodel else ''
+                bk = backend.basekey(relmodel._meta) if relmodel else ''
                 fields = list(related[rel])
                 if meta.pkname() in fields:
                     fields.remove(meta.pkname())
                     if not fields:
                         fields.append('')
-                ftype = field.type if field in meta.multifields else ''
+                if fields and relmodel:
+                    # foreign keys of nested levels are needed to link them
+                    prefix = rel + JSPLITTER
+                    nested = [r[len(prefix):] for r in related if
+                              r.startswith(prefix) and
+                              JSPLITTER not in r[len(prefix):]]
+                    if nested:
+                        fields = [f for f in fields if f] + nested
+                    fields = relmodel._meta.backend_fields(fields)[1] or ['']
+                bits = rel.split(JSPLITTER)
+                depth = len(bits) - 1
+                ftype = field.type if field in fmeta.multifields else ''
                 data = {'field': field.attname, 'type': ftype,
-                        'bk': bk, 'fields': fields}
-                yield field.name, data
+                        'bk': bk, 'fields': fields, 'depth': depth,
+                        'parent': JSPLITTER.join(bits[:-1]),
+                        'pbk': backend.basekey(fmeta) if depth else ''}
+                yield rel, data
+
+    def prefetch_lua_args(self):
+        '''Generator of prefetch_related arguments'''
+        related = self.queryelem.data.get('prefetch_related')
+        if related:
+            backend = self.backend
+            session = self.session
+            for name in related:
+                manager = self.meta.related[name]
+                rmeta = manager.prefetch_model._meta
+                for model in (manager.model, rmeta.model):
+                    rbackend = session.model(model).read_backend
+                    if rbackend.connection_string !=\
+                            backend.connection_string:
+                        raise QuerySetError('Cannot prefetch "%s". Models '
+                                            'must be in the same backend.'
+                                            % name)
+                through = ''
+                if rmeta is not manager.model._meta:
+                    through = manager.model._meta.dfields[
+                        manager.name_formodel].attname
+                yield name, {'index': backend.basekey(manager.model._meta),
+                             'field': manager.field.attname,
+                             'through': through,
+                             'bk': backend.basekey(rmeta)}
 
 
 ############################################################################
@@ -739,7 +977,10 @@ class BackendDataServer(stdnet.BackendDataServer):
             address = address[0]
         if 'db' not in self.params:
             self.params['db'] = 0
+        accounting = to_bool(self.params.pop('accounting', False))
         rpy = redis_client(address=address, **self.params)
+        if accounting:
+            rpy.accounting = ScriptAccounting()
         if self.namespace:
             self.params['namespace'] = self.namespace
         return rpy
@@ -747,6 +988,14 @@ class BackendDataServer(stdnet.BackendDataServer):
     def auto_id_to_python(self, value):
         return int(value)
 
+    @property
+    def accounting(self):
+        '''The :class:`ScriptAccounting` collecting ``redis.call`` statistics
+for lua scripts. Available when the ``accounting`` parameter is passed in the
+connection string, for example ``redis://127.0.0.1:6379?accounting=1``,
+otherwise ``None``.'''
+        return self.client.accounting
+
     def is_async(self):
         return self.client.is_async
 
@@ -779,6 +1028,7 @@ class BackendDataServer(stdnet.BackendDataServer):
 
     def execute_session(self, session_data):
         '''Execute a session in redis.'''
+        start = self.timer()
         pipe = self.client.pipeline()
         for sm in session_data:  # loop through model sessions
             meta = sm.meta
@@ -805,17 +1055,32 @@ class BackendDataServer(stdnet.BackendDataServer):
                             v = getattr(instance, meta.ordering.name, None)
                             if v is not None:
                                 score = meta.ordering.field.scorefun(v)
-                    data = instance._dbdata['cleaned_data']
                     action = state.action
                     prev_id = state.iid if state.persistent else ''
                     id = instance.pkvalue() or ''
-                    data = flat_mapping(data)
+                    changes = None
+                    if prev_id and prev_id == id:
+                        changes = meta.changes(instance)
+                    if changes is None:
+                        data = flat_mapping(instance._dbdata['cleaned_data'])
+                    else:
+                        # commit only changed fields
+                        action = 'change'
+                        changed, removed = changes
+                        data = [len(removed)]
+                        data.extend(removed)
+                        data.extend(flat_mapping(changed))
                     lua_data.extend((action, prev_id, id, score, len(data)))
                     lua_data.extend(data)
                     processed.append(state.iid)
                 self.odmrun(pipe, 'commit', meta, (), meta_info,
                             *lua_data, iids=processed)
-        return pipe.execute()
+        if start is None:
+            return pipe.execute()
+        models = ','.join((str(sm.meta) for sm in session_data))
+        fingerprint = partial(self._session_fingerprint, session_data)
+        return self.execute(pipe.execute(), self.timing_callback(
+            start, 'commit', models, fingerprint))
 
     def accumulate_delete(self, pipe, backend_query):
         # Accumulate models queries for a delete. It loops through the
@@ -863,6 +1128,32 @@ class BackendDataServer(stdnet.BackendDataServer):
         pattern = '%s*' % self.basekey(meta)
         return self.execute(self.client.keys(pattern), self._decode_keys)
 
+    def memory_report(self, meta, sample=100, count=1000):
+        '''Memory and key footprint of the model with ``meta``.
+
+Model keys are collected with ``SCAN`` and grouped by :func:`key_category`.
+For each category, at most ``sample`` keys are picked at random and their
+type, ``OBJECT ENCODING`` and ``MEMORY USAGE`` are retrieved. The bytes of a
+category are extrapolated from the mean of its sample. ``MEMORY USAGE``
+requires redis 4.0 or above, with older servers bytes are ``None``.
+
+:parameter sample: maximum number of sampled keys in each category.
+:parameter count: ``COUNT`` hint for ``SCAN``.
+:return: a dictionary with the number of ``keys`` and ``instances``, the
+    extrapolated ``bytes``, ``bytes_per_instance``, the ``index_overhead``
+    ratio of id set, index and unique keys to object hashes, ``categories``
+    and the sampled keys which are ``non_compact``.
+'''
+        return self.execute(self._memory_report(meta, sample, count))
+
+    def rebuild_facets(self, meta):
+        '''Rebuild the registries of index values used by
+:meth:`stdnet.odm.Query.facets` from the existing index keys of the model
+with ``meta``. Required for data indexed before the registries were
+introduced. Return the number of registered values.'''
+        return self.odmrun(self.client, 'rebuild_values', meta, (),
+                           json.dumps(self.meta(meta)))
+
     def instance_keys(self, obj):
         meta = obj._meta
         keys = [self.basekey(meta, OBJ, obj.pkvalue())]
@@ -882,6 +1173,97 @@ class BackendDataServer(stdnet.BackendDataServer):
                 be.delete()
             instance.cache.clear()
 
+    def _session_fingerprint(self, session_data):
+        bits = []
+        for sm in session_data:
+            actions = [name for name in ('dirty', 'deletes', 'structures')
+                       if getattr(sm, name)]
+            bits.append('%s(%s)' % (sm.meta, ', '.join(actions)))
+        return ' '.join(bits)
+
+    def _memory_report(self, meta, sample, count):
+        client = self.client
+        basekey = self.basekey(meta)
+        start = len(basekey) + 1
+        random = Random()
+        seen = {}
+        samples = {}
+        cursor = 0
+        while True:
+            cursor, keys = yield client.scan(cursor, match='%s:*' % basekey,
+                                             count=count)
+            for key in self._decode_keys(keys):
+                category = key_category(key[start:])
+                n = seen.get(category, 0) + 1
+                seen[category] = n
+                reservoir = samples.setdefault(category, [])
+                if len(reservoir) < sample:
+                    reservoir.append(key)
+                else:
+                    i = random.randint(0, n - 1)
+                    if i < sample:
+                        reservoir[i] = key
+            if not int(cursor):
+                break
+        info = yield client.info()
+        version = info.get('Server', info).get('redis_version', '0')
+        memory = tuple(map(int, version.split('.')[:2])) >= (4, 0)
+        sampled = [(c, k) for c, keys in samples.items() for k in keys]
+        results = []
+        if sampled:
+            pipe = client.pipeline(transaction=False)
+            for _, key in sampled:
+                pipe.type(key)
+                pipe.object('encoding', key)
+                if memory:
+                    pipe.execute_command('MEMORY', 'USAGE', key)
+            results = yield pipe.execute()
+        step = 3 if memory else 2
+        categories = {}
+        non_compact = []
+        for n, (category, key) in enumerate(sampled):
+            r = results[n*step:(n+1)*step]
+            ktype, encoding = self._decode_keys(r[:2])
+            data = categories.get(category)
+            if data is None:
+                data = {'keys': seen[category], 'sampled': 0, 'bytes': None,
+                        'bytes_per_key': None, 'encodings': {}}
+                categories[category] = data
+            if encoding is None:    # key expired or removed
+                continue
+            data['sampled'] += 1
+            data['encodings'][encoding] = data['encodings'].get(encoding,
+                                                                0) + 1
+            if memory:
+                data['bytes'] = (data['bytes'] or 0) + int(r[2] or 0)
+            if encoding in NON_COMPACT_ENCODINGS:
+                non_compact.append({'key': key, 'category': category,
+                                    'type': ktype, 'encoding': encoding})
+        for data in categories.values():
+            if data['bytes'] is not None and data['sampled']:
+                data['bytes_per_key'] = data['bytes']/float(data['sampled'])
+                data['bytes'] = int(round(data['bytes_per_key']*data['keys']))
+        total = lambda cats: (sum((categories[c]['bytes'] or 0 for c in cats))
+                              if memory else None)
+        index = [c for c in categories if c == 'ids' or
+                 c.startswith('index:') or c.startswith('unique:')]
+        instances = seen.get('objects', 0)
+        nbytes = total(categories)
+        index_bytes = total(index)
+        objects = total(['objects'] if instances else [])
+        yield {'model': meta.modelkey,
+               'namespace': self.namespace,
+               'keys': sum(seen.values()),
+               'instances': instances,
+               'bytes': nbytes,
+               'bytes_per_instance': (nbytes/float(instances)
+                                      if memory and instances else None),
+               'index_bytes': index_bytes,
+               'index_overhead': (index_bytes/float(objects)
+                                  if memory and objects else None),
+               'categories': categories,
+               'non_compact': non_compact}
+
     def _decode_keys(self, value):
         encoding = self.client.encoding
         if isinstance(value, (list, tuple)):
@@ -4,13 +4,15 @@ except ImportError:
     async = None
 
 from .extensions import (RedisScript, read_lua_file, redis, get_script,
-                         RedisDb, RedisKey, RedisDataFormatter)
+                         RedisDb, RedisKey, RedisDataFormatter,
+                         ScriptAccounting)
 from .client import Redis
 
 RedisError = redis.RedisError
 
 __all__ = ['redis_client', 'RedisScript', 'read_lua_file', 'RedisError',
-           'RedisDb', 'RedisKey', 'RedisDataFormatter', 'get_script']
+           'RedisDb', 'RedisKey', 'RedisDataFormatter', 'get_script',
+           'ScriptAccounting']
 
 
 def redis_client(address=None, connection_pool=None, timeout=None,
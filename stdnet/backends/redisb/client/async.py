@@ -16,7 +16,7 @@ from pulsar.apps import redis
 from pulsar.apps.redis.client import BasePipeline
 
 from .extensions import (RedisExtensionsMixin, get_script, RedisError,
-                         all_loaded_scripts)
+                         loaded_scripts)
 from .prefixed import PrefixedRedisMixin
 
 
@@ -45,14 +45,12 @@ class Redis(RedisExtensionsMixin, redis.Redis):
         script = get_script(name)
         if not script:
             raise redis.RedisError('No such script "%s"' % name)
-        address = self.address()
-        if address not in all_loaded_scripts:
-            all_loaded_scripts[address] = set()
-        loaded = all_loaded_scripts[address]
+        accounting = self.accounting is not None
+        loaded = loaded_scripts(self.address(), accounting)
         toload = script.required_scripts.difference(loaded)
         for name in toload:
             s = get_script(name)
-            yield self.script_load(s.script)
+            yield self.script_load(s.source(accounting))
         loaded.update(toload)
         yield script(self, keys, args, options)
 
@@ -63,6 +61,10 @@ class PrefixedRedis(PrefixedRedisMixin, Redis):
 
 class Pipeline(BasePipeline, Redis):
 
+    @property
+    def accounting(self):
+        return self.client.accounting
+
     def execute_script(self, name, keys, *args, **options):
         '''Execute a script.
 
@@ -71,14 +73,12 @@ class Pipeline(BasePipeline, Redis):
         script = get_script(name)
         if not script:
             raise redis.RedisError('No such script "%s"' % name)
-        address = self.address()
-        if address not in all_loaded_scripts:
-            all_loaded_scripts[address] = set()
-        loaded = all_loaded_scripts[address]
+        accounting = self.accounting is not None
+        loaded = loaded_scripts(self.address(), accounting)
         toload = script.required_scripts.difference(loaded)
         for name in toload:
             s = get_script(name)
-            self.script_load(s.script)
+            self.script_load(s.source(accounting))
         loaded.update(toload)
         return script(self, keys, args, options)
 
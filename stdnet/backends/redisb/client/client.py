@@ -23,6 +23,13 @@ RedisScript
    :members:
    :member-order: bysource
 
+ScriptAccounting
+~~~~~~~~~~~~~~~~~~~~
+
+.. autoclass:: ScriptAccounting
+   :members:
+   :member-order: bysource
+
 '''
 import os
 import io
@@ -74,6 +81,10 @@ class Pipeline(BasePipeline, Redis):
     def connection_pool(self):
         return self.client.connection_pool
 
+    @property
+    def accounting(self):
+        return self.client.accounting
+
     @property
     def is_pipeline(self):
         return True
@@ -5,7 +5,7 @@ from datetime import datetime
 from copy import copy
 
 from stdnet.utils.structures import OrderedDict
-from stdnet.utils import iteritems, format_int
+from stdnet.utils import iteritems, format_int, native_str
 from stdnet import odm
 
 try:
@@ -33,11 +33,24 @@ def registered_scripts():
 
 def get_script(script):
     return _scripts.get(script)
+
+
+def loaded_scripts(address, accounting=False):
+    '''The set of script names loaded into the redis server at *address*.
+Scripts in accounting mode are tracked separately.'''
+    key = (address, 'accounting') if accounting else address
+    loaded = all_loaded_scripts.get(key)
+    if loaded is None:
+        loaded = set()
+        all_loaded_scripts[key] = loaded
+    return loaded
 ###########################################################
 
 
-def script_callback(response, script=None, **options):
+def script_callback(response, script=None, accounting=None, **options):
     if script:
+        if accounting is not None:
+            response = accounting.strip(script, response)
         return script.callback(response, **options)
     else:
         return response
@@ -105,6 +118,10 @@ class RedisExtensionsMixin(object):
          'INFO': parse_info}
     )
 
+    accounting = None
+    '''Optional :class:`ScriptAccounting` for this client. When available,
+    scripts are executed in accounting mode.'''
+
     @property
     def is_async(self):
         return False
@@ -133,14 +150,12 @@ class RedisExtensionsMixin(object):
         script = get_script(name)
         if not script:
             raise RedisError('No such script "%s"' % name)
-        address = self.address()
-        if address not in all_loaded_scripts:
-            all_loaded_scripts[address] = set()
-        loaded = all_loaded_scripts[address]
+        accounting = self.accounting is not None
+        loaded = loaded_scripts(self.address(), accounting)
         toload = script.required_scripts.difference(loaded)
         for name in toload:
             s = get_script(name)
-            self.script_load(s.script)
+            self.script_load(s.source(accounting))
         loaded.update(toload)
         return script(self, keys, args, options)
 
@@ -216,6 +231,14 @@ class RedisScript(RedisScriptMeta('_RS', (object,), {'abstract': True})):
         ``EVALSHA`` redis command. This attribute is evaluated by the library,
         it is not set by the user.
 
+    .. attribute:: accounting_script
+
+        The :attr:`script` wrapped by the ``accounting.lua`` prelude. It is
+        executed in place of :attr:`script` when the client has a
+        :class:`ScriptAccounting` handler. Each ``redis.call`` is counted
+        and the counters are returned alongside the result, which is then
+        stripped from them before :meth:`callback` is invoked.
+
     .. _SHA-1: http://en.wikipedia.org/wiki/SHA-1
     '''
     abstract = True
@@ -241,6 +264,28 @@ class RedisScript(RedisScriptMeta('_RS', (object,), {'abstract': True})):
             self._sha1 = sha1(self.script.encode('utf-8')).hexdigest()
         return self._sha1
 
+    @property
+    def accounting_script(self):
+        if not hasattr(self, '_accounting_script'):
+            self._accounting_script = '\n'.join((
+                read_lua_file('accounting'),
+                'local function stdnet_script()',
+                self.script,
+                'end',
+                'return accounting_result(stdnet_script())'))
+        return self._accounting_script
+
+    @property
+    def accounting_sha1(self):
+        if not hasattr(self, '_accounting_sha1'):
+            self._accounting_sha1 = sha1(
+                self.accounting_script.encode('utf-8')).hexdigest()
+        return self._accounting_sha1
+
+    def source(self, accounting=False):
+        '''The lua source to load into the server.'''
+        return self.accounting_script if accounting else self.script
+
     def __repr__(self):
         return self.name if self.name else self.__class__.__name__
     __str__ = __repr__
@@ -264,10 +309,90 @@ class RedisScript(RedisScriptMeta('_RS', (object,), {'abstract': True})):
         numkeys = len(keys)
         keys_args = tuple(keys) + args
         options.update({'script': self, 'redis_client': client})
-        return client.execute_command('EVALSHA', self.sha1, numkeys,
+        sha = self.sha1
+        accounting = client.accounting
+        if accounting is not None:
+            sha = self.accounting_sha1
+            options['accounting'] = accounting
+        return client.execute_command('EVALSHA', sha, numkeys,
                                       *keys_args, **options)
 
 
+class ScriptAccounting(object):
+
+    '''Collect the ``redis.call`` counters returned by :class:`RedisScript`
+    executed in accounting mode. To enable accounting mode, set the
+    :attr:`RedisExtensionsMixin.accounting` attribute of a client::
+
+        client.accounting = ScriptAccounting()
+
+    .. attribute:: scripts
+
+        Dictionary mapping script names to dictionaries of redis commands
+        and two elements lists ``[calls, elements]``, where ``calls`` is the
+        number of ``redis.call`` for the command and ``elements`` is the
+        number of elements returned by those calls.
+
+    .. attribute:: executions
+
+        Dictionary mapping script names to number of executions.
+
+    .. attribute:: last
+
+        Dictionary mapping script names to the counters of their last
+        execution.
+    '''
+    def __init__(self):
+        self.scripts = {}
+        self.executions = {}
+        self.last = {}
+
+    def strip(self, script, response):
+        '''Strip the counters from the *response* of *script* and
+        return the script result.'''
+        result, counters = response
+        self.update(script.name, counters)
+        return result
+
+    def update(self, name, counters):
+        '''Update the counters for script *name* with a flat list of
+        ``command, calls, elements`` triplets.'''
+        stats = self.scripts.get(name)
+        if stats is None:
+            stats = self.scripts[name] = {}
+        last = {}
+        it = iter(counters)
+        for command, calls, elements in zip(it, it, it):
+            command = native_str(command)
+            calls, elements = int(calls), int(elements)
+            last[command] = (calls, elements)
+            counter = stats.get(command)
+            if counter is None:
+                counter = stats[command] = [0, 0]
+            counter[0] += calls
+            counter[1] += elements
+        self.last[name] = last
+        self.executions[name] = self.executions.get(name, 0) + 1
+
+    def totals(self):
+        '''Dictionary of ``[calls, elements]`` counters for each redis
+        command across all scripts.'''
+        totals = {}
+        for stats in self.scripts.values():
+            for command, (calls, elements) in iteritems(stats):
+                counter = totals.get(command)
+                if counter is None:
+                    counter = totals[command] = [0, 0]
+                counter[0] += calls
+                counter[1] += elements
+        return totals
+
+    def clear(self):
+        self.scripts.clear()
+        self.executions.clear()
+        self.last.clear()
+
+
 ############################################################################
 ##    BATTERY INCLUDED REDIS SCRIPTS
 ############################################################################
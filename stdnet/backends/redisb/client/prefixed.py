@@ -117,6 +117,10 @@ class PrefixedRedisMixin(object):
     def connection_pool(self):
         return self._client.connection_pool
 
+    @property
+    def accounting(self):
+        return self._client.accounting
+
     def address(self):
         return self._client.address()
 
@@ -0,0 +1,48 @@
+-- Accounting prelude for scripts executed in accounting mode.
+--
+-- The global redis table is shadowed by a local proxy which counts, for each
+-- redis command, the number of calls and the number of elements returned.
+-- The script is then wrapped into the stdnet_script function and the result
+-- returned by accounting_result is a two elements table containing the
+-- original result and a flat list of command, calls, elements triplets.
+local accounting_counters = {}
+
+local function accounting_add(command, result)
+    command = string.lower(command)
+    local counter = accounting_counters[command]
+    if not counter then
+        counter = {0, 0}
+        accounting_counters[command] = counter
+    end
+    counter[1] = counter[1] + 1
+    if type(result) == 'table' then
+        counter[2] = counter[2] + # result
+    elseif result then
+        counter[2] = counter[2] + 1
+    end
+end
+
+local redis = setmetatable({
+    call = function (command, ...)
+        local result = redis.call(command, ...)
+        accounting_add(command, result)
+        return result
+    end,
+    pcall = function (command, ...)
+        local result = redis.pcall(command, ...)
+        accounting_add(command, result)
+        return result
+    end}, {__index = redis})
+
+local function accounting_result(result)
+    local counters = {}
+    for command, counter in pairs(accounting_counters) do
+        table.insert(counters, command)
+        table.insert(counters, counter[1])
+        table.insert(counters, counter[2])
+    end
+    if result == nil then
+        result = false
+    end
+    return {result, counters}
+end
@@ -11,8 +11,14 @@ if N > 0 then
 	while n < N do
 		n = n + 1
 		local key = KEYS[n]
-		if redis_type(key) ~= typ then
-			local vals = redis_members(key)
+		local ktyp = redis_type(key)
+		if ktyp ~= typ then
+			local vals
+			if ktyp == 'string' then
+				vals = bitmap_members(key)
+			else
+				vals = redis_members(key)
+			end
 			local timeout = redis.call('ttl', key) + 0
 			redis.call('del',key)
 			moved = moved + 1
@@ -68,6 +68,43 @@ local function redis_members(key, all, typ)
 	end
 end
 
+-- Ids of the bits set in the bitmap at key, in increasing order. The first
+-- start of them are skipped, counting whole chunks of bytes with BITCOUNT,
+-- and at most num of them are returned, all of them if num is not given.
+local function bitmap_members(key, start, num)
+    local ids, size, chunk, offset = {}, redis.call('strlen', key), 1024, 0
+    start, num = start or 0, num or -1
+    while offset < size do
+        local count = redis.call('bitcount', key, offset, offset + chunk - 1)
+        if count > start then
+            break
+        end
+        start = start - count
+        offset = offset + chunk
+    end
+    while offset < size and num ~= 0 do
+        local data = redis.call('getrange', key, offset, offset + chunk - 1)
+        for i = 1, # data do
+            local byte, bit, mask = string.byte(data, i), 8*(offset + i - 1), 128
+            while byte > 0 and num ~= 0 do
+                if byte >= mask then
+                    byte = byte - mask
+                    if start > 0 then
+                        start = start - 1
+                    else
+                        table.insert(ids, tostring(bit))
+                        num = num - 1
+                    end
+                end
+                bit = bit + 1
+                mask = mask / 2
+            end
+        end
+        offset = offset + chunk
+    end
+    return ids
+end
+
 -- delete keys from a table
 local function redis_delete(keys)
 	local n = table.getn(keys)
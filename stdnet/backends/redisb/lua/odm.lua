@@ -15,7 +15,11 @@ local odm = {
         multi_fields = {},
         sorted = false,
         autoincr = false,
-        indices = {}
+        indices = {},
+        bitmaps = {},
+        composites = {},
+        trigrams = {},
+        geos = {}
     },
     range_selectors = {
         ge = function (v, v1)
@@ -37,10 +41,52 @@ local odm = {
             return string.sub(v, string.len(v) - string.len(v1) + 1) == v1
         end,
         contains = function (v, v1)
-            return string.find(v, v1) ~= nil 
+            return string.find(v, v1, 1, true) ~= nil
+        end,
+        icontains = function (v, v1)
+            return string.find(string.lower(v), string.lower(v1), 1, true) ~= nil
         end
     }
 }
+--
+-- Distinct three characters sequences of the lower case value
+local function trigrams(value)
+    local grams, seen = {}, {}
+    value = string.lower(value)
+    for i = 1, # value - 2 do
+        local gram = string.sub(value, i, i + 2)
+        if not seen[gram] then
+            seen[gram] = true
+            table.insert(grams, gram)
+        end
+    end
+    return grams
+end
+--
+-- Latitude and longitude of a location stored as "lat,lon"
+local function location(value)
+    if value then
+        local lat, lon = string.match(value, '^([^,]+),([^,]+)$')
+        return tonumber(lat), tonumber(lon)
+    end
+end
+--
+-- Great circle distance in kilometres between two points, with the earth
+-- radius used by the redis GEO commands.
+local function geodistance(lat1, lon1, lat2, lon2)
+    local r = math.pi / 180
+    local u = math.sin((lat2 - lat1) * r / 2)
+    local v = math.sin((lon2 - lon1) * r / 2)
+    return 2 * 6372.797560856 * math.asin(math.sqrt(u * u + math.cos(lat1 * r) * math.cos(lat2 * r) * v * v))
+end
+--
+-- Ids in a query key, a set, a sorted set or a bitmap of ids
+local function query_members(key)
+    if redis_type(key) == 'string' then
+        return bitmap_members(key)
+    end
+    return redis_members(key)
+end
 -- Model pseudo-class
 odm.Model = {
     --[[
@@ -58,6 +104,10 @@ odm.Model = {
         args: table containing instances data to save. The data is an array
             containing arrays of the form:
                 {action, id, score, N, d_1, ..., d_N] 
+            When action is 'change', d_1, ..., d_N is of the form
+                {R, r_1, ..., r_R, f_1, v_1, ..., f_M, v_M}
+            where r_i are the fields to remove and f_i, v_i the changed
+            fields and their values.
         @return an array of id saved to the database
     --]]
     commit = function (self, num, args)
@@ -78,9 +128,12 @@ odm.Model = {
         :param field: the field to query
         :param destkey: the key which will store the set of ids resulting from the query
         :param queries: an array containing pairs of query_type, value where query_type
-            can be one of 'set', 'value' or a range filter.
+            can be one of 'set', 'value', 'within', 'box' or a range filter.
     --]]
     query = function (self, destkey, field, queries)
+        if self.meta.composites[field] then
+            return self:_querycomposite(destkey, field, queries)
+        end
         local ranges, unique, qtype, oper, nested = {}, self.meta.indices[field]
         for i, value in ipairs(queries) do
             if 2*math.floor(i/2) == i then
@@ -90,12 +143,18 @@ odm.Model = {
                 elseif qtype == 'value' then
                     oper = true
                     self:_queryvalue(destkey, field, unique, value)
+                elseif qtype == 'within' then
+                    oper = true
+                    self:_querywithin(destkey, field, value)
+                elseif qtype == 'box' then
+                    oper = true
+                    self:_querybox(destkey, field, value)
                 else
                     -- Range queries are processed together
                     local selector = odm.range_selectors[qtype]
                     if selector then
                         value, nested = unpack(cjson.decode(value))
-                        table.insert(ranges, {selector=selector, value=value, nested=nested})
+                        table.insert(ranges, {type=qtype, selector=selector, value=value, nested=nested})
                     else
                         error('Cannot understand query type "' .. qtype .. '".')
                     end
@@ -106,7 +165,11 @@ odm.Model = {
         end
         if # ranges > 0 then
             if not oper then
-                self:_selectranges(destkey, self.idset, field, ranges)
+                local candidates = self:_trigram_candidates(field, ranges)
+                self:_selectranges(destkey, candidates or self.idset, field, ranges)
+                if candidates then
+                    odm.redis.call('del', candidates)
+                end
             else
                 self:_selectranges(destkey, destkey, field, ranges)
             end
@@ -117,7 +180,7 @@ odm.Model = {
         Delete a query stored in key id
     --]]
     delete = function (self, key)
-        local ids, results = redis_members(key), {}
+        local ids, results = query_members(key), {}
         for _, id in ipairs(ids) do
             local idkey = self:object_key(id)
             self:_update_indices(false, id)
@@ -134,11 +197,34 @@ odm.Model = {
         end
         return results
     end,
+    --
+    -- Store in destkey, which can be key, the ids of key which come after
+    -- the cursor, a score and id pair, in the order of the model id set.
+    -- The scores of destkey are the scores of the model id set and ids with
+    -- the cursor score are ordered by id, as in sorted sets.
+    after = function (self, destkey, key, cursor, desc)
+        local score, id = cursor[1], cursor[2] .. ''
+        odm.redis.call('zinterstore', destkey, 2, self.idset, key, 'weights', 1, 0)
+        if desc then
+            odm.redis.call('zremrangebyscore', destkey, '(' .. score, '+inf')
+        else
+            odm.redis.call('zremrangebyscore', destkey, '-inf', '(' .. score)
+        end
+        for _, member in ipairs(odm.redis.call('zrangebyscore', destkey, score, score)) do
+            if (desc and member >= id) or (not desc and member <= id) then
+                odm.redis.call('zrem', destkey, member)
+            end
+        end
+        return odm.redis.call('zcard', destkey)
+    end,
     --[[
     --]]
     aggregate = function (self, destkey, field)
         -- Loop over ids to aggregate id from a recursive-related field
         local processed = {}
+        if redis_type(destkey) == 'string' then
+            self:_bitmap_to_set(destkey, destkey)
+        end
         for _, id in ipairs(self:setids(destkey)) do
             self:_aggregate(destkey, id, field, processed)
         end
@@ -149,12 +235,30 @@ odm.Model = {
         :param options: dictionary of options 
     --]]
     load = function (self, key, options)
-        local result, ids, related_items
+        local result, ids, related_items, prefetch_items, tmp
         options = tabletools.json_clean(options)
-        if options.get and options.get ~= '' then
+        if redis_type(key) == 'string' then
+            -- a bitmap of ids
+            ids = self:_bitmap_load(key, options)
+            if not ids then
+                tmp = self:temp_key()
+                key = self:_bitmap_to_set(key, tmp)
+            end
+        end
+        if ids then
+            -- ids already decoded from a bitmap
+        elseif options.get and options.get ~= '' then
             return redis_members(key)
         elseif options.ordering == 'explicit' then
             ids = self:_explicit_ordering(key, options.start, options.stop, options.order)
+        elseif options.ordering == 'multi' then
+            ids = self:_multi_ordering(key, options.start, options.stop, options.order)
+        elseif options.ordering == 'distance' then
+            ids = self:_distance_ordering(key, options.start, options.stop, options.order)
+        elseif options.ordering == 'index' then
+            ids = self:_index_ordering(key, options.start, options.stop, options.order.desc)
+        elseif options.ordering == 'after' then
+            ids = self:_after(key, options.order.after, options.start, options.stop, options.order.desc)
         elseif options.ordering == 'DESC' then
             ids = odm.redis.call('zrevrange', key, options.start, options.stop)
         elseif options.ordering == 'ASC' then
@@ -162,6 +266,9 @@ odm.Model = {
         else
             ids = odm.redis.call('smembers', key)
         end
+        if tmp then
+            odm.redis.call('del', tmp)
+        end
         -- Now load fields
         if options.fields and # options.fields > 0 then
             if # options.fields == 1 and options.fields[1] == self.meta.id_name then
@@ -183,7 +290,12 @@ odm.Model = {
         else
             related_items = {}
         end
-        return {result, related_items}
+        if options.prefetch then
+            prefetch_items = self:_load_prefetch(result, options.prefetch)
+        else
+            prefetch_items = {}
+        end
+        return {result, related_items, prefetch_items}
     end,
     --
     --          INTERNAL METHODS
@@ -204,6 +316,37 @@ odm.Model = {
         return idxkey
     end,
     --
+    -- Bitmap index of field for a given value. Bit n is set when the
+    -- instance with id n has the value.
+    bitmap_key = function (self, field, value)
+        return self.meta.namespace .. ':bmp:' .. field .. ':' .. (value or '')
+    end,
+    --
+    -- Hash table with the values of field with a non empty index as keys. A
+    -- hash rather than a set so that small registries are compact.
+    values_key = function (self, field)
+        return self.meta.namespace .. ':val:' .. field
+    end,
+    --
+    -- Set of ids of instances with field containing the trigram gram
+    trigram_key = function (self, field, gram)
+        return self.meta.namespace .. ':tri:' .. field .. ':' .. gram
+    end,
+    --
+    -- GEO sorted set with the locations of field, indexed by instance id
+    geo_key = function (self, field)
+        return self.meta.namespace .. ':geo:' .. field
+    end,
+    --
+    -- Composite index of a list of values, one for each field of the index
+    composite_key = function (self, name, values)
+        local bits = {}
+        for i, value in ipairs(values) do
+            bits[i] = value or ''
+        end
+        return self.meta.namespace .. ':cdx:' .. name .. ':' .. cjson.encode(bits)
+    end,
+    --
     --[[
         A temporary key in the model namespace
     --]]
@@ -269,7 +412,7 @@ odm.Model = {
         if field == self.meta.id_name then
             self:_add_to_dest(destkey, field, key)
         elseif unique then
-            local mapkey, ids = self:map_key(field), self:setids(key)
+            local mapkey, ids = self:map_key(field), query_members(key)
             for _, v in ipairs(ids) do
                 self:_add(destkey, field, odm.redis.call('hget', mapkey, v))
             end
@@ -293,6 +436,96 @@ odm.Model = {
         end
     end,
     --
+    -- Union of composite index sets. queries contains pairs of 'value' and
+    -- a field value, the values of each index key are consecutive.
+    _querycomposite = function(self, destkey, name, queries)
+        local size, values = # self.meta.composites[name], {}
+        for i = 2, # queries, 2 do
+            table.insert(values, queries[i])
+            if # values == size then
+                local idxkey = self:composite_key(name, values)
+                if self.meta.sorted then
+                    odm.redis.call('zunionstore', destkey, 2, destkey, idxkey)
+                else
+                    odm.redis.call('sunionstore', destkey, destkey, idxkey)
+                end
+                values = {}
+            end
+        end
+        return self:setsize(destkey)
+    end,
+    --
+    -- Add to destkey the ids with a location of field within a radius, in
+    -- kilometres, of a point. value is the JSON encoded lookup.
+    _querywithin = function(self, destkey, field, value)
+        if not self.meta.geos[field] then
+            error('Cannot query on field "' .. field .. '". Not a location index.')
+        end
+        local lat, lon, radius = unpack(cjson.decode(value)[1])
+        for _, id in ipairs(odm.redis.call('georadius', self:geo_key(field), lon, lat, radius, 'km')) do
+            self:_add(destkey, field, id)
+        end
+    end,
+    --
+    -- Add to destkey the ids with a location of field inside a box of south,
+    -- west, north and east bounds, in degrees. Candidates are found with
+    -- GEORADIUS on a circle covering the box and checked against the bounds.
+    _querybox = function(self, destkey, field, value)
+        if not self.meta.geos[field] then
+            error('Cannot query on field "' .. field .. '". Not a location index.')
+        end
+        local south, west, north, east = unpack(cjson.decode(value)[1])
+        local lat, lon, radius = (south + north) / 2, (west + east) / 2, 0
+        -- the farthest point of the box is on one of its meridian edges
+        for i = 0, 8 do
+            local plat = south + i * (north - south) / 8
+            radius = math.max(radius, geodistance(lat, lon, plat, west), geodistance(lat, lon, plat, east))
+        end
+        radius = 1.01 * radius + 0.001
+        for _, item in ipairs(odm.redis.call('georadius', self:geo_key(field), lon, lat, radius, 'km', 'withcoord')) do
+            local plon, plat = item[2][1] + 0, item[2][2] + 0
+            if plat >= south and plat <= north and plon >= west and plon <= east then
+                self:_add(destkey, field, item[1])
+            end
+        end
+    end,
+    --
+    -- Store in a temporary key the ids with all the trigrams of the contains
+    -- lookups of field. Return nothing if field has no trigram index or
+    -- the lookups have no trigrams.
+    _trigram_candidates = function(self, field, ranges)
+        if not self.meta.trigrams[field] then
+            return
+        end
+        local keys = {}
+        for _, range in ipairs(ranges) do
+            if (range.type == 'contains' or range.type == 'icontains') and # range.nested == 0 then
+                for _, gram in ipairs(trigrams(range.value .. '')) do
+                    table.insert(keys, self:trigram_key(field, gram))
+                end
+            end
+        end
+        if # keys > 0 then
+            local key = self:temp_key()
+            if self.meta.sorted then
+                -- keep the scores of the id set
+                local args = {key, # keys + 1, self.idset}
+                for _, k in ipairs(keys) do
+                    table.insert(args, k)
+                end
+                table.insert(args, 'weights')
+                table.insert(args, 1)
+                for _ in ipairs(keys) do
+                    table.insert(args, 0)
+                end
+                odm.redis.call('zinterstore', unpack(args))
+            else
+                odm.redis.call('sinterstore', key, unpack(keys))
+            end
+            return key
+        end
+    end,
+    --
     _add = function(self, destkey, field, id)
         -- field is not used, but is here to have the same signature as _union
         if id then
@@ -310,6 +543,12 @@ odm.Model = {
     end,
     --
     _union = function(self, destkey, field, value)
+        if self.meta.bitmaps[field] then
+            for _, id in ipairs(bitmap_members(self:bitmap_key(field, value))) do
+                self:_add(destkey, field, id)
+            end
+            return
+        end
         local idxkey = self:index_key(field, value)
         if self.meta.sorted then
             odm.redis.call('zunionstore', destkey, 2, destkey, idxkey)
@@ -320,7 +559,7 @@ odm.Model = {
     --
     _add_to_dest = function(self, destkey, field, key, as_union)
         local processed = {}
-        for _, id in ipairs(redis_members(key)) do
+        for _, id in ipairs(query_members(key)) do
             if not processed[id] then
                 if as_union then
                     self:_union(destkey, field, id)
@@ -336,7 +575,7 @@ odm.Model = {
         local ordered, ids, scores, value, key, status = self.meta.sorted
         if ordered then
             ids, scores = {}, {}
-            for i, score in ipairs(self.redis.call('zrange', fromkey, 0, -1, 'withscores')) do
+            for i, score in ipairs(odm.redis.call('zrange', fromkey, 0, -1, 'withscores')) do
                 if 2*math.floor(i/2) == i then
                     table.insert(scores, score)
                 else
@@ -391,6 +630,9 @@ odm.Model = {
                 end
             end
         end
+        if action == 'change' then
+            return self:_change_instance(id, score, data)
+        end
         if id == '' then
             table.insert(errors, 'Id not available. Cannot commit.')
         else
@@ -447,6 +689,170 @@ odm.Model = {
         end
     end,
     --
+    _change_instance = function (self, id, score, data)
+        -- Commit the changed fields of a persistent instance and update the
+        -- indices of the changed fields only
+        local idkey, indices, errors = self:object_key(id), self.meta.indices, {}
+        local current_score = self:has_id(id)
+        if not current_score then
+            return {id, 0, 'Instance "' .. id .. '" is not available. Cannot commit changes.'}
+        elseif self.meta.sorted then
+            score = current_score
+        end
+        local nremoved = data[1] + 0
+        local removed = tabletools.slice(data, 2, nremoved + 1)
+        local changed = tabletools.slice(data, nremoved + 2, # data)
+        local fields, values, indexed = {}, {}, {}
+        for _, field in ipairs(removed) do
+            table.insert(fields, field)
+            values[field] = false
+        end
+        for i = 1, # changed, 2 do
+            table.insert(fields, changed[i])
+            values[changed[i]] = changed[i+1]
+        end
+        for _, field in ipairs(fields) do
+            if indices[field] ~= nil then
+                table.insert(indexed, field)
+            end
+        end
+        if # fields == 0 then
+            return {id, 1, score}
+        end
+        -- original values of changed fields in one roundtrip
+        local original, original_data = {}, odm.redis.call('hmget', idkey, unpack(fields))
+        for i, field in ipairs(fields) do
+            original[field] = original_data[i]
+        end
+        for _, field in ipairs(indexed) do
+            self:_update_index(false, id, field, original[field], score)
+        end
+        self:_update_derived(false, id, score, values)
+        if # removed > 0 then
+            odm.redis.call('hdel', idkey, unpack(removed))
+        end
+        if # changed > 0 then
+            odm.redis.call('hmset', idkey, unpack(changed))
+        end
+        for _, field in ipairs(indexed) do
+            local error = self:_update_index(true, id, field, values[field], score)
+            if error then
+                table.insert(errors, error)
+            end
+        end
+        self:_update_derived(true, id, score, values)
+        if # errors > 0 then
+            -- An error has occurred. Rollback changes.
+            local restore, remove = {}, {}
+            for _, field in ipairs(indexed) do
+                self:_update_index(false, id, field, values[field], score)
+            end
+            self:_update_derived(false, id, score, values)
+            for _, field in ipairs(fields) do
+                if original[field] then
+                    table.insert(restore, field)
+                    table.insert(restore, original[field])
+                else
+                    table.insert(remove, field)
+                end
+            end
+            if # remove > 0 then
+                odm.redis.call('hdel', idkey, unpack(remove))
+            end
+            if # restore > 0 then
+                odm.redis.call('hmset', idkey, unpack(restore))
+            end
+            for _, field in ipairs(indexed) do
+                self:_update_index(true, id, field, original[field], score)
+            end
+            self:_update_derived(true, id, score, values)
+            return {id, 0, errors[1]}
+        end
+        return {id, 1, score}
+    end,
+    --
+    -- Add or remove id from the index of field for a given value. Return an
+    -- error message if a unique constraint is violated.
+    _update_index = function (self, update, id, field, value, score)
+        local idxkey
+        if self.meta.indices[field] then
+            if not value then
+                return
+            end
+            idxkey = self:map_key(field)
+            local stored_id = odm.redis.call('hget', idxkey, value)
+            if update then
+                if not stored_id then
+                    odm.redis.call('hset', idxkey, value, id)
+                elseif stored_id ~= id .. '' then
+                    if self:has_id(stored_id) then
+                        return 'Unique constraint "' .. field .. '" violated: "' .. value .. '" is already in database.'
+                    else
+                        odm.redis.call('hset', idxkey, value, id)
+                    end
+                end
+            elseif stored_id == id .. '' then
+                odm.redis.call('hdel', idxkey, value)
+            end
+        elseif self.meta.bitmaps[field] then
+            idxkey = self:bitmap_key(field, value)
+            odm.redis.call('setbit', idxkey, id, update and 1 or 0)
+            self:_update_values(field, value, idxkey, update)
+        else
+            idxkey = self:index_key(field, value)
+            if update then
+                self:setadd(idxkey, score, id)
+            else
+                self:remove_from_set(idxkey, id)
+            end
+            self:_update_values(field, value, idxkey, update)
+        end
+    end,
+    --
+    -- Keep value in the values registry of field while its index, a set or
+    -- a bitmap at idxkey, is not empty
+    _update_values = function (self, field, value, idxkey, update)
+        if value and value ~= '' then
+            if update then
+                odm.redis.call('hset', self:values_key(field), value, 1)
+            elseif self:_index_size(field, idxkey) == 0 then
+                odm.redis.call('hdel', self:values_key(field), value)
+            end
+        end
+    end,
+    --
+    _index_size = function (self, field, idxkey)
+        if self.meta.bitmaps[field] then
+            return odm.redis.call('bitcount', idxkey)
+        else
+            return self:setsize(idxkey) + 0
+        end
+    end,
+    --
+    -- Rebuild the values registries of non unique indices from the existing
+    -- index keys, for data indexed before the registries were introduced.
+    -- Return the number of registered values.
+    rebuild_values = function (self)
+        local num = 0
+        for field, unique in pairs(self.meta.indices) do
+            if not unique then
+                local prefix, valkey = self:index_key(field), self:values_key(field)
+                if self.meta.bitmaps[field] then
+                    prefix = self:bitmap_key(field)
+                end
+                odm.redis.call('del', valkey)
+                for _, idxkey in ipairs(odm.redis.call('keys', prefix .. '*')) do
+                    local value = string.sub(idxkey, # prefix + 1)
+                    if value ~= '' and self:_index_size(field, idxkey) > 0 then
+                        odm.redis.call('hset', valkey, value, 1)
+                        num = num + 1
+                    end
+                end
+            end
+        end
+        return num
+    end,
+    --
     _update_indices = function (self, update, id, oldid, score)
         local idkey, errors, idxkey, value = self:object_key(id), {}
         for field, unique in pairs(self.meta.indices) do
@@ -475,6 +881,10 @@ odm.Model = {
                 elseif value then
                     odm.redis.call('hdel', idxkey, value)
                 end
+            elseif self.meta.bitmaps[field] then
+                idxkey = self:bitmap_key(field, value)
+                odm.redis.call('setbit', idxkey, id, update and 1 or 0)
+                self:_update_values(field, value, idxkey, update)
             else
                 idxkey = self:index_key(field, value)
                 if update then
@@ -482,11 +892,246 @@ odm.Model = {
                 else
                     self:remove_from_set(idxkey, id)
                 end
+                self:_update_values(field, value, idxkey, update)
             end
         end
+        self:_update_derived(update, id, score)
         return errors
     end,
     --
+    -- Add or remove id from the composite, trigram and location indices
+    _update_derived = function (self, update, id, score, changed)
+        self:_update_composites(update, id, score, changed)
+        self:_update_trigrams(update, id, changed)
+        self:_update_geos(update, id, changed)
+    end,
+    --
+    -- Add or remove id from the location indices of fields in changed, or of
+    -- all fields if changed is not given.
+    _update_geos = function (self, update, id, changed)
+        local idkey = self:object_key(id)
+        for field, _ in pairs(self.meta.geos) do
+            if not changed or changed[field] ~= nil then
+                local geokey = self:geo_key(field)
+                if update then
+                    local lat, lon = location(odm.redis.call('hget', idkey, field))
+                    if lat and lon then
+                        odm.redis.call('geoadd', geokey, lon, lat, id)
+                    end
+                else
+                    odm.redis.call('zrem', geokey, id)
+                end
+            end
+        end
+    end,
+    --
+    -- Add or remove id from the trigram indices of fields in changed, or of
+    -- all fields if changed is not given.
+    _update_trigrams = function (self, update, id, changed)
+        local idkey, command = self:object_key(id), update and 'sadd' or 'srem'
+        for field, _ in pairs(self.meta.trigrams) do
+            if not changed or changed[field] ~= nil then
+                local value = odm.redis.call('hget', idkey, field)
+                if value then
+                    for _, gram in ipairs(trigrams(value)) do
+                        odm.redis.call(command, self:trigram_key(field, gram), id)
+                    end
+                end
+            end
+        end
+    end,
+    --
+    -- Add or remove id from the composite indices. If changed is given,
+    -- only the indices with at least one field in changed are updated.
+    _update_composites = function (self, update, id, score, changed)
+        local idkey = self:object_key(id)
+        for name, fields in pairs(self.meta.composites) do
+            local process = not changed
+            if changed then
+                for _, field in ipairs(fields) do
+                    process = process or changed[field] ~= nil
+                end
+            end
+            if process then
+                local values = odm.redis.call('hmget', idkey, unpack(fields))
+                local idxkey = self:composite_key(name, values)
+                if update then
+                    self:setadd(idxkey, score, id)
+                else
+                    self:remove_from_set(idxkey, id)
+                end
+            end
+        end
+    end,
+    --
+    -- Ids to load from the bitmap query key when they are loaded in id
+    -- order, so that only the requested range is decoded. Return nothing
+    -- for any other ordering.
+    _bitmap_load = function (self, key, options)
+        local order, start, num = options.order, options.start, options.stop
+        if options.ordering == '' or (options.get and options.get ~= '') then
+            return bitmap_members(key)
+        elseif options.ordering == 'explicit' and order.field == '' and # order.nested == 0 then
+            if num <= 0 then
+                return {}
+            elseif not order.desc then
+                return bitmap_members(key, start, num)
+            end
+            -- the range counted from the end, in reverse order
+            local size, ids = odm.redis.call('bitcount', key), {}
+            if start >= size then
+                return ids
+            end
+            local first = math.max(size - start - num, 0)
+            local members = bitmap_members(key, first, math.max(size - start - first, 0))
+            for i = # members, 1, -1 do
+                table.insert(ids, members[i])
+            end
+            return ids
+        end
+    end,
+    --
+    -- Store the ids of the bitmap at key in the set destkey, which can be key
+    -- itself, with the time to live of key. Return destkey.
+    _bitmap_to_set = function (self, key, destkey)
+        local ids, ttl = bitmap_members(key), odm.redis.call('pttl', key) + 0
+        odm.redis.call('del', destkey)
+        for i = 1, # ids, 1000 do
+            odm.redis.call('sadd', destkey, unpack(ids, i, math.min(i + 999, # ids)))
+        end
+        if ttl > 0 and # ids > 0 then
+            odm.redis.call('pexpire', destkey, ttl)
+        end
+        return destkey
+    end,
+    --
+    -- Build the bitmap of a plan into a temporary key. A plan is either
+    -- {'field', field, i, n}, the union of the bitmaps of the n values in
+    -- args starting at position i, or {operation, plan_1, ..., plan_N}
+    -- where operation is one of 'intersect', 'union' or 'diff'.
+    _bitmap = function (self, plan, args, tmp)
+        local op, key, keys = plan[1], self:temp_key(), {}
+        table.insert(tmp, key)
+        if op == 'field' then
+            for i = plan[3], plan[3] + plan[4] - 1 do
+                table.insert(keys, self:bitmap_key(plan[2], args[i]))
+            end
+            odm.redis.call('bitop', 'or', key, unpack(keys))
+        else
+            for i = 2, # plan do
+                table.insert(keys, self:_bitmap(plan[i], args, tmp))
+            end
+            if op == 'intersect' then
+                odm.redis.call('bitop', 'and', key, unpack(keys))
+            elseif op == 'union' then
+                odm.redis.call('bitop', 'or', key, unpack(keys))
+            elseif op == 'diff' then
+                local first = table.remove(keys, 1)
+                odm.redis.call('bitop', 'or', key, unpack(keys))
+                -- BITOP NOT only covers the length of the key, extend it
+                -- to the length of the first operand
+                local size = odm.redis.call('strlen', first)
+                if odm.redis.call('strlen', key) < size then
+                    odm.redis.call('setrange', key, size - 1, string.char(0))
+                end
+                odm.redis.call('bitop', 'not', key, key)
+                odm.redis.call('bitop', 'and', key, first, key)
+            else
+                error('Cannot understand bitmap operation "' .. op .. '".')
+            end
+        end
+        return key
+    end,
+    --
+    -- Evaluate a bitmap plan into destkey. For models without ordering
+    -- destkey is the resulting bitmap, and ids are decoded only when loaded.
+    -- Sorted models need the scores of the ids, so destkey is a sorted set.
+    -- Returns the number of ids in destkey.
+    bitmap = function (self, destkey, plan, args)
+        local tmp = {}
+        local key = self:_bitmap(plan, args, tmp)
+        odm.redis.call('del', destkey)
+        if self.meta.sorted then
+            for _, id in ipairs(bitmap_members(key)) do
+                self:_add(destkey, nil, id)
+            end
+            odm.redis.call('del', unpack(tmp))
+            return self:setsize(destkey)
+        end
+        if odm.redis.call('exists', key) + 0 == 1 then
+            odm.redis.call('rename', key, destkey)
+        end
+        odm.redis.call('del', unpack(tmp))
+        return odm.redis.call('bitcount', destkey)
+    end,
+    --
+    -- Count the ids in key for each value of fields. Return a list, one
+    -- element for each field, of flat lists of value, count pairs sorted by
+    -- decreasing count. If limit is positive, it is the maximum number of
+    -- values for each field.
+    facets = function (self, key, limit, fields)
+        local result, tmp, ids, bits = {}, self:temp_key()
+        if redis_type(key) == 'string' then
+            bits = key
+        end
+        for _, field in ipairs(fields) do
+            local counts, flat = {}, {}
+            if self.meta.bitmaps[field] then
+                -- intersect the bitmap of the query with the value bitmaps
+                if not bits then
+                    bits = self:temp_key()
+                    for _, id in ipairs(self:setids(key)) do
+                        odm.redis.call('setbit', bits, id, 1)
+                    end
+                end
+                for _, value in ipairs(odm.redis.call('hkeys', self:values_key(field))) do
+                    odm.redis.call('bitop', 'and', tmp, bits, self:bitmap_key(field, value))
+                    local count = odm.redis.call('bitcount', tmp)
+                    if count > 0 then
+                        table.insert(counts, {value, count})
+                    end
+                end
+            else
+                if bits == key and not ids then
+                    ids = self:_bitmap_to_set(key, self:temp_key())
+                end
+                for _, value in ipairs(odm.redis.call('hkeys', self:values_key(field))) do
+                    local idxkey, count = self:index_key(field, value)
+                    if self.meta.sorted then
+                        count = odm.redis.call('zinterstore', tmp, 2, ids or key, idxkey)
+                    else
+                        count = odm.redis.call('sinterstore', tmp, ids or key, idxkey)
+                    end
+                    if count > 0 then
+                        table.insert(counts, {value, count})
+                    end
+                end
+            end
+            table.sort(counts, function (a, b)
+                if a[2] == b[2] then
+                    return a[1] < b[1]
+                end
+                return a[2] > b[2]
+            end)
+            for i, vc in ipairs(counts) do
+                if limit > 0 and i > limit then
+                    break
+                end
+                table.insert(flat, vc[1])
+                table.insert(flat, vc[2])
+            end
+            table.insert(result, flat)
+        end
+        odm.redis.call('del', tmp)
+        if ids then
+            odm.redis.call('del', ids)
+        end
+        if bits and bits ~= key then
+            odm.redis.call('del', bits)
+        end
+        return result
+    end,
+    --
     -- Perform explicit ordering via redis SORT command.
     _explicit_ordering = function (self, key, start, stop, order)
         local okey, tkeys, sortargs, bykey, ids, status = key, {}, {}
@@ -537,11 +1182,152 @@ odm.Model = {
         return ids
     end,
     --
-    -- Load related objects with their fields
+    -- Key of id for ordering ids equal on all other keys. Auto ids are
+    -- compared as numbers.
+    _tie_key = function (self, id)
+        if self.meta.id_type == AUTO_ID then
+            return tonumber(id)
+        end
+        return id
+    end,
+    --
+    -- Ids of key ordered by several fields, from start and at most num of
+    -- them. Each element of orders is an order table as in
+    -- _explicit_ordering, without nested fields. Ids with the same values
+    -- of all fields are ordered by id.
+    _multi_ordering = function (self, key, start, num, orders)
+        local fields, rows, ids = {}, {}, {}
+        for i, order in ipairs(orders) do
+            fields[i] = order.field ~= '' and order.field or self.meta.id_name
+        end
+        for i, id in ipairs(redis_members(key)) do
+            local values = odm.redis.call('hmget', self:object_key(id), unpack(fields))
+            for j, order in ipairs(orders) do
+                local value = order.field == '' and id or values[j]
+                if order.method == 'ALPHA' then
+                    values[j] = value or ''
+                else
+                    values[j] = tonumber(value) or 0
+                end
+            end
+            rows[i] = {id, values, self:_tie_key(id)}
+        end
+        table.sort(rows, function (a, b)
+            for j, order in ipairs(orders) do
+                local va, vb = a[2][j], b[2][j]
+                if va ~= vb then
+                    if order.desc then
+                        return va > vb
+                    else
+                        return va < vb
+                    end
+                end
+            end
+            return a[3] < b[3]
+        end)
+        for i = start + 1, math.min(start + num, # rows) do
+            table.insert(ids, rows[i][1])
+        end
+        return ids
+    end,
+    --
+    -- Ids of key ordered by the distance of their location from a point,
+    -- from start and at most num of them. order contains the location field
+    -- and the lat and lon of the point. Ids without a location come last and
+    -- ids at the same distance are ordered by id.
+    _distance_ordering = function (self, key, start, num, order)
+        local geokey, rows, ids = self:geo_key(order.field), {}, {}
+        for i, id in ipairs(redis_members(key)) do
+            local position, distance = odm.redis.call('geopos', geokey, id)[1], math.huge
+            if position then
+                distance = geodistance(order.lat, order.lon, position[2] + 0, position[1] + 0)
+            end
+            rows[i] = {id, distance, self:_tie_key(id)}
+        end
+        table.sort(rows, function (a, b)
+            if a[2] ~= b[2] then
+                return a[2] < b[2]
+            end
+            return a[3] < b[3]
+        end)
+        for i = start + 1, math.min(start + num, # rows) do
+            table.insert(ids, rows[i][1])
+        end
+        return ids
+    end,
+    --
+    -- Ids of key ordered by the ordering field of the model, from start and
+    -- at most num of them. The scores of the model id set are the field
+    -- values, so that ids are read from a sorted set rather than sorted.
+    _index_ordering = function (self, key, start, num, desc)
+        local command, ids, tmp = desc and 'zrevrange' or 'zrange'
+        if num <= 0 then
+            return {}
+        end
+        if key ~= self.idset then
+            -- scores of key are not the field values after unions
+            tmp = self:temp_key()
+            odm.redis.call('zinterstore', tmp, 2, self.idset, key, 'weights', 1, 0)
+            key = tmp
+        end
+        ids = odm.redis.call(command, key, start, start + num - 1)
+        if tmp then
+            odm.redis.call('del', tmp)
+        end
+        return ids
+    end,
+    --
+    -- Ids of key which come after the cursor, a score and id pair, in the
+    -- order of the model id set. Skip start ids and return at most num of
+    -- them, or all of them if num is negative. Ids with the cursor score
+    -- are ordered by id, as in sorted sets.
+    _after = function (self, key, cursor, start, num, desc)
+        local score, id, ids, tmp = cursor[1], cursor[2] .. '', {}
+        local value, command, bound = tonumber(score), 'zrangebyscore', '+inf'
+        if desc then
+            command, bound = 'zrevrangebyscore', '-inf'
+        end
+        if key ~= self.idset then
+            -- scores of key are not the field values after unions
+            tmp = self:temp_key()
+            odm.redis.call('zinterstore', tmp, 2, self.idset, key, 'weights', 1, 0)
+            key = tmp
+        end
+        local offset, batch = 0, num < 0 and -1 or start + num + 1
+        while num < 0 or # ids < num do
+            local page = odm.redis.call(command, key, score, bound, 'withscores', 'limit', offset, batch)
+            for i = 1, # page, 2 do
+                local member = page[i]
+                if tonumber(page[i + 1]) ~= value or (desc and member < id) or (not desc and member > id) then
+                    if start > 0 then
+                        start = start - 1
+                    elseif num < 0 or # ids < num then
+                        table.insert(ids, member)
+                    end
+                end
+            end
+            if batch < 0 or # page < 2 * batch then
+                break
+            end
+            offset = offset + batch
+        end
+        if tmp then
+            odm.redis.call('del', tmp)
+        end
+        return ids
+    end,
+    --
+    -- Load related objects with their fields. Nested foreign keys are
+    -- loaded level by level from the instances loaded by their parent.
     _load_related = function (self, result, related)
-        local related_items = {}
+        local related_items, levels, loaded = {}, {}, {}
         for name, rel in pairs(related) do
-            local field_items, field, fields = {}, rel.field, rel.fields
+            rel.name = name
+            table.insert(levels, rel)
+        end
+        table.sort(levels, function (a, b) return a.depth < b.depth end)
+        for _, rel in ipairs(levels) do
+            local name, field_items, field, fields = rel.name, {}, rel.field, rel.fields
             table.insert(related_items, {name, field_items, rel.fields})
             -- A structure has type defined
             if # rel.type > 0 then
@@ -552,9 +1338,19 @@ odm.Model = {
                 end
             -- A Foreign Key
             else
-                local rbk, processed = rel.bk, {}
-                for i, res in ipairs(result) do
-                    local rid = redis.call('hget', self:object_key(res[1]), field)
+                local rbk, processed, ids, keys = rel.bk, {}, {}, {}
+                loaded[name] = ids
+                if # rel.parent > 0 then
+                    for _, pid in ipairs(loaded[rel.parent]) do
+                        table.insert(keys, rel.pbk .. ':obj:' .. pid)
+                    end
+                else
+                    for _, res in ipairs(result) do
+                        table.insert(keys, self:object_key(res[1]))
+                    end
+                end
+                for _, key in ipairs(keys) do
+                    local rid = redis.call('hget', key, field)
                     if rid then
                         local val = processed[rid]
                         -- The related field needs to be loaded
@@ -562,6 +1358,7 @@ odm.Model = {
                             local related_key = rbk .. ':obj:' .. rid
                             val = 1
                             if redis_type(related_key) == 'hash' then
+                                table.insert(ids, rid)
                                 if # fields == 1 and fields[1] == '' then
                                     table.insert(field_items, rid)
                                 else
@@ -587,6 +1384,45 @@ odm.Model = {
         end
         return related_items
     end,
+    --
+    -- Load instances of models with a foreign key pointing to the loaded
+    -- instances, directly or via the through model of a many-to-many
+    -- relationship, using the foreign key index sets.
+    _load_prefetch = function (self, result, prefetch)
+        local prefetch_items = {}
+        for name, rel in pairs(prefetch) do
+            local links, items, processed = {}, {}, {}
+            table.insert(prefetch_items, {name, links, items})
+            for _, res in ipairs(result) do
+                local id = res
+                if type(res) == 'table' then
+                    id = res[1]
+                end
+                local rids = redis_members(rel.index .. ':idx:' .. rel.field .. ':' .. id)
+                if # rel.through > 0 then
+                    local tids = rids
+                    rids = {}
+                    for _, tid in ipairs(tids) do
+                        local rid = redis.call('hget', rel.index .. ':obj:' .. tid, rel.through)
+                        if rid then
+                            table.insert(rids, rid)
+                        end
+                    end
+                end
+                table.insert(links, {id, rids})
+                for _, rid in ipairs(rids) do
+                    if not processed[rid] then
+                        processed[rid] = true
+                        local val = redis.call('hgetall', rel.bk .. ':obj:' .. rid)
+                        if # val > 0 then
+                            table.insert(items, {rid, val})
+                        end
+                    end
+                end
+            end
+        end
+        return prefetch_items
+    end,
     -- Aggregate ids into destkey
     _aggregate = function (self, destkey, id, field, processed)
         if not processed[id] then
@@ -643,6 +1479,14 @@ else
         query = function(self, model, keys, field, args)
             return model:query(first_key(keys), field, args)
         end,
+        -- Keep the ids of a query which come after a cursor
+        after = function(self, model, keys, desc, args)
+            return model:after(keys[1], keys[2], args, desc == '1')
+        end,
+        -- Build a query from bitmap indices and store results on a new set
+        bitmap = function(self, model, keys, plan, args)
+            return model:bitmap(first_key(keys), cjson.decode(plan), args)
+        end,
         -- Load a query
         load = function(self, model, keys, options, args)
             return model:load(first_key(keys), cjson.decode(options))
@@ -651,6 +1495,14 @@ else
         delete = function(self, model, keys, ...)
             return model:delete(first_key(keys))
         end,
+        -- Count the ids in a query for each value of fields
+        facets = function(self, model, keys, limit, args)
+            return model:facets(first_key(keys), limit + 0, args)
+        end,
+        -- Rebuild the values registries of non unique indices
+        rebuild_values = function(self, model, keys, ...)
+            return model:rebuild_values()
+        end,
         -- recursively add id to a set
         aggregate = function(self, model, keys, field, args)
             return model:aggregate(first_key(keys), field)
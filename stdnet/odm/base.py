@@ -2,19 +2,27 @@
 import sys
 from copy import copy, deepcopy
 from inspect import isclass
+from datetime import date, time
+from decimal import Decimal
 
 from stdnet.utils.exceptions import *
-from stdnet.utils import UnicodeMixin, unique_tuple
+from stdnet.utils import UnicodeMixin, unique_tuple, string_type, int_type
 from stdnet.utils.structures import OrderedDict
 
 from .globals import hashmodel, JSPLITTER, orderinginfo
-from .fields import Field, AutoIdField
+from .fields import Field, AutoIdField, lazy_value
 from .related import class_prepared
 
 
 __all__ = ['ModelMeta', 'Model', 'ModelBase', 'ModelState',
            'autoincrement', 'ModelType']
 
+# Types of values which cannot be changed in place. Fields holding values of
+# other types are always committed.
+IMMUTABLE_TYPES = (type(None), bool, float, Decimal, date, time, bytes,
+                   string_type) + (int_type if isinstance(int_type, tuple)
+                                   else (int_type,))
+
 
 def get_fields(bases, attrs):
     #
@@ -72,6 +80,7 @@ class of :class:`Model` in the following way::
 :parameter name: Check the :attr:`name` attribute.
 :parameter modelkey: Check the :attr:`modelkey` attribute.
 :parameter attributes: Check the :attr:`attributes` attribute.
+:parameter indexes: Check the :attr:`indexes` attribute.
 
 This is the list of attributes and methods available. All attributes,
 but the ones mantioned above, are initialized by the object relational
@@ -109,6 +118,16 @@ mapper.
 
     Default: ``None``.
 
+.. attribute:: indexes
+
+    List of composite indices. It is declared as a list of tuples of field
+    names and it is stored as a list of tuples of field attribute names,
+    longest first. A composite index is a set of ids for each combination of
+    values of its fields, it is used by queries filtering all its fields for
+    equality. Check :ref:`composite indices <performance-composite>`.
+
+    Default: ``[]``.
+
 .. attribute:: dfields
 
     dictionary of :class:`Field` instances.
@@ -128,6 +147,11 @@ mapper.
     List of :class:`Field` which are indices (:attr:`Field.index` attribute
     set to ``True``).
 
+.. attribute:: bitmap_indices
+
+    Set of attribute names of :attr:`indices` stored as bitmaps
+    (:attr:`Field.bitmap` attribute set to ``True``).
+
 .. attribute:: pk
 
     The :class:`Field` representing the primary key.
@@ -145,21 +169,34 @@ mapper.
 .. attribute:: attributes
 
     Additional attributes for :attr:`model`.
+
+.. attribute:: compact
+
+    If ``True``, queries load instances of the :meth:`compact_model` by
+    default. Check :meth:`Query.compact`.
+
+    Default: ``False``.
 '''
 
     def __init__(self, model, fields, app_label=None, modelkey=None,
                  name=None, register=True, pkname=None, ordering=None,
-                 attributes=None, abstract=False, **kwargs):
+                 attributes=None, abstract=False, compact=False, indexes=None,
+                 **kwargs):
         self.model = model
         self.abstract = abstract
+        self.compact = compact
         self.attributes = unique_tuple(attributes or ())
         self.dfields = {}
         self.fields = []
         self.scalarfields = []
         self.indices = []
+        self.bitmap_indices = set()
         self.multifields = []
         self.related = {}
         self.manytomany = []
+        self._decoders = {}
+        self._validator = None
+        self._compact_model = None
         self.model._meta = self
         self.app_label = make_app_label(model, app_label)
         self.name = (name or model.__name__).lower()
@@ -191,9 +228,25 @@ mapper.
             field.register_with_model(name, model)
         if pk is not None:
             pk.register_with_model(pkname, model)
+            for field in self.indices:
+                if field.bitmap and (pk.type != 'auto' or
+                                     field.type == 'related object'):
+                    raise FieldError('Bitmap index "%s" requires an auto id '
+                                     'primary key and cannot be a foreign '
+                                     'key.' % field.name)
         self.ordering = None
         if ordering:
             self.ordering = self.get_sorting(ordering, ImproperlyConfigured)
+        self.indexes = []
+        for names in indexes or ():
+            fields = [self.dfields.get(name) for name in names]
+            if (len(fields) < 2 or None in fields or pk in fields or
+                    [f for f in fields if f in self.multifields]):
+                raise ImproperlyConfigured('Composite index %s requires two '
+                                           'or more scalar fields of "%s"'
+                                           % (names, self))
+            self.indexes.append(tuple((f.attname for f in fields)))
+        self.indexes.sort(key=len, reverse=True)
 
     @property
     def type(self):
@@ -207,6 +260,46 @@ mapper.
         self.load_state(obj, state, backend)
         return obj
 
+    def make_compact_object(self, state, backend=None):
+        '''Create a new instance of the :meth:`compact_model` from a *state*
+tuple loaded from the database. The :class:`ModelState` and the database
+data dictionary of the instance are only allocated when needed.'''
+        model = self.compact_model()
+        obj = model.__new__(model)
+        obj._dbdata = None
+        obj._session = None
+        obj._persistent = True
+        pkvalue, loadedfields, data = state
+        pk = self.pk
+        setattr(obj, pk.attname, pk.to_python(pkvalue, backend))
+        if loadedfields is not None:
+            loadedfields = tuple(loadedfields)
+        obj._loadedfields = loadedfields
+        decoder = self._decoders.get(loadedfields)
+        if decoder is None:
+            decoder = self.decoder(loadedfields)
+        decoder(obj, data, backend)
+        return obj
+
+    def compact_model(self):
+        '''A subclass of :attr:`model` which stores field values in
+``__slots__`` rather than in the instance dictionary. The class is created
+once and cached. Instances are created by :meth:`make_compact_object`.'''
+        if self._compact_model is None:
+            model = self.model
+            slots = ['_loadedfields', '_dbdata', '_session', '_persistent']
+            for field in (self.pk,) + tuple(self.scalarfields):
+                if not hasattr(model, field.attname):
+                    slots.append(field.attname)
+            attrs = {'__slots__': tuple(slots),
+                     '__module__': model.__module__}
+            # Create the class with type to bypass the model registration
+            # performed by ModelType
+            self._compact_model = type.__new__(
+                ModelType, 'Compact%s' % model.__name__,
+                (CompactModel, model), attrs)
+        return self._compact_model
+
     def load_state(self, obj, state=None, backend=None):
         if state:
             pkvalue, loadedfields, data = state
@@ -216,13 +309,174 @@ mapper.
             if loadedfields is not None:
                 loadedfields = tuple(loadedfields)
             obj._loadedfields = loadedfields
-            for field in obj.loadedfields():
-                value = field.value_from_data(obj, data)
-                setattr(obj, field.attname, field.to_python(value, backend))
-            if backend or ('__dbdata__' in data and
-                           data['__dbdata__'][pk.name] == pkvalue):
+            decoder = self._decoders.get(loadedfields)
+            if decoder is None:
+                decoder = self.decoder(loadedfields)
+            values = decoder(obj, data, backend)
+            if backend:
+                dbdata = obj.dbdata
+                dbdata[pk.name] = pkvalue
+                dbdata['original'] = values
+            elif ('__dbdata__' in data and
+                  data['__dbdata__'][pk.name] == pkvalue):
                 obj.dbdata[pk.name] = pkvalue
 
+    def loaded_fields(self, names=None):
+        '''Tuple of scalar :class:`Field` corresponding to the loaded field
+``names``. If ``names`` is ``None`` all :attr:`scalarfields` are returned.'''
+        if names is None:
+            return tuple(self.scalarfields)
+        dfields = self.dfields
+        processed = set()
+        fields = []
+        for name in names:
+            if name in processed:
+                continue
+            if name in dfields:
+                processed.add(name)
+                fields.append(dfields[name])
+            else:
+                name = name.split(JSPLITTER)[0]
+                if name in dfields and name not in processed:
+                    field = dfields[name]
+                    if field.type == 'json object':
+                        processed.add(name)
+                        fields.append(field)
+        return tuple(fields)
+
+    def decoder(self, loadedfields=None):
+        '''Return a function which sets the python values of the
+``loadedfields`` on an instance of :attr:`model` from database data.
+
+The function is built once for each set of ``loadedfields`` and cached, so
+that loading instances does not resolve fields or look up their converters
+again. Fields with :attr:`Field.lazy` set to ``True`` are not converted,
+their raw data is stored in a :class:`lazy_value`. The function returns the
+tuple of values set, used by :meth:`changes`. It is used by
+:meth:`load_state`.'''
+        decoder = self._decoders.get(loadedfields)
+        if decoder is None:
+            plan = tuple(((field.attname, field.value_from_data,
+                           lazy_value if field.lazy else field.to_python)
+                          for field in self.loaded_fields(loadedfields)))
+
+            def decoder(obj, data, backend):
+                values = []
+                for attname, value_from_data, to_python in plan:
+                    value = to_python(value_from_data(obj, data), backend)
+                    setattr(obj, attname, value)
+                    values.append(value)
+                return tuple(values)
+
+            self._decoders[loadedfields] = decoder
+        return decoder
+
+    def validator(self):
+        '''Return a function which validates an instance of :attr:`model`
+and stores its serialized data and errors, built once and cached. It is used
+by :meth:`is_valid`.'''
+        if self._validator is None:
+            plan = tuple(((field.attname, field.set_get_value, field.required)
+                          for field in self.scalarfields))
+            missing = object()
+
+            def validator(instance):
+                dbdata = instance.dbdata
+                data = dbdata['cleaned_data'] = {}
+                errors = dbdata['errors'] = {}
+                for name, set_get_value, required in plan:
+                    value = getattr(instance, name, missing)
+                    if value is missing:
+                        continue
+                    try:
+                        svalue = set_get_value(instance, value)
+                    except Exception as e:
+                        errors[name] = str(e)
+                    else:
+                        if (svalue is None or svalue is '') and required:
+                            errors[name] = ("Field '{0}' is required for "
+                                            "'{1}'.".format(name, self))
+                        elif isinstance(svalue, dict):
+                            data.update(svalue)
+                        elif svalue is not None:
+                            data[name] = svalue
+                return not errors
+
+            self._validator = validator
+        return self._validator
+
+    def changes(self, instance):
+        '''Changes of a persistent, validated, ``instance`` since it was
+loaded from or committed to the database. Return a two elements tuple
+containing the dictionary of serialised values of changed fields and the
+list of fields to remove from the database, or ``None`` if the changes
+cannot be tracked and all data must be committed.
+
+Changes are tracked by comparing the values of the loaded fields with the
+values stored by :meth:`load_state` or :meth:`snapshot`. Fields with values
+which can be changed in place, such as dictionaries and lists, and changes
+affecting the :attr:`ordering` or multiple database fields, are not
+tracked.'''
+        dbdata = instance.dbdata
+        original = dbdata.get('original')
+        if original is None:
+            return
+        ordering = self.ordering
+        if ordering and ordering.auto:
+            return
+        data = dbdata['cleaned_data']
+        changed = {}
+        removed = []
+        fields = self.loaded_fields(instance._loadedfields)
+        for field, value0 in zip(fields, original):
+            name = field.attname
+            value = getattr(instance, name, None)
+            if value0.__class__ is lazy_value:
+                value0 = field.to_python(value0.value, value0.backend)
+            if (value.__class__ is value0.__class__ and
+                    isinstance(value, IMMUTABLE_TYPES) and value == value0):
+                continue
+            if (ordering and ordering.field is field) or\
+                    field.type == 'json object':
+                return
+            if name in data:
+                changed[name] = data[name]
+            else:
+                removed.append(name)
+        if len(fields) < len(self.scalarfields):
+            # fields not loaded but set
+            loaded = set((field.attname for field in fields))
+            for name, value in data.items():
+                if name not in loaded:
+                    field = self.dfields.get(name)
+                    if (field is None or field.type == 'json object' or
+                            (ordering and ordering.field is field)):
+                        return
+                    changed[name] = value
+        return changed, removed
+
+    def snapshot(self, instance):
+        '''Store the values of the loaded fields of a persistent ``instance``
+after it has been committed to the database. Used by :meth:`changes`.'''
+        dbdata = instance.dbdata
+        dbdata['original'] = tuple((
+            getattr(instance, field.attname, None) for field in
+            self.loaded_fields(instance._loadedfields)))
+
+    def load_values(self, state, fields, backend=None):
+        '''Return a tuple with the python values of *fields* from a *state*
+tuple, without creating an instance of :attr:`model`.'''
+        pkvalue, _, data = state
+        pk = self.pk
+        values = []
+        for field in fields:
+            if field is pk:
+                value = pkvalue
+            else:
+                value = field.value_from_data(None, data)
+            values.append(field.to_python(value, backend))
+        return tuple(values)
+
     def __repr__(self):
         return self.modelkey
 
@@ -242,26 +496,10 @@ mapper.
         '''Perform validation for *instance* and stores serialized data,
 indexes and errors into local cache.
 Return ``True`` if the instance is ready to be saved to database.'''
-        dbdata = instance.dbdata
-        data = dbdata['cleaned_data'] = {}
-        errors = dbdata['errors'] = {}
-        #Loop over scalar fields first
-        for field, value in instance.fieldvalue_pairs():
-            name = field.attname
-            try:
-                svalue = field.set_get_value(instance, value)
-            except Exception as e:
-                errors[name] = str(e)
-            else:
-                if (svalue is None or svalue is '') and field.required:
-                    errors[name] = ("Field '{0}' is required for '{1}'."
-                                    .format(name, self))
-                else:
-                    if isinstance(svalue, dict):
-                        data.update(svalue)
-                    elif svalue is not None:
-                        data[name] = svalue
-        return len(errors) == 0
+        validator = self._validator
+        if validator is None:
+            validator = self.validator()
+        return validator(instance)
 
     def get_sorting(self, sortby, errorClass=None):
         desc = False
@@ -323,13 +561,25 @@ of fields names and a list of field attribute names.'''
         id_type = 3
         if pk.type == 'auto':
             id_type = 1
+        indices = dict(((idx.attname, idx.unique) for idx in self.indices))
+        for field in self.scalarfields:
+            for name in field.nested_indices:
+                indices[JSPLITTER.join((field.attname, name))] = False
         return {'id_name': pk.name,
                 'id_type': id_type,
                 'sorted': bool(self.ordering),
                 'autoincr': self.ordering and self.ordering.auto,
                 'multi_fields': [field.name for field in self.multifields],
-                'indices': dict(((idx.attname, idx.unique)
-                                 for idx in self.indices))}
+                'indices': indices,
+                'bitmaps': dict(((name, True)
+                                 for name in self.bitmap_indices)),
+                'composites': dict(((','.join(names), names)
+                                    for names in self.indexes)),
+                'trigrams': dict(((field.attname, True)
+                                  for field in self.scalarfields
+                                  if field.trigram)),
+                'geos': dict(((field.attname, True)
+                              for field in self.scalarfields if field.geo))}
 
 
 class autoincrement(object):
@@ -469,7 +719,7 @@ unique identifier for an instance of a model.
 raised when trying to save an invalid instance.'''
 
     def __eq__(self, other):
-        if other.__class__ == self.__class__:
+        if getattr(other, '_meta', None) is self._meta:
             return self.pkvalue() == other.pkvalue()
         else:
             return False
@@ -556,17 +806,81 @@ For this class it simply get the attribute at name::
         '''Save the model by adding it to the :attr:`session`. If the
 :attr:`session` is not available, it raises a :class:`SessionNotAvailable`
 exception.'''
-        return self.session.add(self)
+        session = self.session
+        if session is None:
+            raise SessionNotAvailable('No session available')
+        return session.add(self)
 
     def delete(self):
         '''Delete the model. If the :attr:`session` is not available,
 it raises a :class:`SessionNotAvailable` exception.'''
-        return self.session.delete(self)
+        session = self.session
+        if session is None:
+            raise SessionNotAvailable('No session available')
+        return session.delete(self)
 
 
 ModelBase = ModelType('ModelBase', (Model,), {'abstract': True})
 
 
+class CompactModel(object):
+    '''Mixin of the compact subclasses of models created by
+:meth:`ModelMeta.compact_model`.
+
+Loaded instances of a compact model do not have an instance dictionary,
+a :class:`ModelState` or a database data dictionary. These are created when
+the instance is modified or added to a session. Compact instances compare
+equal to instances of the original model with the same primary key and are
+pickled as instances of the original model.'''
+    __slots__ = ()
+
+    def __hash__(self):
+        if self._dbdata is None:
+            return hash(self.get_uuid(self.pkvalue()))
+        else:
+            return hash(self.get_uuid(self.get_state().iid))
+
+    def __reduce__(self):
+        return (make_model, (self._meta.model,), self.__getstate__())
+
+    def todict(self, exclude_cache=False):
+        odict = super(CompactModel, self).todict(exclude_cache)
+        if (self._dbdata is None and self._persistent and
+                self._meta.pkname() == 'id'):
+            odict['__dbdata__'] = {'id': self.pkvalue()}
+        return odict
+
+    @property
+    def dbdata(self):
+        if self._dbdata is None:
+            self._dbdata = {}
+            if self._persistent:
+                self._dbdata[self._meta.pkname()] = self.pkvalue()
+            if self._session is not None:
+                self._dbdata['session'] = self._session
+                self._session = None
+        return self._dbdata
+
+    def __get_session(self):
+        if self._dbdata is None:
+            return self._session
+        else:
+            return self._dbdata.get('session')
+
+    def __set_session(self, session):
+        if self._dbdata is None:
+            self._session = session
+        else:
+            self._dbdata['session'] = session
+    session = property(__get_session, __set_session)
+
+
+def make_model(model):
+    '''Create an uninitialised instance of ``model``. Used when unpickling
+compact instances.'''
+    return model.__new__(model)
+
+
 def raise_kwargs(model, kwargs):
     if kwargs:
         keys = ', '.join(kwargs)
@@ -22,6 +22,7 @@ __all__ = ['Field',
            'FloatField',
            'DateField',
            'DateTimeField',
+           'GeoField',
            'SymbolField',
            'CharField',
            'ByteField',
@@ -31,9 +32,70 @@ __all__ = ['Field',
            'ModelField',
            'ManyToManyField',
            'CompositeIdField',
+           'LazyField',
+           'lazy_value',
            'JSPLITTER']
 
 NONE_EMPTY = (None, '')
+# latitude limit of the redis GEO commands
+MAX_LATITUDE = 85.05112878
+
+
+def compress_encoder(encoder, params):
+    '''Wrap ``encoder`` with a :class:`stdnet.utils.encoders.Compressed`
+encoder if the ``compress`` parameter is set.'''
+    compress = params.pop('compress', False)
+    threshold = params.pop('compress_threshold', 1024)
+    if compress is False or compress is None:
+        return encoder
+    level = 6 if compress is True else compress
+    if not 0 < level < 10:
+        raise FieldError('compress must be a boolean or a compression level '
+                         'between 1 and 9')
+    return encoders.Compressed(encoder, level, threshold)
+
+
+class lazy_value(object):
+    '''The raw database ``value`` of a :class:`Field` with :attr:`Field.lazy`
+set to ``True``, decoded by :class:`LazyField` on first access.'''
+    __slots__ = ('value', 'backend')
+
+    def __init__(self, value, backend=None):
+        self.value = value
+        self.backend = backend
+
+
+class LazyField(object):
+    '''Descriptor added to the model class for a :class:`Field` with
+:attr:`Field.lazy` set to ``True``. It converts a :class:`lazy_value` into its
+python representation the first time the attribute is accessed and stores
+the result in the instance dictionary.'''
+    def __init__(self, field):
+        self.field = field
+        self.attname = field.attname
+
+    def __get__(self, instance, instance_type=None):
+        if instance is None:
+            return self
+        data = instance.__dict__
+        try:
+            value = data[self.attname]
+        except KeyError:
+            raise AttributeError("'%s' object has no attribute '%s'" %
+                                 (instance_type.__name__, self.attname))
+        if value.__class__ is lazy_value:
+            value = self.field.to_python(value.value, value.backend)
+            data[self.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.attname] = value
+
+    def __delete__(self, instance):
+        try:
+            del instance.__dict__[self.attname]
+        except KeyError:
+            raise AttributeError(self.attname)
 
 
 class Field(UnicodeMixin):
@@ -54,8 +116,31 @@ Each field is specified as a :class:`StdModel` class attribute.
               No database queries are allowed for non indexed fields
               as a design decision (explicit better than implicit).
 
+    Set to ``'bitmap'`` to store the index as one bitmap per value, indexed
+    by instance id. Bitmap indices are only available for non-unique fields
+    of models with an :class:`AutoIdField` primary key and are well suited
+    for fields with few distinct values, such as booleans or status codes.
+    Check :ref:`bitmap indices <performance-bitmap>` for more information.
+
     Default ``True``.
 
+.. attribute:: bitmap
+
+    ``True`` when the field is indexed with a bitmap index.
+
+.. attribute:: geo
+
+    ``True`` when the field is a :class:`GeoField` with a location index.
+
+.. attribute:: nested_indices
+
+    Tuple of indexed nested keys of a :class:`JSONField`.
+
+.. attribute:: trigram
+
+    ``True`` when ``contains`` and ``icontains`` lookups on a
+    :class:`SymbolField` or :class:`CharField` use a trigram index.
+
 .. attribute:: unique
 
     If ``True``, the field must be unique throughout the model.
@@ -126,21 +211,42 @@ Each field is specified as a :class:`StdModel` class attribute.
     This attribute is used by the :class:`StdModel.fieldvalue_pairs` method
     which returns a dictionary of field names and values.
 
+    Default ``False``.
+
+.. attribute:: lazy
+
+    If ``True`` the raw data loaded from the database is converted into its
+    python representation the first time the attribute is accessed, rather
+    than when instances are loaded. Useful for fields which are expensive to
+    decode, such as :class:`PickleObjectField` or :class:`JSONField`, in
+    models where the field is rarely accessed. Primary keys cannot be lazy.
+
     Default ``False``.
 '''
     _default = None
     type = None
     python_type = None
     index = True
+    bitmap = False
+    trigram = False
+    geo = False
+    nested_indices = ()
     charset = None
     hidden = False
     internal_type = None
     creation_counter = 0
 
     def __init__(self, unique=False, primary_key=False, required=True,
-                 index=None, hidden=None, as_cache=False, **extras):
+                 index=None, hidden=None, as_cache=False, lazy=False,
+                 **extras):
         self.primary_key = primary_key
+        self.lazy = lazy and not primary_key
         index = index if index is not None else self.index
+        self.bitmap = index == 'bitmap'
+        if self.bitmap:
+            if unique or primary_key:
+                raise FieldError('A bitmap index cannot be unique')
+            index = True
         if primary_key:
             self.unique = True
             self.required = True
@@ -156,6 +262,7 @@ Each field is specified as a :class:`StdModel` class attribute.
             self.required = False
             self.unique = False
             self.index = False
+            self.bitmap = False
         self.charset = extras.pop('charset', self.charset)
         self.hidden = hidden if hidden is not None else self.hidden
         self.meta = None
@@ -203,6 +310,8 @@ function users should never call.'''
         self.model = model
         meta = model._meta
         self.meta = meta
+        if self.lazy:
+            setattr(model, self.attname, LazyField(self))
         meta.dfields[name] = self
         meta.fields.append(self)
         if not self.primary_key:
@@ -216,6 +325,8 @@ function users should never call.'''
         meta.scalarfields.append(self)
         if self.index:
             meta.indices.append(self)
+            if self.bitmap:
+                meta.bitmap_indices.add(self.attname)
 
     def get_attname(self):
         '''Generate the :attr:`attname` at runtime'''
@@ -487,18 +598,125 @@ a :class:`datetime.datetime` instance.'''
             return self.get_default()
 
 
+class GeoField(AtomField):
+
+    '''An :class:`AtomField` represented in Python by a ``(latitude,
+longitude)`` tuple of floats, in degrees. When indexed, locations are kept in
+a Redis GEO sorted set rather than in value indices and the field can be
+queried with the ``within`` lookup, a tuple of latitude, longitude and
+radius in kilometres, or with the ``box`` lookup, a tuple of south, west,
+north and east bounds in degrees::
+
+    qs.filter(location__within=(51.5, -0.12, 10))
+    qs.filter(location__box=(51.3, -0.5, 51.7, 0.3))
+
+Matched elements can be sorted by distance from a point with
+:meth:`Query.sort_by_distance`. Check
+:ref:`geospatial queries <performance-geo>` for more information.
+
+Latitudes must be between -85.05112878 and 85.05112878, the limits of the
+Redis GEO commands. By default :attr:`Field.required` is ``False``.
+'''
+    type = 'geo'
+    internal_type = 'text'
+    python_type = tuple
+
+    def __init__(self, *args, **kwargs):
+        kwargs['unique'] = False
+        kwargs['primary_key'] = False
+        if kwargs.get('index') == 'bitmap':
+            raise FieldError('A GeoField cannot have a bitmap index')
+        kwargs.setdefault('required', False)
+        super(GeoField, self).__init__(*args, **kwargs)
+        self.geo = bool(self.index)
+
+    def add_to_fields(self):
+        # locations are indexed by the backend rather than with value indices
+        self.model._meta.scalarfields.append(self)
+
+    def set_get_value(self, instance, value):
+        value = self.to_python(value)
+        setattr(instance, self.attname, value)
+        return self.serialise(value)
+
+    def to_python(self, value, backend=None):
+        if value in NONE_EMPTY:
+            return self.get_default()
+        if isinstance(value, (bytes, string_type)):
+            value = to_string(value).split(',')
+        try:
+            lat, lon = (float(v) for v in value)
+        except (TypeError, ValueError):
+            raise FieldValueError('%s is not a valid location' % (value,))
+        if not (-MAX_LATITUDE <= lat <= MAX_LATITUDE and -180 <= lon <= 180):
+            raise FieldValueError('(%s, %s) is not a valid location' %
+                                  (lat, lon))
+        return (lat, lon)
+
+    def serialise(self, value, lookup=None):
+        value = self.to_python(value)
+        if value is not None:
+            return '%r,%r' % value
+    json_serialise = serialise
+
+    def within(self, value):
+        '''Validate the ``(latitude, longitude, radius)`` value of a
+``within`` lookup, the radius in kilometres.'''
+        try:
+            lat, lon, radius = value
+            lat, lon = self.to_python((lat, lon))
+            radius = float(radius)
+        except (TypeError, ValueError, FieldValueError):
+            raise QuerySetError('within lookup on %s requires a latitude, '
+                                'a longitude and a radius' % self)
+        if radius <= 0:
+            raise QuerySetError('within lookup on %s requires a positive '
+                                'radius' % self)
+        return (lat, lon, radius)
+
+    def box(self, value):
+        '''Validate the ``(south, west, north, east)`` value of a ``box``
+lookup. Boxes crossing the 180th meridian are not supported.'''
+        try:
+            south, west, north, east = value
+            south, west = self.to_python((south, west))
+            north, east = self.to_python((north, east))
+        except (TypeError, ValueError, FieldValueError):
+            raise QuerySetError('box lookup on %s requires south, west, '
+                                'north and east bounds' % self)
+        if south > north or west > east:
+            raise QuerySetError('box lookup on %s requires south <= north '
+                                'and west <= east' % self)
+        return (south, west, north, east)
+
+    def scorefun(self, value):
+        raise FieldValueError('Could not obtain score')
+
+
 class SymbolField(AtomField):
 
     '''An :class:`AtomField` which contains a ``symbol``.
 A symbol holds a unicode string as a single unit.
 A symbol is irreducible, and are often used to hold names, codes
-or other entities. They are indexes by default.'''
+or other entities. They are indexes by default.
+
+:parameter trigram: if ``True`` the field maintains a set of ids for each
+    three characters sequence of its lower case value. ``contains`` and
+    ``icontains`` lookups check only the ids in the sets of all the
+    sequences of the lookup value.
+
+    Default ``False``.
+'''
     type = 'text'
     python_type = string_type
     internal_type = 'text'
     charset = 'utf-8'
     _default = ''
 
+    def __init__(self, *args, **kwargs):
+        self.trigram = kwargs.pop('trigram', False)
+        super(SymbolField, self).__init__(*args, **kwargs)
+
     def get_encoder(self, params):
         return encoders.Default(self.charset)
 
@@ -532,7 +750,19 @@ is set to ``False``.'''
 class ByteField(CharField):
 
     '''A :class:`CharField` which contains binary data.
-In python this is converted to `bytes`.'''
+In python this is converted to `bytes`.
+
+:parameter compress: if ``True``, or a zlib compression level between 1
+    and 9, values are compressed before being sent to the
+    back-end server. Data stored without compression can still be loaded.
+
+    Default ``False``.
+
+:parameter compress_threshold: minimum size, in bytes, of serialized values
+    which are compressed when ``compress`` is set.
+
+    Default ``1024``.
+'''
     type = 'bytes'
     internal_type = 'bytes'
     python_type = bytes
@@ -542,8 +772,13 @@ In python this is converted to `bytes`.'''
         if value is not None:
             return b64encode(self.to_python(value)).decode(self.charset)
 
+    def set_get_value(self, instance, value):
+        value = self.to_python(value)
+        setattr(instance, self.attname, value)
+        return self.encoder.dumps(value)
+
     def get_encoder(self, params):
-        return encoders.Bytes(self.charset)
+        return compress_encoder(encoders.Bytes(self.charset), params)
 
 
 class PickleObjectField(ByteField):
@@ -572,7 +807,7 @@ or :class:`JSONField` fields as more general alternatives.
             return self.encoder.dumps(value)
 
     def get_encoder(self, params):
-        return encoders.PythonPickle(protocol=2)
+        return compress_encoder(encoders.PythonPickle(protocol=2), params)
 
 
 class ForeignKey(Field):
@@ -726,6 +961,24 @@ behaviour and how the field is stored in the back-end server.
 
     Default ``True``.
 
+:parameter compress: compress large JSON strings as in :class:`ByteField`.
+    Available only when :attr:`as_string` is ``True``.
+
+    Default ``False``.
+
+:parameter compress_threshold: see :class:`ByteField`.
+
+:parameter index: a nested key, or a list of nested keys, in the double
+    underscore notation, to index. Available only when :attr:`as_string` is
+    ``False``::
+
+        data = odm.JSONField(as_string=False, index=['pv__mean', 'region'])
+
+    Equality queries such as ``filter(data__region='EU')`` use the index of
+    the nested key. A boolean value indexes no nested key.
+
+    Default ``False``.
+
 .. attribute:: as_string
 
     A boolean indicating if data should be serialized
@@ -766,14 +1019,46 @@ behaviour and how the field is stored in the back-end server.
     internal_type = 'serialized'
     _default = {}
 
+    def __init__(self, *args, **kwargs):
+        index = kwargs.pop('index', None)
+        super(JSONField, self).__init__(*args, **kwargs)
+        if index is not None and not isinstance(index, bool):
+            if self.as_string:
+                raise FieldError('Cannot index nested keys of a JSONField '
+                                 'with as_string set to True')
+            self.nested_indices = self._nested_indices(index)
+
+    def _nested_indices(self, index):
+        if isinstance(index, (bytes, string_type)):
+            index = (index,)
+        try:
+            index = tuple(index)
+        except TypeError:
+            raise FieldError('JSONField index must be a nested key or a list '
+                             'of nested keys, got %r' % (index,))
+        names = []
+        for name in index:
+            if isinstance(name, (bytes, string_type)):
+                name = to_string(name)
+                if all(name.split(JSPLITTER)):
+                    names.append(name)
+                    continue
+            raise FieldError('"%s" is not a valid nested key of a '
+                             'JSONField index' % (name,))
+        return tuple(names)
+
     def get_encoder(self, params):
         self.as_string = params.pop('as_string', True)
         if not self.as_string and not isinstance(self._default, dict):
             self._default = {}
-        return encoders.Json(
+        encoder = encoders.Json(
             charset=self.charset,
             json_encoder=params.pop('encoder_class', DefaultJSONEncoder),
             object_hook=params.pop('decoder_hook', DefaultJSONHook))
+        if not self.as_string and params.get('compress'):
+            raise FieldError('Cannot compress a JSONField with as_string '
+                             'set to False')
+        return compress_encoder(encoder, params)
 
     def to_python(self, value, backend=None):
         if value is None:
@@ -199,6 +199,40 @@ model was already registered it does nothing.
                     results.append(manager.flush())
         return results
 
+    def memory_report(self, exclude=None, include=None, sample=100):
+        '''Memory and key footprint of :attr:`registered_models`.
+
+        :param exclude: optional list of model names to exclude.
+        :param include: optional list of model names to include.
+        :param sample: maximum number of keys sampled for each category of
+            model keys.
+        :return: a dictionary of reports, from the
+            :meth:`stdnet.BackendDataServer.memory_report` of each model
+            backend, keyed by model key.
+        '''
+        reports = {}
+        for manager in self.flush(exclude, include, dryrun=True):
+            meta = manager._meta
+            reports[meta.modelkey] = manager.backend.memory_report(
+                meta, sample=sample)
+        return reports
+
+    def rebuild_facets(self, exclude=None, include=None):
+        '''Rebuild the registries of index values used by
+        :meth:`Query.facets` for :attr:`registered_models`, from their
+        existing index keys.
+
+        :param exclude: optional list of model names to exclude.
+        :param include: optional list of model names to include.
+        :return: a dictionary with the number of registered values keyed by
+            model key.
+        '''
+        results = {}
+        for manager in self.flush(exclude, include, dryrun=True):
+            meta = manager._meta
+            results[meta.modelkey] = manager.backend.rebuild_facets(meta)
+        return results
+
     def unregister(self, model=None):
         '''Unregister a ``model`` if provided, otherwise it unregister all
 registered models. Return a list of unregistered model managers or ``None``
@@ -243,9 +277,16 @@ For example::
         return list(self._register_applications(applications, models,
                                                 backends))
 
-    def session(self):
-        '''Obatain a new :class:`Session` for this ``Router``.'''
-        return Session(self)
+    def session(self, readonly=False, identity_map=None):
+        '''Obatain a new :class:`Session` for this ``Router``.
+
+:parameter readonly: if ``True`` queries of the new :class:`Session` are
+    :meth:`Query.readonly` by default.
+:parameter identity_map: optional maximum number of instances in the
+    :attr:`Session.identity_map`. If not provided the session does not
+    use an identity map.
+'''
+        return Session(self, readonly=readonly, identity_map=identity_map)
 
     def create_all(self):
         '''Loop though :attr:`registered_models` and issue the
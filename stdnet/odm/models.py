@@ -57,25 +57,7 @@ previous object data entirely, otherwise it will only update it.'''
 
     def loadedfields(self):
         '''Generator of fields loaded from database'''
-        if self._loadedfields is None:
-            for field in self._meta.scalarfields:
-                yield field
-        else:
-            fields = self._meta.dfields
-            processed = set()
-            for name in self._loadedfields:
-                if name in processed:
-                    continue
-                if name in fields:
-                    processed.add(name)
-                    yield fields[name]
-                else:
-                    name = name.split(JSPLITTER)[0]
-                    if name in fields and name not in processed:
-                        field = fields[name]
-                        if field.type == 'json object':
-                            processed.add(name)
-                            yield field
+        return iter(self._meta.loaded_fields(self._loadedfields))
 
     def fieldvalue_pairs(self, exclude_cache=False):
         '''Generator of fields,values pairs. Fields correspond to
@@ -271,9 +253,49 @@ proxy for the :attr:`Metaclass.pk` attribute.'''
                     qs = qs.load_only(*load_only)
                 if dont_load:
                     qs = qs.dont_load(*dont_load)
+                siblings = None
+                if not (load_only or dont_load):
+                    siblings = self._related_siblings(field)
+                if siblings:
+                    # load the related instances of all siblings at once
+                    pk = field.relmodel._meta.pk
+                    ids = set((pk.to_python(getattr(s, field.attname))
+                               for s in siblings))
+                    ids.add(pk.to_python(val))
+                    callback = partial(self.__set_siblings_value, field,
+                                       siblings)
+                    return qs.filter(**{pkname: list(ids)}).items(
+                        callback=callback)
                 callback = partial(self.__set_related_value, field)
                 return qs.filter(**{pkname: val}).items(callback=callback)
 
+    def _related_siblings(self, field):
+        # Instances loaded by the same query, still in memory, which have not
+        # loaded the related instance of ``field`` yet.
+        siblings = self._dbdata.get('siblings') if self._dbdata else None
+        if siblings:
+            cache_name = field.get_cache_name()
+            attname = field.attname
+            siblings = [s for s in (ref() for ref in siblings)
+                        if s is not None and s is not self and
+                        not hasattr(s, cache_name) and
+                        getattr(s, attname, None) is not None]
+        return siblings
+
+    def __set_siblings_value(self, field, siblings, items):
+        pk = field.relmodel._meta.pk
+        items = dict(((pk.to_python(item.pkvalue()), item) for item in items))
+        cache_name = field.get_cache_name()
+        attname = field.attname
+        for s in siblings:
+            item = items.get(pk.to_python(getattr(s, attname)))
+            # siblings with missing related instances are left unchanged
+            if item is not None:
+                setattr(s, cache_name, item)
+        item = items.get(pk.to_python(getattr(self, attname)))
+        return self.__set_related_value(
+            field, [item] if item is not None else None)
+
     def __set_related_value(self, field, items=None):
         try:
             rel_obj = self.get_unique_instance(items)
@@ -1,11 +1,15 @@
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
 from copy import copy
 from inspect import isgenerator
 from functools import partial
+from itertools import chain, product
 from collections import Mapping
 
 from stdnet import range_lookups
 from stdnet.utils import JSPLITTER, iteritems, unique_tuple
 from stdnet.utils.exceptions import *
+from stdnet.utils.structures import OrderedDict
 
 from .globals import lookup_value
 
@@ -201,6 +205,46 @@ class QueryElement(Q):
     def construct(self):
         return self
 
+    def fingerprint(self):
+        '''A normalised representation of this :class:`QueryElement` with
+lookup values stripped out. Queries with the same shape have the same
+fingerprint, regardless of the values they filter on.'''
+        bits = []
+        for child in self:
+            if isinstance(child, Q):
+                bits.append(child.construct().fingerprint())
+            else:
+                lookup, value = child
+                if lookup == 'set':
+                    bits.append(value.fingerprint())
+                else:
+                    bits.append(lookup)
+        k = self.keyword
+        if self.name:
+            k += '-' + self.name
+        k = '%s:%s(%s)' % (self._meta, k, ', '.join(sorted(set(bits))))
+        data = self.data
+        ordering = data.get('ordering')
+        if ordering:
+            k += ' ordering=%s' % ','.join(
+                ('%s%s' % ('-' if o.desc else '', o.name) for o in
+                 chain((ordering,), data.get('then_by') or ())))
+        if data.get('fields'):
+            k += ' fields=%s' % ','.join(data['fields'])
+        if data.get('select_related'):
+            k += ' related=%s' % ','.join(sorted(data['select_related']))
+        if data.get('prefetch_related'):
+            k += ' prefetch=%s' % ','.join(sorted(data['prefetch_related']))
+        if data.get('get_field'):
+            k += ' get_field=%s' % data['get_field']
+        if data.get('where'):
+            k += ' where'
+        if data.get('after'):
+            k += ' after'
+        if data.get('distance'):
+            k += ' distance=%s' % data['distance'][0]
+        return k
+
     def backend_query(self, **kwargs):
         if self.__backend_query is None:
             self.__backend_query = self.backend.Query(self, **kwargs)
@@ -470,18 +514,84 @@ the :meth:`union` method.'''
         q.intersections += queries
         return q
 
-    def sort_by(self, ordering):
+    def sort_by(self, ordering, *then_by):
         '''Sort the query by the given field
 
 :parameter ordering: a string indicating the class:`Field` name to sort by.
     If prefixed with ``-``, the sorting will be in descending order, otherwise
     in ascending order.
+:parameter then_by: optional fields to sort elements with the same value of
+    the previous fields, for example ``sort_by('ccy', '-size')``. Related
+    fields cannot be used with more than one field.
 :return type: a new :class:`Query` instance.
 '''
+        meta = self._meta
         if ordering:
-            ordering = self._meta.get_sorting(ordering, QuerySetError)
+            ordering = meta.get_sorting(ordering, QuerySetError)
+        if then_by:
+            if not ordering:
+                raise QuerySetError('Cannot sort by "%s" without a first '
+                                    'field' % then_by[0])
+            then_by = tuple((meta.get_sorting(o, QuerySetError)
+                             for o in then_by))
+            for o in (ordering,) + then_by:
+                if o.nested:
+                    raise QuerySetError('Cannot sort by related field "%s" '
+                                        'and other fields' % o.name)
         q = self._clone()
         q.data['ordering'] = ordering
+        q.data['then_by'] = then_by or None
+        q.data['distance'] = None
+        return q
+
+    def sort_by_distance(self, lat, lon, field=None):
+        '''Sort the query by the distance of a :class:`GeoField` location
+from a point, nearest first. Elements without a location come last::
+
+    qs.filter(location__within=(51.5, -0.12, 10)).sort_by_distance(51.5,
+                                                                    -0.12)
+
+:parameter lat: the latitude of the point.
+:parameter lon: the longitude of the point.
+:parameter field: the name of the :class:`GeoField`. It can be omitted when
+    the model has only one indexed location.
+:return type: a new :class:`Query` instance.
+'''
+        meta = self._meta
+        if field is None:
+            fields = [f for f in meta.scalarfields if f.geo]
+            if len(fields) != 1:
+                raise QuerySetError('sort_by_distance requires the field of '
+                                    '"%s" to sort by' % meta)
+            field = fields[0]
+        else:
+            name, field = field, meta.dfields.get(field)
+            if field is None or not field.geo:
+                raise QuerySetError('Cannot sort by distance of "%s". Not a '
+                                    'location index.' % name)
+        try:
+            lat, lon = field.to_python((lat, lon))
+        except FieldValueError:
+            raise QuerySetError('(%s, %s) is not a valid location' %
+                                (lat, lon))
+        q = self._clone()
+        q.data['ordering'] = None
+        q.data['then_by'] = None
+        q.data['distance'] = (field.attname, lat, lon)
+        return q
+
+    def after(self, cursor):
+        '''Return a new :class:`Query` with the elements which come after
+``cursor`` in the ordering of the model. It is used for
+:ref:`keyset pagination <performance-keyset>`, check :meth:`page`.
+The cursor applies to all operations on the new query, including
+:meth:`count`, :meth:`delete` and its use as a subquery.
+
+:parameter cursor: a cursor returned by :meth:`page`.
+:return type: a new :class:`Query` instance.
+'''
+        q = self._clone()
+        q.data['after'] = self._cursor(cursor)
         return q
 
     def search(self, text, lookup=None):
@@ -532,7 +642,8 @@ each element in the query. The *coe* should reference an instance of
 follows the foreign-key relationship ``related``.
 
 :parameter related: A field name corresponding to a :class:`ForeignKey`
-    in :attr:`Query.model`.
+    in :attr:`Query.model`, or a chain of foreign keys with the
+    :ref:`double underscore <tutorial-underscore>` notation.
 :parameter related_fields: optional :class:`Field` names for the ``related``
     model to load. If not provided, all fields will be loaded.
 
@@ -544,13 +655,53 @@ in a generative way::
 
     qs = myquery.load_related('rel1').load_related('rel2','field1','field2')
 
+Foreign keys of related models are followed using the double underscore
+notation, all levels are loaded in a single database roundtrip::
+
+    qs = myquery.load_related('rel1__rel3', 'field1')
+
+The intermediate related models, ``rel1`` in the example above, are
+loaded with all their fields unless :meth:`load_related` was used for them
+too.
+
 :rtype: a new :class:`Query`.'''
-        field = self._get_related_field(related)
-        if not field:
+        if not self._get_related_path(related):
             raise FieldError('"%s" is not a related field for "%s"' %
                              (related, self._meta))
         q = self._clone()
-        return q._add_to_load_related(field, *related_fields)
+        return q._add_to_load_related(related, *related_fields)
+
+    def prefetch_related(self, *related):
+        '''It returns a new :class:`Query` which loads, in the same database
+roundtrip, the instances of ``related`` managers for all the instances
+matched by the query. Loaded instances are cached in the related managers
+and returned by their ``all`` method::
+
+    funds = models.fund.query().prefetch_related('positions').all()
+    for fund in funds:
+        # no database roundtrip
+        positions = fund.positions.all()
+
+This function is :ref:`performance boost <performance-prefetchrelated>`
+for reverse foreign keys and :ref:`many-to-many <many-to-many>`
+relationships, where :meth:`load_related` cannot be used.
+
+:parameter related: names of :class:`One2ManyRelatedManager` or
+    :class:`Many2ManyRelatedManager` of :attr:`Query.model`. The foreign key
+    fields pointing to :attr:`Query.model` must be indices.
+:rtype: a new :class:`Query`.'''
+        for name in related:
+            manager = self._meta.related.get(name)
+            if manager is None:
+                raise FieldError('"%s" is not a related manager for "%s"' %
+                                 (name, self._meta))
+            elif not manager.field.index:
+                raise FieldError('Cannot prefetch "%s". "%s" is not an index'
+                                 % (name, manager.field))
+        q = self._clone()
+        q.data['prefetch_related'] = unique_tuple(
+            q.data.get('prefetch_related') or (), related)
+        return q
 
     def load_only(self, *fields):
         '''This is provides a :ref:`performance boost <increase-performance>`
@@ -567,7 +718,8 @@ data intensive fields you don't need.
                 bits = field.split(JSPLITTER)
                 related = self._get_related_field(bits[0])
                 if related:
-                    q._add_to_load_related(related, JSPLITTER.join(bits[1:]))
+                    q._add_to_load_related(related.name,
+                                           JSPLITTER.join(bits[1:]))
                     continue
             new_fields.append(field)
         if fields and not new_fields:
@@ -579,6 +731,48 @@ data intensive fields you don't need.
         q.data['fields'] = fs if fs else None
         return q
 
+    def compact(self, compact=True):
+        '''Load instances of the :meth:`ModelMeta.compact_model` of
+:attr:`model`. This is a :ref:`performance boost <performance-compact>`
+in memory for large, read-mostly, result sets: field values are stored in
+``__slots__`` and the instance state is only allocated when an instance
+is modified. By default a query loads compact instances only if the
+model ``Meta`` class sets ``compact = True``.
+
+:parameter compact: ``False`` to load standard instances of :attr:`model`.
+:rtype: a new :class:`Query`.'''
+        q = self._clone()
+        q.data['compact'] = compact
+        return q
+
+    def readonly(self, readonly=True):
+        '''Load instances which are not tracked by the :attr:`session`.
+This is a :ref:`performance boost <performance-readonly>` for long running
+processes which read many instances: the :attr:`session` does not keep a
+reference to them and their state is not allocated. Loaded instances are
+attached to the :attr:`Session.readonly_session` and refuse to be saved or
+deleted until they are explicitly added to a :class:`Session`. By default
+a query is read-only only if its :attr:`session` is read-only.
+
+:parameter readonly: ``False`` to track instances in the :attr:`session`.
+:rtype: a new :class:`Query`.'''
+        q = self._clone()
+        q.data['readonly'] = readonly
+        return q
+
+    def batch_related(self, batch=True):
+        '''Instances loaded by a query are siblings: the first time a
+:class:`ForeignKey` is accessed on one of them, the related instances of all
+siblings still in memory are loaded with a single query. This
+:ref:`performance boost <performance-batchrelated>` avoids a database
+roundtrip for each instance when :meth:`load_related` is not used.
+
+:parameter batch: ``False`` to load foreign keys one instance at a time.
+:rtype: a new :class:`Query`.'''
+        q = self._clone()
+        q.data['batch_related'] = batch
+        return q
+
     def dont_load(self, *fields):
         '''Works like :meth:`load_only` to provides a
 :ref:`performance boost <increase-performance>` in cases when you need
@@ -596,16 +790,67 @@ to load all fields except a subset specified by *fields*.
 
     def items(self, callback=None):
         '''Retrieve all items for this :class:`Query`.'''
+        ids = self._identity_ids()
+        if ids is not None:
+            return self.backend.execute(self._identity_items(ids), callback)
         return self.backend_query().items(callback=callback)
 
     def get(self, **kwargs):
         '''Return an instance of a model matching the query. A special case is
 the query on ``id`` which provides a direct access to the :attr:`session`
-instances. If the given primary key is present in the session, the object
-is returned directly without performing any query.'''
+instances. If the :attr:`Session.identity_map` is available and the given
+primary key is present in it, the object is returned directly without
+performing any query.'''
         return self.filter(**kwargs).items(
             callback=self.model.get_unique_instance)
 
+    def top(self, n, by):
+        '''Return a ``list`` with the first ``n`` matched elements ordered by
+``by``, for example the ten largest positions::
+
+    qs.top(10, by='-size')
+
+Only ``n`` elements are loaded. When ``by`` is the numeric ``ordering`` field
+of the model, elements are read from the model sorted id set rather than
+sorted. Check :ref:`top queries <performance-top>` for more information.
+
+:parameter n: the number of elements.
+:parameter by: the field to order by. If prefixed with ``-``, the ordering
+    is descending.
+'''
+        if n < 1:
+            raise QuerySetError('top requires a positive number of elements')
+        return self.sort_by(by)[:n]
+
+    def page(self, limit, cursor=None):
+        '''Return a two elements tuple with a ``list`` of at most ``limit``
+elements and the cursor of the next page, ``None`` if there are no more
+elements::
+
+    items, cursor = qs.page(50)
+    more, cursor = qs.page(50, cursor)
+
+Pages are selected with the scores of the model ordering rather than by
+position, so that the cost of a page does not depend on its depth and
+elements added or removed before a cursor do not shift the following pages.
+It requires a model with a numeric ``ordering`` field, and it can be sorted
+only by that field.
+
+:parameter limit: the maximum number of elements in the page.
+:parameter cursor: optional cursor returned by a previous call.
+'''
+        if limit < 1:
+            raise QuerySetError('page requires a positive number of elements')
+        q = self
+        if cursor:
+            # selected when loading the page only, with no need to store
+            # all the elements after the cursor
+            q = self._clone()
+            q.data['cursor'] = self._cursor(cursor)
+        field = self._keyset_ordering()
+        return self.backend.execute(q[:limit],
+                                    partial(self._page, field, limit))
+
     def count(self):
         '''Return the number of objects in ``self``.
 This method is efficient since the :class:`Query` does not
@@ -614,6 +859,84 @@ It construct the queries and count the
 objects on the server side.'''
         return self.backend_query().count()
 
+    def values(self, *fields):
+        '''Return a ``list`` of dictionaries with the values of ``fields``
+for all matched elements. No model instance is created and nothing is added
+to the :attr:`session`, making this method a
+:ref:`performance boost <performance-values>` for reporting and
+serialisation::
+
+    qs.values('name', 'ccy')
+
+:parameter fields: names of scalar fields. If not provided the primary key
+    and all scalar fields are loaded.
+'''
+        fields = self._value_fields(fields)
+        names = [field.name for field in fields]
+        return self._load_values(
+            fields, lambda rows: [dict(zip(names, r)) for r in rows])
+
+    def values_list(self, *fields, **kwargs):
+        '''Same as :meth:`values` but it returns a ``list`` of tuples.
+
+:parameter flat: if ``True`` a list of values rather than a list of
+    one-element tuples is returned. Requires one field only.
+'''
+        flat = kwargs.pop('flat', False)
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments %s for '
+                            'values_list' % ', '.join(kwargs))
+        if flat and len(fields) != 1:
+            raise QuerySetError('values_list with flat=True requires one '
+                                'field, %s given' % len(fields))
+        callback = (lambda rows: [r[0] for r in rows]) if flat else None
+        return self._load_values(self._value_fields(fields), callback)
+
+    def facets(self, *fields, **kwargs):
+        '''Count the matched elements for each value of ``fields`` in one
+roundtrip, without loading any instance::
+
+    qs.facets('ccy', 'type', limit=20)
+
+It returns a dictionary mapping field names to an ordered dictionary of
+value, count pairs, sorted by decreasing count. Values with no matched
+elements are not included.
+
+:parameter fields: names of fields with a non unique index.
+:parameter limit: optional maximum number of values for each field.
+'''
+        limit = kwargs.pop('limit', None)
+        if kwargs:
+            raise TypeError('Unexpected keyword arguments %s for '
+                            'facets' % ', '.join(kwargs))
+        if not fields:
+            raise QuerySetError('facets requires at least one field')
+        if self._get_field:
+            raise QuerySetError('Cannot compute facets of a query with '
+                                'get_field')
+        meta = self._meta
+        facet_fields = []
+        for name in fields:
+            field = meta.dfields.get(name)
+            if field is None or not field.index or field.unique:
+                raise FieldError('"%s" is not a non unique index of "%s"' %
+                                 (name, meta))
+            facet_fields.append(field)
+        q = self.construct()
+        if isinstance(q, EmptyQuery):
+            return dict(((f.name, OrderedDict()) for f in facet_fields))
+        backend = self.backend
+
+        def _facets(response):
+            result = {}
+            for field, counts in zip(facet_fields, response):
+                tpy = field.to_python
+                result[field.name] = OrderedDict(
+                    ((tpy(v, backend), int(c)) for v, c in
+                     zip(counts[::2], counts[1::2])))
+            return result
+        return q.backend_query().facets(facet_fields, limit, _facets)
+
     def delete(self):
         '''Delete all matched elements of the :class:`Query`. It returns the
 list of ids deleted.'''
@@ -662,7 +985,7 @@ an exception is raised.
 
     def _construct(self):
         if self.fargs:
-            fargs = self.aggregate(self.fargs)
+            fargs = self.aggregate(self.fargs, composite=True)
             for f in fargs:
                 # no values to filter on. empty result.
                 if not f.valid:
@@ -702,11 +1025,14 @@ an exception is raised.
         q.data = data
         return q
 
-    def aggregate(self, kwargs):
-        '''Aggregate lookup parameters.'''
+    def aggregate(self, kwargs, composite=False):
+        '''Aggregate lookup parameters. If ``composite`` is ``True``, equality
+lookups on all the fields of a composite index are replaced by a lookup on
+the index.'''
         meta = self._meta
         fields = meta.dfields
         field_lookups = {}
+        not_indexed = {}
         for name, value in iteritems(kwargs):
             bits = name.split(JSPLITTER)
             field_name = bits.pop(0)
@@ -723,19 +1049,32 @@ an exception is raised.
                 elif bits[-1] in range_lookups:
                     lookup = bits.pop()
                 remaining = JSPLITTER.join(bits)
-                if lookup:  # this is a range lookup
+                if lookup in ('within', 'box'):  # a location lookup
+                    if not field.geo or remaining:
+                        raise QuerySetError('Cannot use %s lookups on '
+                                            '"%s". Not a location index.' %
+                                            (lookup, name))
+                    value = getattr(field, lookup)(value)
+                    lookups = get_lookups(attname, field_lookups)
+                    lookups.append(lookup_value(lookup, (value, None)))
+                    continue
+                elif lookup:  # this is a range lookup
                     attname, nested = field.get_lookup(remaining,
                                                        QuerySetError)
                     lookups = get_lookups(attname, field_lookups)
                     lookups.append(lookup_value(lookup, (value, nested)))
                     continue
+                elif remaining in field.nested_indices:
+                    attname = JSPLITTER.join((attname, remaining))
                 elif remaining:   # Not a range lookup, must be a nested filter
                     value = field.filter(self.session, remaining, value)
+            if field.geo:
+                raise QuerySetError('GeoField %s can only be queried with '
+                                    'within or box lookups' % field.name)
             lookups = get_lookups(attname, field_lookups)
             # If we are here the field must be an index
-            if not field.index:
-                raise QuerySetError("%s %s is not an index. Cannot query." %
-                                    (field.__class__.__name__, field_name))
+            if not field.index and attname == field.attname:
+                not_indexed[attname] = field
             if not iterable(value):
                 value = (value,)
             for v in value:
@@ -745,9 +1084,31 @@ an exception is raised.
                     v = lookup_value('value', field.serialise(v, lookup))
                 lookups.append(v)
         #
+        if composite and meta.indexes:
+            self._composite_lookups(field_lookups)
+        for attname, field in iteritems(not_indexed):
+            if attname in field_lookups:
+                raise QuerySetError("%s %s is not an index. Cannot query." %
+                                    (field.__class__.__name__, field.name))
         return [queryset(self, name=name, underlying=field_lookups[name])
                 for name in sorted(field_lookups)]
 
+    def _composite_lookups(self, field_lookups):
+        # Replace equality lookups covering composite indices. The lookups
+        # of a composite index are the values of its fields for each
+        # combination of the filtered values.
+        for names in self._meta.indexes:
+            lookups = [field_lookups.get(name) for name in names]
+            if not all(lookups) or [v for v in chain(*lookups)
+                                    if v.lookup != 'value']:
+                continue
+            values = []
+            for combination in product(*lookups):
+                values.extend(combination)
+            for name in names:
+                field_lookups.pop(name)
+            field_lookups[','.join(names)] = values
+
     def _test_unique(self, fieldname, value, instance, exception, items):
         if items:
             r = self.model.get_unique_instance(items)
@@ -760,6 +1121,113 @@ an exception is raised.
         else:
             return value
 
+    def _keyset_ordering(self):
+        # The ordering field of keyset pagination
+        ordering = self._meta.ordering
+        if not ordering or ordering.auto or ordering.nested:
+            raise QuerySetError('Keyset pagination requires a model with a '
+                                'field ordering')
+        return ordering.field
+
+    def _cursor(self, cursor):
+        # The score and primary key pair encoded in a cursor
+        self._keyset_ordering()
+        try:
+            data = urlsafe_b64decode(cursor.encode('ascii'))
+            score, pk = json.loads(data.decode('utf-8'))
+        except Exception:
+            raise QuerySetError('Invalid cursor "%s"' % cursor)
+        return score, pk
+
+    def _page(self, field, limit, items):
+        cursor = None
+        if len(items) == limit:
+            last = items[-1]
+            value = getattr(last, field.attname, None)
+            score = None if value is None else field.scorefun(value)
+            data = json.dumps((score, last.pkvalue())).encode('utf-8')
+            cursor = urlsafe_b64encode(data).decode('ascii')
+        return items, cursor
+
+    def _value_fields(self, names):
+        meta = self._meta
+        if not names:
+            return [meta.pk] + meta.scalarfields
+        fields = []
+        for name in names:
+            if name == meta.pkname():
+                field = meta.pk
+            else:
+                field = meta.dfields.get(name)
+            if field is None or field in meta.multifields:
+                raise FieldError('"%s" is not a scalar field of "%s"' %
+                                 (name, meta))
+            fields.append(field)
+        return fields
+
+    def _load_values(self, fields, callback):
+        q = self.load_only(*[field.name for field in fields])
+        q = q.construct()
+        if isinstance(q, EmptyQuery):
+            return []
+        return q.backend_query().values(fields, callback)
+
+    def _identity_ids(self):
+        # The primary keys of a query which filters on the primary key only
+        # and can be served by the session identity map.
+        session = self.session
+        if getattr(session, 'identity_map', None) is None:
+            return
+        if (not self.fargs or len(self.fargs) > 1 or self.eargs or
+                self.unions or self.intersections or self.text or
+                self.exclude_fields):
+            return
+        data = self.data
+        readonly = data.get('readonly')
+        if readonly or (readonly is None and session.readonly):
+            return
+        # load_only, load_related, sort_by, where, compact...
+        if any((v is not None for n, v in iteritems(data)
+                if n not in ('readonly', 'batch_related'))):
+            return
+        pk = self._meta.pk
+        name, value = tuple(self.fargs.items())[0]
+        if name not in (pk.name, pk.name + JSPLITTER + 'in'):
+            return
+        if not iterable(value):
+            value = (value,)
+        ids = []
+        backend = self.backend
+        for v in value:
+            if isinstance(v, Q):
+                return
+            try:
+                ids.append(pk.to_python(v, backend))
+            except (TypeError, ValueError):
+                return
+        ids = unique_tuple(ids)
+        if len(ids) > 1 and self._meta.ordering:
+            return
+        return ids
+
+    def _identity_items(self, ids):
+        identity_map = self.session.identity_map
+        meta = self._meta
+        items = []
+        missing = []
+        for id in ids:
+            instance = identity_map.get(meta, id)
+            if instance is None:
+                missing.append(id)
+            else:
+                items.append(instance)
+        if missing:
+            q = self._clone()
+            q.fargs = {meta.pkname(): missing}
+            result = yield q.backend_query().items()
+            items.extend(result)
+        yield items
+
     def _get_related_field(self, related):
         meta = self._meta
         if related in meta.dfields:
@@ -767,7 +1235,24 @@ an exception is raised.
             if hasattr(field, 'relmodel'):
                 return field
 
-    def _add_to_load_related(self, field, *related_fields):
+    def _get_related_path(self, related):
+        # List of fields of a, possibly nested, load_related path. Nested
+        # levels must be foreign keys.
+        bits = related.split(JSPLITTER)
+        field = self._get_related_field(bits[0])
+        if not field:
+            return
+        fields = [field]
+        for name in bits[1:]:
+            if field.type != 'related object':
+                return
+            field = field.relmodel._meta.dfields.get(name)
+            if field is None or field.type != 'related object':
+                return
+            fields.append(field)
+        return fields
+
+    def _add_to_load_related(self, related, *related_fields):
         rf = unique_tuple((v for v in related_fields))
         # we need to copy the related dictionary including its values
         if self.select_related:
@@ -775,8 +1260,12 @@ an exception is raised.
         else:
             d = {}
         self.data['select_related'] = d
-        if field.name in d:
-            d[field.name] = unique_tuple(d[field.name], rf)
+        if related in d:
+            d[related] = unique_tuple(d[related], rf)
         else:
-            d[field.name] = rf
+            d[related] = rf
+        # intermediate levels of nested relationships
+        bits = related.split(JSPLITTER)
+        for n in range(1, len(bits)):
+            d.setdefault(JSPLITTER.join(bits[:n]), ())
         return self
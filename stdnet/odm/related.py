@@ -199,11 +199,33 @@ class One2ManyRelatedManager(RelatedManager):
 relationships under the hood.
 If a model has a :class:`ForeignKey` field, instances of
 that model will have access to the related (foreign) objects
-via a simple attribute of the model.'''
+via a simple attribute of the model.
+
+Instances loaded by a :meth:`Query.prefetch_related` query are cached in the
+:attr:`related_instance` and returned by :meth:`all` without a database
+roundtrip.'''
     @property
     def relmodel(self):
         return self.field.relmodel
 
+    @property
+    def prefetch_model(self):
+        '''The model of instances loaded by :meth:`all`.'''
+        return self.model
+
+    def get_cache_name(self):
+        '''Name of the attribute of :attr:`related_instance` containing
+the instances loaded by :meth:`Query.prefetch_related`.'''
+        return '_%s_cache' % self.field.related_name
+
+    def all(self):
+        instance = self.related_instance
+        if instance is not None:
+            cache = getattr(instance, self.get_cache_name(), None)
+            if cache is not None:
+                return list(cache)
+        return super(One2ManyRelatedManager, self).all()
+
     def query(self, session=None):
         # Override query method to account for related instance if available
         query = super(One2ManyRelatedManager, self).query(session)
@@ -227,6 +249,10 @@ When a model has a :class:`ManyToManyField`, instances
 of that model will have access to the related objects via a simple
 attribute of the model.'''
 
+    @property
+    def prefetch_model(self):
+        return self.formodel
+
     def session_instance(self, name, value, session, **kwargs):
         if self.related_instance is None:
             raise ManyToManyError('Cannot use "%s" method from class' % name)
@@ -241,6 +267,8 @@ attribute of the model.'''
                                   % name)
         kwargs.update({self.name_formodel: value,
                        self.name_relmodel: self.related_instance})
+        # prefetched instances are not valid anymore
+        self.related_instance.__dict__.pop(self.get_cache_name(), None)
         return self.session(session), self.model(**kwargs)
 
     def add(self, value, session=None, **kwargs):
@@ -1,3 +1,4 @@
+import weakref
 from itertools import chain
 
 from stdnet import session_result, session_data, async
@@ -9,6 +10,8 @@ from .query import Q, Query, EmptyQuery
 
 
 __all__ = ['Session',
+           'ReadOnlySession',
+           'IdentityMap',
            'SessionModel',
            'Manager',
            'LazyProxy',
@@ -41,6 +44,55 @@ class ModelDictionary(dict):
         return getattr(model, '_meta', model)
 
 
+class IdentityMap(object):
+    '''A bounded map of weak references to the instances loaded by a
+:class:`Session`, keyed by model and primary key. It is used by
+:class:`Query` to serve primary key lookups, including foreign key access,
+without querying the backend server.
+
+.. attribute:: size
+
+    Maximum number of references in the map. When the map is full, the least
+    recently used reference is discarded.
+'''
+    def __init__(self, size=1000):
+        self.size = size
+        self._map = OrderedDict()
+
+    def __len__(self):
+        return len(self._map)
+
+    def __contains__(self, instance):
+        return self.get(instance._meta, instance.pkvalue()) is instance
+
+    def get(self, meta, pk):
+        '''Retrieve the instance of model ``meta`` with primary key ``pk``.
+Return ``None`` if not available.'''
+        key = (meta, pk)
+        ref = self._map.pop(key, None)
+        if ref is not None:
+            instance = ref()
+            if instance is not None:
+                self._map[key] = ref
+            return instance
+
+    def add(self, instance):
+        '''Add a fully loaded, persistent, ``instance`` to the map.'''
+        key = (instance._meta, instance.pkvalue())
+        self._map.pop(key, None)
+        self._map[key] = weakref.ref(instance)
+        while len(self._map) > self.size:
+            self._map.popitem(last=False)
+
+    def discard(self, meta, pks):
+        '''Remove instances of model ``meta`` with primary key in ``pks``.'''
+        for pk in pks:
+            self._map.pop((meta, pk), None)
+
+    def clear(self):
+        self._map.clear()
+
+
 class SessionModel(object):
 
     '''A :class:`SessionModel` is the container of all objects for a given
@@ -236,6 +288,7 @@ Process results after a commit.
                                     persistent=result.persistent)
                 instance.get_state().score = result.score
                 if instance.get_state().persistent:
+                    self._meta.snapshot(instance)
                     instances.append(instance)
         return instances, deleted, errors
 
@@ -477,6 +530,9 @@ class Transaction(object):
             sm = session.model(meta)
             saved, deleted, errors = sm.post_commit(result)
             exceptions.extend(errors)
+            if session.identity_map is not None:
+                session.identity_map.discard(
+                    meta, chain(deleted, (i.pkvalue() for i in saved)))
             if deleted:
                 self.deleted[meta] = deleted
                 if self.signal_delete:
@@ -524,12 +580,30 @@ class Session(object):
     .. attribute:: router
 
         Instance of the :class:`Router` which created this :class:`Session`.
+
+    .. attribute:: readonly
+
+        If ``True`` queries created by this :class:`Session` are
+        :meth:`Query.readonly` by default.
+
+        Default: ``False``.
+
+    .. attribute:: identity_map
+
+        Optional :class:`IdentityMap` of the instances loaded by this
+        :class:`Session`. It is created when the ``identity_map`` parameter,
+        the maximum number of instances in the map, is provided.
+
+        Default: ``None``.
     '''
 
-    def __init__(self, router):
+    def __init__(self, router, readonly=False, identity_map=None):
         self.transaction = None
+        self.readonly = readonly
+        self.identity_map = IdentityMap(identity_map) if identity_map else None
         self._models = OrderedDict()
         self._router = router
+        self._readonly_session = None
 
     def __str__(self):
         return str(self._router)
@@ -548,6 +622,14 @@ class Session(object):
     def router(self):
         return self._router
 
+    @property
+    def readonly_session(self):
+        '''The :class:`ReadOnlySession` attached to instances loaded by
+:meth:`Query.readonly` queries of this :class:`Session`.'''
+        if self._readonly_session is None:
+            self._readonly_session = ReadOnlySession(self)
+        return self._readonly_session
+
     @property
     def dirty(self):
         '''The set of instances in this :class:`Session` which have
@@ -631,7 +713,9 @@ which is equivalent to::
 
         If the instance is persistent (it is already stored in the database),
         an updated will be performed, otherwise a new entry will be created
-        once the :meth:`commit` method is invoked.
+        once the :meth:`commit` method is invoked. Instances loaded by a
+        :meth:`Query.readonly` query are attached to this :class:`Session`
+        and can be saved again.
         '''
         sm = self.model(instance)
         instance.session = self
@@ -701,10 +785,15 @@ of :class:`Model`.'''
         '''Remove ``instance`` from this :class:`Session`. If ``instance``
 is not given, it removes all instances from this :class:`Session`.'''
         if instance is not None:
+            if self.identity_map is not None:
+                self.identity_map.discard(instance._meta,
+                                          (instance.pkvalue(),))
             sm = self._models.get(instance._meta)
             if sm:
                 return sm.expunge(instance)
         else:
+            if self.identity_map is not None:
+                self.identity_map.clear()
             self._models.clear()
 
     def manager(self, model):
@@ -816,6 +905,55 @@ subclasses.'''
             return self
 
 
+class ReadOnlySession(object):
+    '''A read-only view of a :class:`Session`.
+
+It is attached to the instances loaded by :meth:`Query.readonly` queries,
+which are not tracked by the :class:`Session`. Related fields can still be
+loaded, via read-only queries, but the instances refuse to be saved or
+deleted, raising :class:`SessionNotAvailable`, until they are explicitly
+added to a :class:`Session`::
+
+    position = session.query(Position).readonly().get(id=1)
+    position.size = 20
+    position.save()             # raises SessionNotAvailable
+    session.add(position)       # attach it and save it
+
+.. attribute:: session
+
+    The :class:`Session` of this read-only view.
+'''
+    readonly = True
+
+    def __init__(self, session):
+        self.session = session
+
+    def __repr__(self):
+        return '%s: %s' % (self.__class__.__name__, self.router)
+    __str__ = __repr__
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def query(self, model, **kwargs):
+        '''Create a new read-only :class:`Query` for *model*.'''
+        return self.session.query(model, **kwargs).readonly()
+
+    def add(self, instance, *args, **kwargs):
+        raise SessionNotAvailable('%s was loaded by a read-only query. Add it '
+                                  'to a session to save it.' % instance)
+
+    def delete(self, instance_or_query):
+        raise SessionNotAvailable('%s was loaded by a read-only query. Add '
+                                  'it to a session to delete it.' %
+                                  instance_or_query)
+
+    def begin(self, **options):
+        raise InvalidTransaction('Cannot begin a transaction in a read-only '
+                                 'session.')
+    commit = begin
+
+
 class Manager(object):
 
     '''Before a :class:`StdModel` can be used in conjunction
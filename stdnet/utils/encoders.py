@@ -23,9 +23,14 @@ These are all available :class:`Encoder`:
 .. autoclass:: DateTimeConverter
 
 .. autoclass:: DateConverter
+
+.. autoclass:: Compressed
+   :members:
+   :member-order: bysource
 '''
 import json
 import logging
+import zlib
 
 from datetime import datetime, date
 from struct import pack, unpack
@@ -270,3 +275,68 @@ class CompactDouble(Encoder):
             return self.nan
         else:
             return unpack('>d', value)[0]
+
+
+class Compressed(Encoder):
+
+    '''An :class:`Encoder` which compresses, with zlib, the data serialized
+by another ``encoder``. Values smaller than ``threshold`` bytes are stored
+as they are, larger values are stored compressed and prefixed by the
+:attr:`header` byte. Values without the header, for example data stored
+before compression was enabled, are passed to the wrapped ``encoder``
+unchanged.
+
+:parameter encoder: the wrapped :class:`Encoder`.
+:parameter level: zlib compression level, from 1 (fastest) to 9 (best).
+:parameter threshold: minimum size, in bytes, of serialized values which
+    are compressed.
+
+.. attribute:: stats
+
+    Dictionary of compression statistics since the encoder was created:
+    the number of ``values`` serialized, how many of them were
+    ``compressed``, the ``raw_bytes`` serialized by :attr:`encoder` and
+    the ``stored_bytes`` sent to the server. Use :attr:`ratio` for the
+    overall compression ratio.
+'''
+    header = b'\x00'
+
+    def __init__(self, encoder, level=6, threshold=1024):
+        self.encoder = encoder
+        self.level = level
+        self.threshold = threshold
+        self.type = encoder.type
+        self.stats = {'values': 0, 'compressed': 0,
+                      'raw_bytes': 0, 'stored_bytes': 0}
+
+    @property
+    def ratio(self):
+        '''Ratio between stored and serialized bytes. ``1`` if no data has
+been serialized.'''
+        raw = self.stats['raw_bytes']
+        return float(self.stats['stored_bytes'])/raw if raw else 1
+
+    def dumps(self, x):
+        x = self.encoder.dumps(x)
+        if x is None:
+            return x
+        if not isinstance(x, bytes):
+            x = x.encode('utf-8')
+        stats = self.stats
+        stats['values'] += 1
+        stats['raw_bytes'] += len(x)
+        # values starting with the header are always compressed so that
+        # they are not confused with compressed data when loaded
+        if len(x) >= self.threshold or x[:1] == self.header:
+            x = self.header + zlib.compress(x, self.level)
+            stats['compressed'] += 1
+        stats['stored_bytes'] += len(x)
+        return x
+
+    def loads(self, x):
+        if isinstance(x, bytes) and x[:1] == self.header:
+            try:
+                x = zlib.decompress(x[1:])
+            except zlib.error:
+                pass
+        return self.encoder.loads(x)
@@ -0,0 +1,83 @@
+'''Lua scripts in accounting mode.'''
+from stdnet.backends.redisb import ScriptAccounting, get_script
+from stdnet.utils import test
+
+from examples.data import FinanceTest, Instrument, Position
+
+
+class TestScriptAccounting(test.TestCase):
+    multipledb = False
+
+    def test_update(self):
+        acc = ScriptAccounting()
+        acc.update('odmrun', [b'hgetall', 10, 30, b'smembers', 1, 10])
+        acc.update('odmrun', [b'hgetall', 5, 15])
+        self.assertEqual(acc.executions['odmrun'], 2)
+        self.assertEqual(acc.scripts['odmrun']['hgetall'], [15, 45])
+        self.assertEqual(acc.scripts['odmrun']['smembers'], [1, 10])
+        self.assertEqual(acc.last['odmrun'], {'hgetall': (5, 15)})
+        acc.update('move2set', ['type', 2, 2])
+        totals = acc.totals()
+        self.assertEqual(totals['hgetall'], [15, 45])
+        self.assertEqual(totals['type'], [2, 2])
+        acc.clear()
+        self.assertFalse(acc.scripts)
+
+    def test_strip(self):
+        acc = ScriptAccounting()
+        script = get_script('odmrun')
+        result = acc.strip(script, ([1, 2, 3], [b'sadd', 3, 3]))
+        self.assertEqual(result, [1, 2, 3])
+        self.assertEqual(acc.last['odmrun'], {'sadd': (3, 3)})
+
+    def test_accounting_script(self):
+        script = get_script('odmrun')
+        self.assertTrue(script.script in script.accounting_script)
+        self.assertNotEqual(script.sha1, script.accounting_sha1)
+        self.assertEqual(script.source(), script.script)
+        self.assertEqual(script.source(True), script.accounting_script)
+
+
+class TestAccountingMode(FinanceTest):
+    multipledb = 'redis'
+
+    @classmethod
+    def backend_params(cls):
+        return {'accounting': 1}
+
+    @classmethod
+    def after_setup(cls):
+        return cls.data.makePositions(cls)
+
+    def test_accounting(self):
+        self.assertIsInstance(self.backend.accounting, ScriptAccounting)
+        self.assertEqual(self.backend.client.pipeline().accounting,
+                         self.backend.accounting)
+
+    def test_load(self):
+        accounting = self.backend.accounting
+        qs = yield self.query(Instrument).all()
+        self.assertTrue(qs)
+        last = accounting.last['odmrun']
+        self.assertEqual(last['hgetall'], (len(qs), last['hgetall'][1]))
+
+    def test_load_related(self):
+        accounting = self.backend.accounting
+        qs = yield self.query(Position).load_related('instrument').all()
+        self.assertTrue(qs)
+        last = accounting.last['odmrun']
+        # one hgetall for each position and one for each distinct instrument
+        instruments = set((p.instrument_id for p in qs))
+        self.assertEqual(last['hgetall'][0], len(qs) + len(instruments))
+        for p in qs:
+            self.assertTrue(p._instrument_cache)
+
+    def test_commit(self):
+        accounting = self.backend.accounting
+        session = self.session()
+        with session.begin() as t:
+            t.add(Instrument(name='accounting', ccy='EUR', type='bond'))
+        yield t.on_result
+        last = accounting.last['odmrun']
+        self.assertTrue('hmset' in last)
+        self.assertTrue('sadd' in last)
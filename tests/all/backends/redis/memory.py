@@ -0,0 +1,83 @@
+'''Memory and key footprint report.'''
+from stdnet.backends.redisb import key_category
+from stdnet.utils import test
+
+from examples.data import FinanceTest, Instrument, Fund, Position
+
+
+class TestKeyCategory(test.TestCase):
+    multipledb = False
+
+    def test_categories(self):
+        self.assertEqual(key_category('obj:5'), 'objects')
+        self.assertEqual(key_category('obj:5:data'), 'structure:data')
+        self.assertEqual(key_category('struct:data'), 'structure:data')
+        self.assertEqual(key_category('id'), 'ids')
+        self.assertEqual(key_category('ids'), 'autoid')
+        self.assertEqual(key_category('idx:ccy:EUR'), 'index:ccy')
+        self.assertEqual(key_category('bmp:status:open'), 'bitmap:status')
+        self.assertEqual(key_category('cdx:ccy,type:["EUR","future"]'),
+                         'composite:ccy,type')
+        self.assertEqual(key_category('tri:name:ban'), 'trigram:name')
+        self.assertEqual(key_category('val:ccy'), 'values:ccy')
+        self.assertEqual(key_category('geo:location'), 'geo:location')
+        self.assertEqual(key_category('uni:name'), 'unique:name')
+        self.assertEqual(key_category('tmp:kjhfe7'), 'temp')
+        self.assertEqual(key_category('foo:bla'), 'other')
+
+
+class TestMemoryReport(FinanceTest):
+    multipledb = 'redis'
+
+    @classmethod
+    def after_setup(cls):
+        return cls.data.makePositions(cls)
+
+    def test_report(self):
+        report = yield self.mapper.instrument.backend.memory_report(
+            self.mapper.instrument._meta, sample=5)
+        self.assertEqual(report['model'], 'examples.instrument')
+        n = yield self.query(Instrument).count()
+        self.assertEqual(report['instances'], n)
+        categories = report['categories']
+        for name in ('objects', 'ids', 'index:ccy', 'index:type',
+                     'unique:name'):
+            self.assertTrue(name in categories)
+        objects = categories['objects']
+        self.assertEqual(objects['keys'], n)
+        self.assertEqual(objects['sampled'], min(n, 5))
+        self.assertEqual(report['keys'],
+                         sum((c['keys'] for c in categories.values())))
+        if report['bytes'] is None:
+            # the server has no MEMORY command
+            self.assertEqual(report['bytes_per_instance'], None)
+            self.assertEqual(report['index_overhead'], None)
+        else:
+            self.assertTrue(report['bytes'] > 0)
+            self.assertTrue(report['bytes_per_instance'] > 0)
+            self.assertTrue(report['index_overhead'] > 0)
+        self.assertEqual(report['non_compact'], [])
+
+    def test_non_compact(self):
+        session = self.session()
+        with session.begin() as t:
+            t.add(Fund(name='memory', ccy='EUR', description=200*'x'))
+        yield t.on_result
+        reports = yield self.mapper.memory_report(include=('examples.fund',),
+                                                  sample=1000)
+        self.assertEqual(list(reports), ['examples.fund'])
+        report = reports['examples.fund']
+        non_compact = report['non_compact']
+        self.assertEqual(len(non_compact), 1)
+        self.assertEqual(non_compact[0]['category'], 'objects')
+        self.assertEqual(non_compact[0]['type'], 'hash')
+        self.assertEqual(non_compact[0]['encoding'], 'hashtable')
+
+    def test_router(self):
+        reports = yield self.mapper.memory_report(exclude=('examples.fund',))
+        self.assertEqual(set(reports), set(('examples.instrument',
+                                            'examples.position')))
+        categories = reports['examples.position']['categories']
+        self.assertTrue('index:instrument_id' in categories)
+        self.assertTrue('index:fund_id' in categories)
+        self.assertFalse('other' in categories)
@@ -0,0 +1,121 @@
+'''Client side slow operation log.'''
+from stdnet import odm, backends, SlowLog, slow_operation
+from stdnet.utils import test
+
+from examples.models import SimpleModel
+from examples.data import FinanceTest, Position
+
+
+class TestSlowLog(test.TestCase):
+    multipledb = False
+
+    def test_threshold(self):
+        log = SlowLog(10)
+        self.assertEqual(log.threshold, 10)
+        self.assertFalse(log.log)
+        self.assertEqual(log.record(log.start(), 'load'), None)
+        self.assertEqual(len(log), 0)
+
+    def test_site_not_computed_below_threshold(self):
+        log = SlowLog(10)
+        calling_site = backends.calling_site
+        backends.calling_site = None
+        try:
+            self.assertEqual(log.record(log.start(), 'load'), None)
+        finally:
+            backends.calling_site = calling_site
+
+    def test_record(self):
+        log = SlowLog(0, size=2, log='false')
+        self.assertFalse(log.log)
+        record = log.record(log.start(), 'load', 'simplemodel',
+                            lambda: 'simplemodel:set-id()', 3)
+        self.assertIsInstance(record, slow_operation)
+        self.assertEqual(record.operation, 'load')
+        self.assertEqual(record.model, 'simplemodel')
+        self.assertEqual(record.fingerprint, 'simplemodel:set-id()')
+        self.assertEqual(record.size, 3)
+        self.assertTrue(record.duration >= 0)
+        self.assertTrue(__file__.startswith(record.site.split(':')[0]))
+        self.assertEqual(len(log), 1)
+
+    def test_bounded(self):
+        log = SlowLog(0, size=2)
+        for n in range(5):
+            log.record(log.start(), 'count', 'simplemodel', 'a', n)
+        self.assertEqual(len(log), 2)
+        self.assertEqual([r.size for r in log], [3, 4])
+        self.assertEqual(log.fingerprints[('count', 'simplemodel', 'a')][0],
+                         5)
+        log.clear()
+        self.assertEqual(len(log), 0)
+        self.assertFalse(log.fingerprints)
+
+    def test_most_common(self):
+        log = SlowLog(0)
+        log.record(log.start(), 'load', 'a', 'x')
+        log.record(log.start(), 'load', 'a', 'x')
+        log.record(log.start(), 'load', 'a', 'y')
+        data = log.most_common()
+        self.assertEqual(len(data), 2)
+        self.assertEqual(len(log.most_common(1)), 1)
+
+    def test_fingerprint(self):
+        models = odm.Router('redis://')
+        models.register(SimpleModel)
+        qs = models.simplemodel.query()
+        fp1 = qs.filter(group='a').construct().fingerprint()
+        fp2 = qs.filter(group='b').construct().fingerprint()
+        fp3 = qs.filter(group__in=('a', 'b', 'c')).construct().fingerprint()
+        self.assertEqual(fp1, fp2)
+        self.assertEqual(fp1, fp3)
+        self.assertTrue('simplemodel' in fp1)
+        self.assertTrue('value' in fp1)
+        self.assertFalse("'a'" in fp1)
+        fp4 = qs.filter(code='a').construct().fingerprint()
+        self.assertNotEqual(fp1, fp4)
+
+
+class TestBackendSlowLog(FinanceTest):
+
+    @classmethod
+    def backend_params(cls):
+        return {'slowlog': 0}
+
+    @classmethod
+    def after_setup(cls):
+        return cls.data.makePositions(cls)
+
+    def test_slowlog(self):
+        slowlog = self.backend.slowlog
+        self.assertIsNotNone(slowlog)
+        self.assertEqual(slowlog.threshold, 0)
+
+    def test_load(self):
+        slowlog = self.backend.slowlog
+        slowlog.clear()
+        qs = yield self.query(Position).filter(size__gt=0).all()
+        self.assertTrue(qs)
+        operations = [r.operation for r in slowlog]
+        self.assertTrue('count' in operations)
+        self.assertTrue('load' in operations)
+        record = [r for r in slowlog if r.operation == 'load'][0]
+        self.assertEqual(record.model, str(Position._meta))
+        self.assertEqual(record.size, len(qs))
+        self.assertTrue('gt' in record.fingerprint)
+        self.assertFalse(record.site.startswith(backends.STDNET_PATH))
+
+    def test_commit(self):
+        slowlog = self.backend.slowlog
+        slowlog.clear()
+        session = self.session()
+        positions = yield session.query(Position).all()
+        slowlog.clear()
+        with session.begin() as t:
+            for p in positions:
+                p.size = 2*p.size
+                t.add(p)
+        yield t.on_result
+        records = [r for r in slowlog if r.operation == 'commit']
+        self.assertEqual(len(records), 1)
+        self.assertTrue(str(Position._meta) in records[0].fingerprint)
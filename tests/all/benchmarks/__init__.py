@@ -1,18 +1,295 @@
-import os
+'''Benchmark scenarios for stdnet.
 
-from stdnet.utils import test
+A benchmark is a :class:`Scenario` subclass, it is registered automatically
+when the module where it is defined is imported. Scenarios are grouped by
+topic in the modules listed in :data:`SCENARIO_MODULES` and are executed
+against a running redis-server by the ``runbench.py`` script in the root
+directory of the distribution::
 
-from examples.models import Instrument, Fund, Position, PortfolioView,\
-                             UserDefaultView
-from examples.data import finance_data, INSTS_TYPES, CCYS_TYPES
+    python runbench.py run -s redis://127.0.0.1:6379?db=7 -o results.json
 
+The results are a JSON document with ops/sec, median and 99th percentile
+latencies and the memory used by the keys created by each scenario. To flag
+regressions against a previously saved run::
 
-class Benchmarks(test.TestWrite):
-    __benchmark__ = True
-    data_cls = finance_data
-    models = (Instrument, Fund, Position)
-    
-    def test_create(self):
-        session = yield self.data.create(self)
-        
-        
\ No newline at end of file
+    python runbench.py compare baseline.json results.json --tolerance 0.2
+
+The ``compare`` command exits with status ``1`` when at least one metric
+is worse than the baseline by more than ``tolerance``.
+'''
+import re
+import sys
+import math
+import time
+import platform
+from collections import namedtuple
+from importlib import import_module
+
+import stdnet
+from stdnet import getdb, odm
+from stdnet.utils import test, gen_unique_id, iteritems
+
+if sys.platform == 'win32':     # pragma    nocover
+    default_timer = time.clock
+else:
+    default_timer = time.time
+
+
+__all__ = ['Scenario', 'SCENARIO_MODULES', 'scenarios', 'percentile',
+           'statistics', 'memory_usage', 'run_scenario', 'run',
+           'comparison', 'compare', 'format_comparison']
+
+
+SCENARIO_MODULES = ('commit', 'query', 'structures', 'search', 'columnts')
+
+# metrics used when comparing two runs and if an higher value is better
+METRICS = (('ops_per_sec', True),
+           ('p50', False),
+           ('p99', False),
+           ('bytes', False))
+
+comparison = namedtuple('comparison',
+                        'name metric baseline current change regression')
+
+_scenarios = {}
+
+
+class ScenarioType(type):
+
+    def __new__(cls, name, bases, attrs):
+        abstract = attrs.pop('abstract', False)
+        new_class = super(ScenarioType, cls).__new__(cls, name, bases, attrs)
+        if not abstract:
+            if not attrs.get('name'):
+                module = new_class.__module__.split('.')[-1]
+                new_class.name = '%s.%s' % (module, name.lower())
+            _scenarios[new_class.name] = new_class
+        return new_class
+
+
+class Scenario(ScenarioType('_SB', (object,), {'abstract': True})):
+    '''A benchmark scenario.
+
+The :meth:`setup` method is called once, before the timed repetitions, while
+:meth:`before` is called, and not timed, before each repetition of
+:meth:`run`. All three methods can be generators yielding asynchronous
+results, in the same way as test functions do.
+
+.. attribute:: name
+
+    Unique name of the scenario. If not given it is built from the module and
+    the class names.
+
+.. attribute:: models
+
+    Tuple of models registered with :attr:`mapper`.
+
+.. attribute:: data_cls
+
+    The :class:`stdnet.utils.test.DataGenerator` class which creates
+    :attr:`data`.
+
+.. attribute:: number
+
+    Number of operations performed by one call to :meth:`run`. Used to
+    calculate ops/sec and per-operation latencies.
+'''
+    abstract = True
+    name = None
+    models = ()
+    data_cls = test.DataGenerator
+    sizes = None
+    number = 1
+
+    def __init__(self, backend, size='small'):
+        self.backend = backend
+        self.mapper = odm.Router(backend)
+        for model in self.models:
+            self.mapper.register(model)
+        self.data = self.data_cls(size, self.sizes)
+
+    def __repr__(self):
+        return self.name
+    __str__ = __repr__
+
+    def session(self):
+        return self.mapper.session()
+
+    def assertEqual(self, x, y):
+        '''Allow :class:`stdnet.utils.test.DataGenerator` methods written
+for test cases to be used when setting up scenarios.'''
+        assert x == y, '%r != %r' % (x, y)
+
+    def keys(self):
+        '''Redis keys holding the data of this scenario, used for measuring
+the memory footprint and for cleaning up. By default all keys in the backend
+namespace and the keys of the stand-alone structure ``instance``, if
+available.'''
+        client = self.backend.client
+        keys = client.keys('%s*' % self.backend.namespace)
+        instance = getattr(self, 'instance', None)
+        if isinstance(instance, odm.Structure):
+            # stand-alone structures are not in the backend namespace
+            keys.extend(client.keys('%s*' % instance.backend_structure().id))
+        return keys
+
+    def setup(self):
+        '''Create the data needed by :meth:`run`.'''
+        pass
+
+    def before(self):
+        '''Called before each repetition of :meth:`run`.'''
+        pass
+
+    def run(self):
+        '''The operations to benchmark.'''
+        raise NotImplementedError
+
+
+def scenarios(pattern=None):
+    '''Load :data:`SCENARIO_MODULES` and return a list of :class:`Scenario`
+classes sorted by name.
+
+:parameter pattern: optional regular expression for selecting scenarios
+    by name.
+'''
+    for name in SCENARIO_MODULES:
+        import_module('%s.%s' % (__name__, name))
+    pattern = re.compile(pattern) if pattern else None
+    return [_scenarios[name] for name in sorted(_scenarios)
+            if not pattern or pattern.search(name)]
+
+
+def percentile(values, p):
+    '''The ``p`` percentile, with ``p`` between 0 and 100, of ``values``
+using linear interpolation between closest ranks.'''
+    values = sorted(values)
+    if not values:
+        return None
+    k = (len(values) - 1)*p/100.
+    f = int(math.floor(k))
+    c = int(math.ceil(k))
+    if f == c:
+        return values[f]
+    return values[f] + (values[c] - values[f])*(k - f)
+
+
+def statistics(durations, number=1):
+    '''Statistics from a list of ``durations`` of repetitions each
+performing ``number`` operations. Latencies are per operation.'''
+    total = sum(durations)
+    ops = number*len(durations)
+    latencies = [d/number for d in durations]
+    return {'repeat': len(durations),
+            'number': number,
+            'total': total,
+            'ops_per_sec': ops/total if total else None,
+            'mean': total/ops if ops else None,
+            'p50': percentile(latencies, 50),
+            'p99': percentile(latencies, 99)}
+
+
+def memory_usage(client, keys):
+    '''Bytes used by ``keys`` as reported by the redis ``MEMORY USAGE``
+command. Return ``None`` when the command is not available (redis < 4).'''
+    if not keys:
+        return 0
+    pipe = client.pipeline()
+    for key in keys:
+        pipe.execute_command('MEMORY', 'USAGE', key)
+    try:
+        return sum((int(v or 0) for v in pipe.execute()))
+    except Exception:
+        return None
+
+
+def run_scenario(scenario_cls, backend, size='small', repeat=20, warmup=2):
+    '''Run a :class:`Scenario` and return a dictionary of statistics.
+
+:parameter backend: a connection string for a redis server. The scenario
+    runs on a new namespace and its keys are deleted once finished.
+:parameter size: the :class:`stdnet.utils.test.DataGenerator` size code.
+:parameter repeat: number of timed repetitions.
+:parameter warmup: number of repetitions run before timing.
+'''
+    backend = getdb(backend, namespace='stdbench%s-' % gen_unique_id())
+    if backend.is_async():
+        raise ValueError('Benchmarks require synchronous bindings')
+    scenario = scenario_cls(backend, size)
+    client = backend.client
+    try:
+        backend.execute(scenario.setup())
+        durations = []
+        for n in range(warmup + repeat):
+            backend.execute(scenario.before())
+            start = default_timer()
+            backend.execute(scenario.run())
+            if n >= warmup:
+                durations.append(default_timer() - start)
+        result = statistics(durations, scenario.number)
+        result['bytes'] = memory_usage(client, scenario.keys())
+        return result
+    finally:
+        keys = scenario.keys()
+        if keys:
+            client.delete(*keys)
+
+
+def run(backend, size='small', repeat=20, warmup=2, pattern=None,
+        stream=None):
+    '''Run all :func:`scenarios` matching ``pattern`` and return a
+JSON-serializable dictionary with the results.'''
+    server = getdb(backend)
+    info = server.client.info()
+    results = {}
+    for scenario_cls in scenarios(pattern):
+        if stream:
+            stream.write('%s ... ' % scenario_cls.name)
+            stream.flush()
+        result = run_scenario(scenario_cls, backend, size, repeat, warmup)
+        results[scenario_cls.name] = result
+        if stream:
+            stream.write('%.1f ops/sec\n' % (result['ops_per_sec'] or 0))
+    return {'stdnet': stdnet.__version__,
+            'python': platform.python_version(),
+            'redis': info.get('redis_version'),
+            'size': size,
+            'repeat': repeat,
+            'timestamp': time.time(),
+            'results': results}
+
+
+def compare(baseline, current, tolerance=0.1):
+    '''Compare the ``current`` benchmark results against a ``baseline``.
+
+:parameter baseline: a dictionary returned by :func:`run`.
+:parameter current: a dictionary returned by :func:`run`.
+:parameter tolerance: relative change above which a worse metric is
+    flagged as a regression.
+:return: a list of :data:`comparison` for all scenarios available in both
+    runs.
+'''
+    base_results = baseline['results']
+    rows = []
+    for name, result in sorted(iteritems(current['results'])):
+        base = base_results.get(name)
+        if not base:
+            continue
+        for metric, higher_is_better in METRICS:
+            b, c = base.get(metric), result.get(metric)
+            if not b or c is None:
+                continue
+            change = (c - b)/float(b)
+            worse = -change if higher_is_better else change
+            rows.append(comparison(name, metric, b, c, change,
+                                   worse > tolerance))
+    return rows
+
+
+def format_comparison(rows):
+    '''Format a list of :data:`comparison` as lines of text.'''
+    for row in rows:
+        flag = 'REGRESSION' if row.regression else ''
+        yield '%-40s %-12s %14.6g %14.6g %+8.1f%% %s' % (
+            row.name, row.metric, row.baseline, row.current,
+            100*row.change, flag)
@@ -0,0 +1,45 @@
+'''ColumnTS add, range and statistics.'''
+from stdnet.apps.columnts import ColumnTS
+
+from tests.all.apps.columnts.main import ColumnData
+
+from . import Scenario
+
+
+class ColumnTSScenario(Scenario):
+    abstract = True
+    data_cls = ColumnData
+    structure = ColumnTS
+
+    def setup(self):
+        self.instance = yield self.data.data1.create(self)
+
+
+class Add(ColumnTSScenario):
+
+    def setup(self):
+        self.number = len(self.data.data1.values)
+        return super(Add, self).setup()
+
+    def before(self):
+        # deleting a ColumnTS from a session leaves the field keys behind
+        yield self.backend.client.delete(*self.keys())
+        self.instance = self.mapper.register(self.structure())
+
+    def run(self):
+        with self.session().begin() as t:
+            t.add(self.instance)
+            self.instance.update(self.data.data1.values)
+        return t.on_result
+
+
+class Range(ColumnTSScenario):
+
+    def run(self):
+        return self.instance.irange()
+
+
+class Stats(ColumnTSScenario):
+
+    def run(self):
+        return self.instance.istats(0, -1)
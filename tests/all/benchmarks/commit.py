@@ -0,0 +1,169 @@
+'''Commit throughput for new, updated and deleted instances of a small
+and a wide model.'''
+from stdnet import odm
+from stdnet.utils import test, zip
+
+from examples.models import Instrument
+from examples.data import INSTS_TYPES, CCYS_TYPES
+
+from . import Scenario
+
+
+class Wide(odm.StdModel):
+    name = odm.SymbolField(unique=True)
+    ccy = odm.SymbolField()
+    type = odm.SymbolField()
+    group = odm.SymbolField()
+    description = odm.CharField()
+    notes = odm.CharField()
+    value1 = odm.FloatField()
+    value2 = odm.FloatField()
+    value3 = odm.FloatField()
+    value4 = odm.FloatField()
+    count1 = odm.IntegerField()
+    count2 = odm.IntegerField()
+    dt = odm.DateField()
+    ok = odm.BooleanField()
+    data = odm.JSONField()
+    extra = odm.JSONField(as_string=False)
+
+
+class Indexed(odm.StdModel):
+    name = odm.SymbolField(unique=True)
+    ccy = odm.SymbolField()
+    type = odm.SymbolField()
+    group = odm.SymbolField()
+    sector = odm.SymbolField()
+    country = odm.SymbolField()
+    exchange = odm.SymbolField()
+    rating = odm.SymbolField()
+    description = odm.CharField()
+
+
+class CommitData(test.DataGenerator):
+    sizes = {'tiny': 10,
+             'small': 100,
+             'normal': 1000,
+             'big': 10000,
+             'huge': 100000}
+
+    def generate(self):
+        self.names = self.populate('string', min_len=10, max_len=20)
+        self.ccys = self.populate('choice', choice_from=CCYS_TYPES)
+        self.types = self.populate('choice', choice_from=INSTS_TYPES)
+        self.descriptions = self.populate('string', min_len=20, max_len=60)
+        self.floats = self.populate('float')
+        self.integers = self.populate('integer', start=0, end=1000)
+        self.dates = self.populate('date')
+
+    def small(self):
+        for name, ccy, type, description in zip(self.names, self.ccys,
+                                                self.types,
+                                                self.descriptions):
+            yield Instrument(name=name, ccy=ccy, type=type,
+                             description=description)
+
+    def indexed(self):
+        for name, ccy, type, description in zip(self.names, self.ccys,
+                                                self.types,
+                                                self.descriptions):
+            yield Indexed(name=name, ccy=ccy, type=type, group=ccy+type,
+                          sector=type, country=ccy, exchange=ccy,
+                          rating=type, description=description)
+
+    def wide(self):
+        for name, ccy, type, description, value, count, dt in zip(
+                self.names, self.ccys, self.types, self.descriptions,
+                self.floats, self.integers, self.dates):
+            yield Wide(name=name, ccy=ccy, type=type, group=ccy+type,
+                       description=description, notes=description,
+                       value1=value, value2=2*value, value3=3*value,
+                       value4=4*value, count1=count, count2=2*count,
+                       dt=dt, ok=count % 2 == 0,
+                       data={'count': count, 'value': value},
+                       extra={'name': name, 'ccy': ccy, 'count': count})
+
+
+class CommitScenario(Scenario):
+    abstract = True
+    models = (Instrument, Wide, Indexed)
+    data_cls = CommitData
+    model = Instrument
+
+    def setup(self):
+        self.number = self.data.size
+
+    def instances(self):
+        if self.model is Wide:
+            return self.data.wide()
+        elif self.model is Indexed:
+            return self.data.indexed()
+        else:
+            return self.data.small()
+
+    def create(self):
+        with self.session().begin() as t:
+            for instance in self.instances():
+                t.add(instance)
+        yield t.on_result
+        self.saved = t.saved[self.model]
+
+
+class NewSmall(CommitScenario):
+
+    def before(self):
+        return self.backend.flush()
+
+    def run(self):
+        return self.create()
+
+
+class NewWide(NewSmall):
+    model = Wide
+
+
+class UpdateSmall(CommitScenario):
+
+    def setup(self):
+        super(UpdateSmall, self).setup()
+        yield self.create()
+        self.value = 0
+
+    def before(self):
+        self.value += 1
+        description = 'updated %s' % self.value
+        for instance in self.saved:
+            instance.description = description
+
+    def run(self):
+        with self.session().begin() as t:
+            for instance in self.saved:
+                t.add(instance)
+        yield t.on_result
+
+
+class UpdateWide(UpdateSmall):
+    model = Wide
+
+
+class UpdateIndexed(UpdateSmall):
+    '''Update a field which is not an index of a model with eight
+indices.'''
+    model = Indexed
+
+
+class DeleteSmall(CommitScenario):
+
+    def before(self):
+        yield self.backend.flush()
+        yield self.create()
+
+    def run(self):
+        with self.session().begin() as t:
+            for instance in self.saved:
+                t.delete(instance)
+        yield t.on_result
+
+
+class DeleteWide(DeleteSmall):
+    model = Wide
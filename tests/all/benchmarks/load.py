@@ -0,0 +1,321 @@
+'''Concurrent load driver.
+
+Several clients, each with its own connection to the same redis server,
+replay a weighted mix of stdnet operations on the finance example models
+(:class:`examples.models.Instrument`, :class:`examples.models.Fund` and
+:class:`examples.models.Position`) for a given duration. The run is repeated
+for each level of concurrency and the result is a throughput vs concurrency
+curve with per-operation latency percentiles and error rates::
+
+    python runbench.py load -c 1,2,4,8 --mode process --duration 10
+
+Clients are threads or processes. When a target ``rate`` is given, it is
+the total number of operations per second, evenly split across clients, and
+latencies are measured from the scheduled start of each operation so that
+a saturated server is not hidden by clients waiting on slow responses.
+Clients stop at the end of the duration and the scheduled operations which
+could not start in time are reported as ``missed``.
+'''
+import math
+import time
+import threading
+import multiprocessing
+from random import Random
+
+from stdnet import getdb, odm
+from stdnet.utils import gen_unique_id, iteritems, range
+
+from examples.models import Instrument, Fund, Position
+
+from . import default_timer, percentile
+from .query import QueryScenario
+
+
+__all__ = ['OPERATIONS', 'DEFAULT_MIX', 'parse_mix', 'LoadClient',
+           'summary', 'run_load']
+
+
+OPERATIONS = {}
+DEFAULT_MIX = ('get:30,filter:20,range:10,related:10,count:5,update:15,'
+               'create:7,delete:3')
+MODES = ('thread', 'process')
+
+
+def operation(name):
+
+    def _(f):
+        OPERATIONS[name] = f
+        return f
+    return _
+
+
+@operation('get')
+def get_instrument(client):
+    return client.mapper.instrument.get(id=client.choice(client.instruments))
+
+
+@operation('filter')
+def filter_positions(client):
+    fund = client.choice(client.funds)
+    return client.mapper.position.filter(fund=fund).all()
+
+
+@operation('range')
+def range_positions(client):
+    size = client.random.randint(-100000, 100000)
+    return client.mapper.position.filter(size__gt=size)[:20]
+
+
+@operation('related')
+def load_related(client):
+    instrument = client.choice(client.instruments)
+    query = client.mapper.position.filter(instrument=instrument)
+    return query.load_related('instrument').all()
+
+
+@operation('count')
+def count_instruments(client):
+    return client.mapper.instrument.filter(ccy='EUR').count()
+
+
+@operation('update')
+def update_position(client):
+    position = client.mapper.position.get(id=client.choice(client.positions))
+    position.size = client.random.randint(-100000, 100000)
+    return position.save()
+
+
+@operation('create')
+def create_position(client):
+    position = client.mapper.position.new(
+        instrument=client.choice(client.instruments),
+        fund=client.choice(client.funds),
+        dt=client.dt,
+        size=client.random.randint(-100000, 100000))
+    client.created.append(position)
+    return position
+
+
+@operation('delete')
+def delete_position(client):
+    if client.created:
+        return client.created.pop().delete()
+    else:
+        return create_position(client)
+
+
+def parse_mix(mix):
+    '''Parse a mix of operations ``name:weight,name:weight,...`` into a
+list of ``(name, weight)`` pairs. Names must be in :data:`OPERATIONS`.'''
+    result = []
+    for entry in mix.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, weight = entry.partition(':')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError('Unknown load operation "%s"' % name)
+        weight = float(weight) if weight else 1
+        if weight < 0:
+            raise ValueError('Negative weight for load operation "%s"' % name)
+        result.append((name, weight))
+    if not sum((w for _, w in result)):
+        raise ValueError('Empty load mix "%s"' % mix)
+    return result
+
+
+class LoadClient(object):
+    '''A client replaying a mix of :data:`OPERATIONS` against ``backend``.
+
+:parameter backend: a synchronous :class:`stdnet.BackendDataServer`.
+:parameter seed: optional seed for the random number generator.
+:parameter positions: optional list of position ids to update. Positions
+    created, and later deleted, by other clients must not be included.
+'''
+    def __init__(self, backend, seed=None, positions=None):
+        self.backend = backend
+        self.random = Random(seed)
+        self.mapper = odm.Router(backend)
+        for model in (Instrument, Fund, Position):
+            self.mapper.register(model)
+        self.created = []
+        ids = lambda m: [i.id for i in m.query().load_only('id').all()]
+        self.instruments = ids(self.mapper.instrument)
+        self.funds = ids(self.mapper.fund)
+        query = self.mapper.position.query()
+        if positions is None:
+            positions = [p.id for p in query.load_only('id').all()]
+        self.positions = positions
+        position = query.get(id=positions[0]) if positions else None
+        self.dt = position.dt if position else None
+
+    def choice(self, sequence):
+        return self.random.choice(sequence)
+
+    def choose(self, mix, total):
+        value = self.random.uniform(0, total)
+        for name, weight in mix:
+            value -= weight
+            if value <= 0:
+                break
+        return name
+
+    def run(self, mix, duration, rate=None):
+        '''Replay ``mix`` for ``duration`` seconds, at ``rate`` operations
+per second if given. Return a dictionary with the ``elapsed`` seconds, the
+number of scheduled operations ``missed`` because the duration was over and
+the latencies and errors by operation in ``operations``.'''
+        total = sum((w for _, w in mix))
+        interval = 1./rate if rate else 0
+        stats = dict(((name, {'latencies': [], 'errors': 0, 'error': None})
+                      for name, _ in mix))
+        start = default_timer()
+        end = start + duration
+        scheduled = start
+        slots = missed = 0
+        while scheduled < end:
+            now = default_timer()
+            if now >= end:
+                if interval:
+                    missed = int(math.ceil((end - scheduled)/interval))
+                break
+            if interval:
+                if scheduled > now:
+                    time.sleep(scheduled - now)
+                begin = scheduled
+                slots += 1
+                scheduled = start + slots*interval
+            else:
+                begin = scheduled = now
+            name = self.choose(mix, total)
+            stat = stats[name]
+            try:
+                OPERATIONS[name](self)
+            except Exception as e:
+                stat['errors'] += 1
+                stat['error'] = '%s: %s' % (e.__class__.__name__, e)
+            else:
+                stat['latencies'].append(default_timer() - begin)
+        return {'elapsed': default_timer() - start,
+                'missed': missed,
+                'operations': stats}
+
+
+def worker(server, namespace, positions, mix, duration, rate, seed,
+           queue=None):
+    backend = getdb(server, namespace=namespace)
+    stats = LoadClient(backend, seed, positions).run(mix, duration, rate)
+    if queue is not None:
+        queue.put(stats)
+    return stats
+
+
+def spawn(mode, concurrency, *args):
+    results = []
+    if mode == 'thread':
+        target = lambda *a: results.append(worker(*a))
+        workers = [threading.Thread(target=target, args=args + (n,))
+                   for n in range(concurrency)]
+    else:
+        queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=worker,
+                                           args=args + (n, queue))
+                   for n in range(concurrency)]
+    for w in workers:
+        w.start()
+    if mode != 'thread':
+        results = [queue.get() for _ in workers]
+    for w in workers:
+        w.join()
+    return results
+
+
+def _summary(latencies, errors, elapsed):
+    count = len(latencies)
+    calls = count + errors
+    return {'count': count,
+            'errors': errors,
+            'error_rate': errors/float(calls) if calls else 0,
+            'throughput': count/elapsed if elapsed else None,
+            'mean': sum(latencies)/count if count else None,
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies) if latencies else None}
+
+
+def summary(concurrency, results):
+    '''Merge the ``results`` of :meth:`LoadClient.run` for ``concurrency``
+clients into latency percentiles and error rates, in total and by operation.
+Throughput is measured over the longest ``elapsed`` time of the clients.'''
+    operations = {}
+    errors = {}
+    last_errors = {}
+    elapsed = max((r['elapsed'] for r in results)) if results else 0
+    for result in results:
+        for name, stat in iteritems(result['operations']):
+            operations.setdefault(name, []).extend(stat['latencies'])
+            errors[name] = errors.get(name, 0) + stat['errors']
+            if stat['error']:
+                last_errors[name] = stat['error']
+    result = _summary([l for v in operations.values() for l in v],
+                      sum(errors.values()), elapsed)
+    result['concurrency'] = concurrency
+    result['elapsed'] = elapsed
+    result['missed'] = sum((r['missed'] for r in results))
+    result['operations'] = {}
+    for name, latencies in iteritems(operations):
+        op = _summary(latencies, errors[name], elapsed)
+        if name in last_errors:
+            op['last_error'] = last_errors[name]
+        result['operations'][name] = op
+    return result
+
+
+def run_load(server, concurrency=(1, 2, 4, 8), mode='thread', duration=10,
+             rate=None, mix=DEFAULT_MIX, size='small', stream=None):
+    '''Run the load test for each level of ``concurrency``.
+
+:parameter server: connection string of a redis server. Data is created
+    in a new namespace which is flushed once finished.
+:parameter concurrency: iterable over the number of concurrent clients.
+:parameter mode: ``thread`` or ``process``.
+:parameter duration: seconds of load for each level of concurrency.
+:parameter rate: optional total target of operations per second.
+:parameter mix: a weighted mix of :data:`OPERATIONS`, see :func:`parse_mix`.
+:parameter size: size of the :class:`examples.data.finance_data`.
+:return: a JSON-serializable dictionary with the throughput vs concurrency
+    ``curve``.
+'''
+    if mode not in MODES:
+        raise ValueError('Load mode must be one of %s' % ', '.join(MODES))
+    operations = parse_mix(mix)
+    namespace = 'stdload%s-' % gen_unique_id()
+    backend = getdb(server, namespace=namespace)
+    if backend.is_async():
+        raise ValueError('Load tests require synchronous bindings')
+    backend.execute(QueryScenario(backend, size).setup())
+    positions = LoadClient(backend).positions
+    curve = []
+    try:
+        for n in concurrency:
+            client_rate = float(rate)/n if rate else None
+            results = spawn(mode, n, server, namespace, positions,
+                            operations, duration, client_rate)
+            result = summary(n, results)
+            curve.append(result)
+            if stream:
+                stream.write('%3d clients: %10.1f ops/sec, p99 %.5f secs, '
+                             '%.2f%% errors, %d missed\n' %
+                             (n, result['throughput'], result['p99'] or 0,
+                              100*result['error_rate'], result['missed']))
+                stream.flush()
+    finally:
+        backend.flush()
+    return {'mode': mode,
+            'duration': duration,
+            'rate': rate,
+            'size': size,
+            'mix': dict(operations),
+            'curve': curve}
@@ -0,0 +1,352 @@
+'''Query latency by shape on the finance example models.'''
+from stdnet import odm
+from stdnet.utils import test, zip
+
+from examples.models import Instrument, Fund, Position, Ticket
+from examples.data import finance_data, INSTS_TYPES
+
+from . import Scenario
+
+
+class QueryScenario(Scenario):
+    abstract = True
+    models = (Instrument, Fund, Position)
+    data_cls = finance_data
+
+    def setup(self):
+        return self.data.makePositions(self)
+
+    def run(self):
+        return self.query().all()
+
+
+class Equality(QueryScenario):
+
+    def query(self):
+        return self.mapper.instrument.filter(ccy='EUR')
+
+
+class DoubleEquality(QueryScenario):
+    '''Equality on both fields of the ``ccy, type`` composite index.'''
+
+    def query(self):
+        return self.mapper.instrument.filter(ccy='EUR', type=INSTS_TYPES[0])
+
+
+class Range(QueryScenario):
+
+    def query(self):
+        return self.mapper.position.filter(size__gt=0)
+
+
+class Union(QueryScenario):
+
+    def query(self):
+        return self.mapper.instrument.filter(type__in=INSTS_TYPES[:3])
+
+
+class Exclude(QueryScenario):
+
+    def query(self):
+        return self.mapper.instrument.exclude(type='bond')
+
+
+class Sort(QueryScenario):
+
+    def query(self):
+        return self.mapper.position.query().sort_by('-size')
+
+
+class MultiSort(QueryScenario):
+    '''First page of positions sorted by fund and descending size.'''
+
+    def query(self):
+        return self.mapper.position.query().sort_by('fund', '-size')
+
+    def run(self):
+        return self.query()[:50]
+
+
+class MultiSortPython(MultiSort):
+    '''Same as :class:`MultiSort` sorting all positions in python.'''
+
+    def run(self):
+        positions = yield self.mapper.position.query().all()
+        positions = sorted(positions, key=lambda p: (p.fund_id, -p.size))
+        yield positions[:50]
+
+
+class Slice(QueryScenario):
+
+    def query(self):
+        return self.mapper.position.query().sort_by('size')
+
+    def run(self):
+        return self.query()[10:30]
+
+
+class LoadOnly(QueryScenario):
+
+    def query(self):
+        return self.mapper.instrument.query().load_only('name', 'ccy')
+
+
+class LoadRelated(QueryScenario):
+
+    def query(self):
+        return self.mapper.position.query().load_related('instrument')
+
+
+class Tracked(QueryScenario):
+    '''Load all positions in a long running session which tracks the
+loaded instances.'''
+    readonly = False
+
+    def setup(self):
+        self.worker = self.mapper.session(readonly=self.readonly)
+        return self.data.makePositions(self)
+
+    def run(self):
+        return self.worker.query(Position).all()
+
+
+class ReadOnly(Tracked):
+    '''Same as :class:`Tracked` with a read-only session.'''
+    readonly = True
+
+
+class RelatedAccess(QueryScenario):
+    '''Access the instrument of all positions without
+:meth:`stdnet.odm.Query.load_related`. Instruments of all positions are
+loaded on first access.'''
+    batch = True
+
+    def query(self):
+        return self.mapper.position.query().batch_related(self.batch)
+
+    def run(self):
+        positions = yield self.query().all()
+        for p in positions:
+            yield p.instrument
+
+
+class RelatedAccessUnbatched(RelatedAccess):
+    '''Same as :class:`RelatedAccess` with a query for each position.'''
+    batch = False
+
+
+class PrefetchRelated(QueryScenario):
+    '''Load all funds and their positions with
+:meth:`stdnet.odm.Query.prefetch_related`.'''
+
+    def query(self):
+        return self.mapper.fund.query().prefetch_related('positions')
+
+    def run(self):
+        funds = yield self.query().all()
+        for fund in funds:
+            yield fund.positions.all()
+
+
+class PrefetchRelatedPerInstance(PrefetchRelated):
+    '''Same as :class:`PrefetchRelated` with a query for each fund.'''
+
+    def query(self):
+        return self.mapper.fund.query()
+
+
+class Facets(QueryScenario):
+    '''Number of instruments for each currency and type with
+:meth:`stdnet.odm.Query.facets`.'''
+
+    def query(self):
+        return self.mapper.instrument.exclude(type=INSTS_TYPES[0])
+
+    def run(self):
+        return self.query().facets('ccy', 'type')
+
+
+class FacetsPerValue(Facets):
+    '''Same as :class:`Facets` with a count query for each value.'''
+
+    def run(self):
+        qs = self.query()
+        for ccy in set(self.data.inst_ccys):
+            yield qs.filter(ccy=ccy).count()
+        for type in set(self.data.inst_types):
+            yield qs.filter(type=type).count()
+
+
+class Flagged(odm.StdModel):
+    '''Same fields as :class:`examples.models.Ticket` with set indices.'''
+    title = odm.SymbolField()
+    status = odm.SymbolField()
+    urgent = odm.BooleanField(index=True)
+    priority = odm.IntegerField(default=0)
+
+
+class TicketData(test.DataGenerator):
+    sizes = {'tiny': 100,
+             'small': 1000,
+             'normal': 10000,
+             'big': 100000,
+             'huge': 1000000}
+
+    def generate(self):
+        self.statuses = self.populate('choice',
+                                      choice_from=('open', 'closed', 'pending'))
+        self.priorities = self.populate('integer', start=0, end=4)
+
+
+class BitmapFilter(Scenario):
+    '''Intersection and exclusion of low cardinality fields with bitmap
+indices.'''
+    models = (Ticket, Flagged)
+    data_cls = TicketData
+    model = Ticket
+
+    def setup(self):
+        with self.session().begin() as t:
+            for n, (status, priority) in enumerate(zip(self.data.statuses,
+                                                       self.data.priorities)):
+                t.add(self.model(title='ticket %s' % n, status=status,
+                                 urgent=n % 4 == 0, priority=priority))
+        return t.on_result
+
+    def run(self):
+        qs = self.session().query(self.model)
+        return qs.filter(status='open', priority=(1, 2)).exclude(
+            urgent=True).count()
+
+
+class SetFilter(BitmapFilter):
+    '''Same as :class:`BitmapFilter` with set indices.'''
+    model = Flagged
+
+
+class Score(odm.StdModel):
+    player = odm.SymbolField(index=False)
+    points = odm.IntegerField(index=False)
+
+    class Meta:
+        ordering = 'points'
+
+
+class Unranked(odm.StdModel):
+    '''Same fields as :class:`Score` without ``ordering``.'''
+    player = odm.SymbolField(index=False)
+    points = odm.IntegerField(index=False)
+
+
+class ScoreData(TicketData):
+
+    def generate(self):
+        self.points = self.populate('integer', start=0, end=100000)
+
+
+class Top(Scenario):
+    '''The ten highest scores of a model ordered by ``points``.'''
+    models = (Score, Unranked)
+    data_cls = ScoreData
+    model = Score
+
+    def setup(self):
+        with self.session().begin() as t:
+            for n, points in enumerate(self.data.points):
+                t.add(self.model(player='player %s' % n, points=points))
+        return t.on_result
+
+    def run(self):
+        return self.session().query(self.model).top(10, by='-points')
+
+
+class TopSort(Top):
+    '''Same as :class:`Top` with a sort of the ``points`` values.'''
+    model = Unranked
+
+
+class DeepPage(Top):
+    '''A page of ten scores after the first 9000 with
+:meth:`stdnet.odm.Query.page`.'''
+
+    def setup(self):
+        yield super(DeepPage, self).setup()
+        _, self.cursor = yield self.session().query(self.model).page(9000)
+
+    def run(self):
+        return self.session().query(self.model).page(10, self.cursor)
+
+
+class DeepSlice(Top):
+    '''Same as :class:`DeepPage` with a slice of a sort.'''
+    model = Unranked
+
+    def run(self):
+        return self.session().query(self.model).sort_by('points')[9000:9010]
+
+
+class Place(odm.StdModel):
+    name = odm.SymbolField(index=False)
+    location = odm.GeoField()
+
+
+class PlaceLatLon(odm.StdModel):
+    '''Same as :class:`Place` with the location in two indexed fields.'''
+    name = odm.SymbolField(index=False)
+    lat = odm.FloatField(index=True)
+    lon = odm.FloatField(index=True)
+
+
+class PlaceData(TicketData):
+
+    def generate(self):
+        self.lats = self.populate('float', start=35, end=60)
+        self.lons = self.populate('float', start=-10, end=30)
+
+
+class Within(Scenario):
+    '''Places within 100 kilometres of a point with a ``within`` lookup on
+a :class:`stdnet.odm.GeoField`.'''
+    models = (Place, PlaceLatLon)
+    data_cls = PlaceData
+    model = Place
+
+    def setup(self):
+        with self.session().begin() as t:
+            for n, (lat, lon) in enumerate(zip(self.data.lats,
+                                               self.data.lons)):
+                t.add(self.instance('place %s' % n, lat, lon))
+        return t.on_result
+
+    def instance(self, name, lat, lon):
+        return self.model(name=name, location=(lat, lon))
+
+    def run(self):
+        return self.session().query(self.model).filter(
+            location__within=(48, 10, 100)).all()
+
+
+class WithinBox(Within):
+    '''Same as :class:`Within` with range lookups on the bounding box of the
+circle.'''
+    model = PlaceLatLon
+
+    def instance(self, name, lat, lon):
+        return self.model(name=name, lat=lat, lon=lon)
+
+    def run(self):
+        return self.session().query(self.model).filter(
+            lat__ge=47.1, lat__le=48.9, lon__ge=8.65, lon__le=11.35).all()
+
+
+class BitmapPage(BitmapFilter):
+    '''A page of twenty elements of a query on bitmap indices.'''
+
+    def run(self):
+        qs = self.session().query(self.model)
+        return qs.filter(status='open').exclude(urgent=True)[2000:2020]
+
+
+class SetPage(BitmapPage):
+    '''Same as :class:`BitmapPage` with set indices.'''
+    model = Flagged
@@ -0,0 +1,145 @@
+'''Benchmark statistics, comparison, scenarios and load driver.'''
+from stdnet.utils import test
+
+from . import (scenarios, percentile, statistics, run_scenario, compare,
+               comparison, format_comparison)
+from .load import DEFAULT_MIX, parse_mix, summary, run_load
+
+
+def results(**metrics):
+    return {'results': dict(((name, dict(zip(('ops_per_sec', 'p50', 'p99',
+                                                'bytes'), values)))
+                             for name, values in metrics.items()))}
+
+
+class TestStatistics(test.TestCase):
+    multipledb = False
+
+    def test_percentile(self):
+        self.assertEqual(percentile([], 50), None)
+        self.assertEqual(percentile([3], 99), 3)
+        self.assertEqual(percentile([4, 1, 3, 2], 0), 1)
+        self.assertEqual(percentile([4, 1, 3, 2], 100), 4)
+        self.assertEqual(percentile([4, 1, 3, 2], 50), 2.5)
+        self.assertAlmostEqual(percentile(range(101), 99), 99)
+
+    def test_statistics(self):
+        stats = statistics([0.2, 0.4, 0.2, 0.2], 10)
+        self.assertEqual(stats['repeat'], 4)
+        self.assertEqual(stats['number'], 10)
+        self.assertAlmostEqual(stats['ops_per_sec'], 40/1.)
+        self.assertAlmostEqual(stats['mean'], 0.025)
+        self.assertAlmostEqual(stats['p50'], 0.02)
+        self.assertTrue(stats['p99'] > 0.039)
+
+    def test_compare(self):
+        baseline = results(a=(100, 0.01, 0.02, 1000),
+                           b=(100, 0.01, 0.02, 1000))
+        current = results(a=(95, 0.0105, 0.021, 1000),
+                          b=(50, 0.02, 0.03, 2000),
+                          c=(10, 0.1, 0.1, 100))
+        rows = compare(baseline, current, 0.1)
+        self.assertEqual(len(rows), 8)
+        self.assertTrue(all(isinstance(r, comparison) for r in rows))
+        regressions = set(((r.name, r.metric) for r in rows if r.regression))
+        self.assertEqual(regressions, set((('b', 'ops_per_sec'),
+                                           ('b', 'p50'),
+                                           ('b', 'p99'),
+                                           ('b', 'bytes'))))
+        lines = list(format_comparison(rows))
+        self.assertEqual(len(lines), 8)
+        self.assertTrue('REGRESSION' in lines[-1])
+        rows = compare(baseline, current, 1.5)
+        self.assertFalse([r for r in rows if r.regression])
+
+    def test_scenarios(self):
+        names = [s.name for s in scenarios()]
+        self.assertEqual(names, sorted(names))
+        for name in ('commit.newsmall', 'commit.updatewide', 'query.sort',
+                     'query.loadrelated', 'structures.zsetadd',
+                     'search.index', 'columnts.stats'):
+            self.assertTrue(name in names)
+        names = [s.name for s in scenarios('^query\.')]
+        self.assertTrue(names)
+        self.assertTrue(all(name.startswith('query.') for name in names))
+
+
+class TestScenarios(test.TestCase):
+    multipledb = 'redis'
+
+    def test_run_scenario(self):
+        if self.backend.is_async():
+            raise test.unittest.SkipTest('Requires synchronous bindings')
+        server = self.backend.connection_string
+        for scenario in scenarios():
+            result = run_scenario(scenario, server, 'tiny', repeat=2,
+                                  warmup=0)
+            self.assertEqual(result['repeat'], 2)
+            self.assertTrue(result['ops_per_sec'] > 0)
+            self.assertTrue(result['p99'] >= result['p50'])
+            # bytes is None on servers without the MEMORY command
+            self.assertTrue(result['bytes'] is None or result['bytes'] > 0)
+
+
+class TestLoad(test.TestCase):
+    multipledb = 'redis'
+
+    def test_parse_mix(self):
+        mix = parse_mix('get:3, update:1,create')
+        self.assertEqual(mix, [('get', 3), ('update', 1), ('create', 1)])
+        self.assertRaises(ValueError, parse_mix, 'get:3,foo:1')
+        self.assertRaises(ValueError, parse_mix, 'get:-1')
+        self.assertRaises(ValueError, parse_mix, 'get:0')
+        self.assertTrue(parse_mix(DEFAULT_MIX))
+
+    def test_summary(self):
+        results = [{'elapsed': 1.5, 'missed': 0,
+                    'operations': {'get': {'latencies': [0.1, 0.2],
+                                           'errors': 0, 'error': None}}},
+                   {'elapsed': 2, 'missed': 3,
+                    'operations': {'get': {'latencies': [0.3], 'errors': 1,
+                                           'error': 'ValueError: bad'},
+                                   'update': {'latencies': [0.4],
+                                              'errors': 0, 'error': None}}}]
+        result = summary(2, results)
+        self.assertEqual(result['concurrency'], 2)
+        self.assertEqual(result['elapsed'], 2)
+        self.assertEqual(result['missed'], 3)
+        self.assertEqual(result['count'], 4)
+        self.assertEqual(result['errors'], 1)
+        self.assertAlmostEqual(result['error_rate'], 0.2)
+        self.assertAlmostEqual(result['throughput'], 2)
+        self.assertAlmostEqual(result['max'], 0.4)
+        get = result['operations']['get']
+        self.assertEqual(get['count'], 3)
+        self.assertAlmostEqual(get['p50'], 0.2)
+        self.assertEqual(get['last_error'], 'ValueError: bad')
+        self.assertFalse('last_error' in result['operations']['update'])
+
+    def test_run_load(self):
+        if self.backend.is_async():
+            raise test.unittest.SkipTest('Requires synchronous bindings')
+        result = run_load(self.backend.connection_string, concurrency=(1, 2),
+                          duration=0.2, mix='get:2,update:1,create:1,delete',
+                          size='tiny')
+        self.assertEqual(result['mode'], 'thread')
+        curve = result['curve']
+        self.assertEqual([c['concurrency'] for c in curve], [1, 2])
+        for c in curve:
+            self.assertTrue(c['count'] > 0)
+            self.assertEqual(c['errors'], 0)
+            self.assertEqual(c['missed'], 0)
+            self.assertTrue(c['p99'] >= c['p50'])
+
+    def test_saturated_rate(self):
+        if self.backend.is_async():
+            raise test.unittest.SkipTest('Requires synchronous bindings')
+        # a rate the server cannot sustain
+        rate = 1000000
+        result = run_load(self.backend.connection_string, concurrency=(1,),
+                          duration=0.2, rate=rate, mix='get', size='tiny')
+        c = result['curve'][0]
+        self.assertTrue(c['missed'] > 0)
+        self.assertTrue(c['throughput'] < rate)
+        self.assertTrue(c['elapsed'] < 1)
+        self.assertAlmostEqual(c['count'] + c['missed'], 0.2*rate, delta=2)
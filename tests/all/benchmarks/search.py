@@ -0,0 +1,42 @@
+'''Search engine indexing and full text search.'''
+from stdnet.utils import populate
+from stdnet.apps.searchengine import SearchEngine
+
+from examples.wordsearch.models import Item, RelatedItem
+
+from tests.all.apps.searchengine.meta import SeearchData
+
+from . import Scenario
+
+
+class SearchScenario(Scenario):
+    abstract = True
+    models = (Item, RelatedItem)
+    data_cls = SeearchData
+
+    def setup(self):
+        self.mapper.set_search_engine(SearchEngine())
+        self.mapper.search_engine.register(Item, ('related',))
+        self.mapper.search_engine.register(RelatedItem)
+        return self.data.make_items(self, content=True)
+
+
+class Index(SearchScenario):
+
+    def setup(self):
+        # make_items skips names with less than four characters
+        self.number = len([n for n in self.data.names if len(n) > 3])
+        return super(Index, self).setup()
+
+    def before(self):
+        return self.backend.flush()
+
+    def run(self):
+        return self.data.make_items(self, content=True)
+
+
+class Search(SearchScenario):
+
+    def run(self):
+        text = ' '.join(populate('choice', 2, choice_from=list(self.words)))
+        return self.mapper.item.search(text).all()
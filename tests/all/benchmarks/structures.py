@@ -0,0 +1,128 @@
+'''Structure operations: set, zset, list and hash table.'''
+from stdnet import odm
+from stdnet.utils import test, zip
+
+from . import Scenario
+
+
+class StructureData(test.DataGenerator):
+    sizes = {'tiny': 10,
+             'small': 100,
+             'normal': 1000,
+             'big': 10000,
+             'huge': 100000}
+
+    def generate(self):
+        self.keys = self.populate('string', min_len=5, max_len=20)
+        self.values = self.populate('string', min_len=10, max_len=40)
+        self.scores = self.populate('float')
+
+
+class StructureScenario(Scenario):
+    '''Scenarios on a stand-alone structure. The structure is created and
+filled during :meth:`setup`.'''
+    abstract = True
+    data_cls = StructureData
+    structure = None
+
+    def setup(self):
+        self.instance = self.mapper.register(self.structure())
+        return self.add()
+
+    def add(self):
+        with self.session().begin() as t:
+            t.add(self.instance)
+            self.fill()
+        return t.on_result
+
+    def before(self):
+        # read from the server rather than from the structure cache
+        self.instance.cache.clear()
+
+
+class AddMixin(object):
+    '''Time the addition of all data elements to a new structure.'''
+    def setup(self):
+        self.number = self.data.size
+        return super(AddMixin, self).setup()
+
+    def before(self):
+        yield self.session().delete(self.instance)
+        self.instance = self.mapper.register(self.structure())
+
+    def run(self):
+        return self.add()
+
+
+class SetScenario(StructureScenario):
+    abstract = True
+    structure = odm.Set
+
+    def fill(self):
+        self.instance.update(self.data.values)
+
+
+class SetAdd(AddMixin, SetScenario):
+    pass
+
+
+class SetMembers(SetScenario):
+
+    def run(self):
+        s = self.instance
+        return s.load_data(s.read_backend_structure().items())
+
+
+class ZsetScenario(StructureScenario):
+    abstract = True
+    structure = odm.Zset
+
+    def fill(self):
+        self.instance.update(zip(self.data.scores, self.data.values))
+
+
+class ZsetAdd(AddMixin, ZsetScenario):
+    pass
+
+
+class ZsetRange(ZsetScenario):
+
+    def run(self):
+        return self.instance.irange()
+
+
+class ListScenario(StructureScenario):
+    abstract = True
+    structure = odm.List
+
+    def fill(self):
+        for value in self.data.values:
+            self.instance.push_back(value)
+
+
+class ListPush(AddMixin, ListScenario):
+    pass
+
+
+class ListItems(ListScenario):
+
+    def run(self):
+        return self.instance.items()
+
+
+class HashScenario(StructureScenario):
+    abstract = True
+    structure = odm.HashTable
+
+    def fill(self):
+        self.instance.update(zip(self.data.keys, self.data.values))
+
+
+class HashUpdate(AddMixin, HashScenario):
+    pass
+
+
+class HashItems(HashScenario):
+
+    def run(self):
+        return self.instance.items()
@@ -0,0 +1,97 @@
+'''Compression of large serialized fields.'''
+import zlib
+
+from stdnet import odm, FieldError
+from stdnet.utils import test, encoders
+
+from examples.models import Archive
+
+
+class TestCompressedFields(test.TestCase):
+    model = Archive
+
+    def create(self, body=b'', **kwargs):
+        kwargs.setdefault('name', 'archive')
+        return self.session().add(self.model(body=body, **kwargs))
+
+    def test_meta(self):
+        meta = self.model._meta
+        encoder = meta.dfields['body'].encoder
+        self.assertTrue(isinstance(encoder, encoders.Compressed))
+        self.assertTrue(isinstance(encoder.encoder, encoders.Bytes))
+        self.assertEqual(encoder.level, 6)
+        self.assertEqual(encoder.threshold, 1024)
+        encoder = meta.dfields['data'].encoder
+        self.assertEqual(encoder.level, 9)
+        self.assertEqual(encoder.threshold, 64)
+        self.assertFalse(isinstance(odm.ByteField().encoder,
+                                    encoders.Compressed))
+        self.assertRaises(FieldError, odm.ByteField, compress=10)
+        self.assertRaises(FieldError, odm.JSONField, as_string=False,
+                          compress=True)
+
+    def test_encoder(self):
+        encoder = encoders.Compressed(encoders.Bytes(), threshold=10)
+        self.assertEqual(encoder.ratio, 1)
+        self.assertEqual(encoder.dumps(b'small'), b'small')
+        value = encoder.dumps(b'x'*1000)
+        self.assertEqual(value[:1], encoder.header)
+        self.assertEqual(zlib.decompress(value[1:]), b'x'*1000)
+        self.assertEqual(encoder.loads(value), b'x'*1000)
+        self.assertEqual(encoder.loads(b'small'), b'small')
+        # small values starting with the header are compressed too
+        value = encoder.dumps(b'\x00a')
+        self.assertNotEqual(value, b'\x00a')
+        self.assertEqual(encoder.loads(value), b'\x00a')
+        # not compressed data starting with the header
+        self.assertEqual(encoder.loads(b'\x00abc'), b'\x00abc')
+        stats = encoder.stats
+        self.assertEqual(stats['values'], 3)
+        self.assertEqual(stats['compressed'], 2)
+        self.assertEqual(stats['raw_bytes'], 1007)
+        self.assertTrue(stats['stored_bytes'] < 100)
+        self.assertTrue(encoder.ratio < 0.1)
+
+    def test_save_load(self):
+        body = b'abcdefgh'*1000
+        data = {'values': list(range(100))}
+        info = {'description': 'compressed '*200}
+        a = yield self.create(body, data=data, info=info)
+        self.assertEqual(a.body, body)
+        a = yield self.query().get(id=a.id)
+        self.assertEqual(a.body, body)
+        self.assertEqual(a.data, data)
+        self.assertEqual(a.info, info)
+        a = yield self.create(b'small', data=1)
+        a = yield self.query().get(id=a.id)
+        self.assertEqual(a.body, b'small')
+        self.assertEqual(a.data, 1)
+        self.assertEqual(a.info, {})
+
+    def test_stored_data(self):
+        body = b'abcdefgh'*1000
+        a = yield self.create(body)
+        stored = a.dbdata['cleaned_data']['body']
+        self.assertEqual(stored[:1], b'\x00')
+        self.assertTrue(len(stored) < len(body)/10)
+
+    def test_uncompressed_data(self):
+        # data stored without compression can be read
+        field = self.model._meta.dfields['body']
+        value = field.to_python(b'x'*2000)
+        self.assertEqual(value, b'x'*2000)
+        field = self.model._meta.dfields['info']
+        self.assertEqual(field.to_python(b'{"a": 1}'), {'a': 1})
+
+    def test_load_only(self):
+        body = b'abcdefgh'*1000
+        a = yield self.create(body, data=[1, 2], name='load_only')
+        a = yield self.query().load_only('name').get(id=a.id)
+        self.assertEqual(a.name, 'load_only')
+        self.assertFalse('body' in a.__dict__)
+        a.name = 'load_only2'
+        yield a.save()
+        a = yield self.query().get(id=a.id)
+        self.assertEqual(a.name, 'load_only2')
+        self.assertEqual(a.body, body)
+        self.assertEqual(a.data, [1, 2])
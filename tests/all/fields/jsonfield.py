@@ -7,11 +7,12 @@ from decimal import Decimal
 from random import random, randint, choice
 
 import stdnet
+from stdnet import odm, FieldError, QuerySetError
 from stdnet.utils import test, zip, to_string, unichr, ispy3k, range
 from stdnet.utils import date2timestamp
 from stdnet.utils.populate import populate
 
-from examples.models import Statistics, Statistics3, Role
+from examples.models import Statistics, Statistics3, Role, Measurement
 
 
 class make_random(object):
@@ -291,4 +292,72 @@ The `as_string` atttribute is set to ``False``.'''
         self.assertFalse(data1)
         self.assertFalse(data2)
             
-    
\ No newline at end of file
+    
+
+
+class TestJsonFieldIndex(test.TestWrite):
+    model = Measurement
+
+    def setUp(self):
+        with self.session().begin() as t:
+            t.add(self.model(name='a', data={'region': 'EU',
+                                             'pv': {'mean': 1, 'std': 2}}))
+            t.add(self.model(name='b', data={'region': 'US',
+                                             'pv': {'mean': 1, 'std': 3}}))
+            t.add(self.model(name='c', data={'region': 'EU',
+                                             'pv': {'mean': 2}}))
+            t.add(self.model(name='d', data={}))
+        return t.on_result
+
+    def names(self, qs):
+        return sorted((m.name for m in qs))
+
+    def test_meta(self):
+        field = self.model._meta.dfields['data']
+        self.assertEqual(field.nested_indices, ('pv__mean', 'region'))
+        self.assertFalse(field.index)
+        indices = self.model._meta.as_dict()['indices']
+        self.assertEqual(indices['data__region'], False)
+        self.assertEqual(indices['data__pv__mean'], False)
+        self.assertRaises(FieldError, odm.JSONField, index=['region'])
+
+    def test_index_argument(self):
+        field = odm.JSONField(as_string=False, index='region')
+        self.assertEqual(field.nested_indices, ('region',))
+        field = odm.JSONField(as_string=False, index=True)
+        self.assertEqual(field.nested_indices, ())
+        self.assertEqual(odm.JSONField(index=True).nested_indices, ())
+        for index in (3, ['region', 3], ['pv__'], ['__pv'], ['pv____mean'],
+                      ['']):
+            self.assertRaises(FieldError, odm.JSONField, as_string=False,
+                              index=index)
+
+    def test_filter(self):
+        qs = yield self.query().filter(data__region='EU').all()
+        self.assertEqual(self.names(qs), ['a', 'c'])
+        qs = yield self.query().filter(data__pv__mean=1).all()
+        self.assertEqual(self.names(qs), ['a', 'b'])
+        qs = yield self.query().filter(data__region=('EU', 'US'),
+                                       data__pv__mean=1).all()
+        self.assertEqual(self.names(qs), ['a', 'b'])
+        qs = yield self.query().exclude(data__region='EU').all()
+        self.assertEqual(self.names(qs), ['b', 'd'])
+
+    def test_not_indexed(self):
+        query = self.query().filter(data__pv__std=2)
+        self.assertRaises(QuerySetError, query.construct)
+
+    def test_update(self):
+        m = yield self.query().get(name='c')
+        m.data['region'] = 'US'
+        yield m.save()
+        qs = yield self.query().filter(data__region='US').all()
+        self.assertEqual(self.names(qs), ['b', 'c'])
+        m = yield self.query().get(name='a')
+        m.data = {'pv': {'mean': 1}}
+        yield m.save()
+        qs = yield self.query().filter(data__region='EU').all()
+        self.assertEqual(self.names(qs), [])
+        yield m.delete()
+        qs = yield self.query().filter(data__pv__mean=1).all()
+        self.assertEqual(self.names(qs), ['b'])
@@ -0,0 +1,68 @@
+'''Fields decoded on first access.'''
+from datetime import datetime
+
+from stdnet import odm
+from stdnet.utils import test, pickle
+
+from examples.models import TaskData
+
+
+class TestLazyFields(test.TestCase):
+    model = TaskData
+
+    def create(self, name='task', **kwargs):
+        kwargs.setdefault('timestamp', datetime(2013, 9, 17, 10, 30))
+        kwargs.setdefault('args', {'a': [1, 2, 3], 'b': 'foo'})
+        return self.session().add(self.model(name=name, **kwargs))
+
+    def test_meta(self):
+        meta = self.model._meta
+        self.assertTrue(meta.dfields['args'].lazy)
+        self.assertTrue(meta.dfields['result'].lazy)
+        self.assertFalse(meta.dfields['name'].lazy)
+        self.assertFalse(meta.pk.lazy)
+        self.assertTrue(isinstance(self.model.args, odm.LazyField))
+        self.assertFalse(odm.IntegerField(primary_key=True, lazy=True).lazy)
+
+    def test_load(self):
+        task = yield self.create(result={'x': 3})
+        task = yield self.query().get(id=task.id)
+        for name in ('timestamp', 'args', 'result'):
+            self.assertTrue(isinstance(task.__dict__[name], odm.lazy_value))
+        self.assertEqual(task.name, 'task')
+        self.assertEqual(task.args, {'a': [1, 2, 3], 'b': 'foo'})
+        self.assertEqual(task.__dict__['args'], task.args)
+        self.assertTrue(isinstance(task.__dict__['result'], odm.lazy_value))
+        self.assertEqual(task.result, {'x': 3})
+        self.assertEqual(task.timestamp, datetime(2013, 9, 17, 10, 30))
+
+    def test_update(self):
+        task = yield self.create()
+        task = yield self.query().get(id=task.id)
+        task.name = 'updated'
+        yield task.save()
+        task = yield self.query().get(id=task.id)
+        self.assertEqual(task.name, 'updated')
+        self.assertEqual(task.args, {'a': [1, 2, 3], 'b': 'foo'})
+        self.assertEqual(task.timestamp, datetime(2013, 9, 17, 10, 30))
+
+    def test_load_only(self):
+        task = yield self.create()
+        task = yield self.query().load_only('name').get(id=task.id)
+        self.assertFalse(hasattr(task, 'args'))
+        self.assertRaises(AttributeError, lambda: task.args)
+        task = yield self.query().load_only('args').get(id=task.id)
+        self.assertEqual(task.args, {'a': [1, 2, 3], 'b': 'foo'})
+
+    def test_compact(self):
+        task = yield self.create()
+        task = yield self.query().compact().get(id=task.id)
+        self.assertFalse('args' in type(task).__slots__)
+        self.assertEqual(task.args, {'a': [1, 2, 3], 'b': 'foo'})
+
+    def test_pickle(self):
+        task = yield self.create()
+        task = yield self.query().get(id=task.id)
+        task2 = pickle.loads(pickle.dumps(task))
+        self.assertEqual(task2.args, {'a': [1, 2, 3], 'b': 'foo'})
+        self.assertEqual(task2.timestamp, task.timestamp)
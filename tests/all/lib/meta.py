@@ -160,3 +160,45 @@ class TestComplexModel(test.TestCase):
         yield session.add(m)
         m = yield self.query().get(id=1)
         self.assertEqual(m.data, {})
+
+
+class TestDecoders(test.TestCase):
+    multipledb = False
+
+    def test_loaded_fields(self):
+        meta = ComplexModel._meta
+        self.assertEqual(meta.loaded_fields(), tuple(meta.scalarfields))
+        fields = meta.loaded_fields(('name', 'data__italy', 'data__france'))
+        self.assertEqual(fields, (meta.dfields['name'], meta.dfields['data']))
+        self.assertEqual(meta.loaded_fields(('foo',)), ())
+
+    def test_decoder_cache(self):
+        meta = ComplexModel._meta
+        decoder = meta.decoder()
+        self.assertEqual(meta.decoder(), decoder)
+        decoder2 = meta.decoder(('name',))
+        self.assertNotEqual(decoder2, decoder)
+        self.assertEqual(meta.decoder(('name',)), decoder2)
+
+    def test_load_state(self):
+        meta = ComplexModel._meta
+        m = meta.make_object((5, ('name', 'data__italy'),
+                              {'name': 'bla', 'data__italy': '"rome"'}))
+        self.assertEqual(m.id, 5)
+        self.assertEqual(m.name, 'bla')
+        self.assertEqual(m.data, {'italy': 'rome'})
+        self.assertEqual(m._loadedfields, ('name', 'data__italy'))
+        self.assertEqual(tuple(m.loadedfields()),
+                         (meta.dfields['name'], meta.dfields['data']))
+
+    def test_validator(self):
+        meta = SimpleModel._meta
+        self.assertEqual(meta.validator(), meta.validator())
+        m = SimpleModel(code='pluto', number='3')
+        self.assertTrue(m.is_valid())
+        self.assertEqual(m.number, 3.0)
+        self.assertEqual(m._dbdata['cleaned_data']['code'], 'pluto')
+        m = SimpleModel()
+        m.number = 'foo'
+        self.assertFalse(m.is_valid())
+        self.assertTrue('number' in m._dbdata['errors'])
@@ -0,0 +1,73 @@
+'''Foreign keys loaded for all the instances of a query on first access.'''
+from examples.models import Instrument, Position
+from examples.data import FinanceTest
+
+
+class TestBatchRelated(FinanceTest):
+
+    @classmethod
+    def after_setup(cls):
+        return cls.data.makePositions(cls)
+
+    def loaded(self, positions):
+        cache_name = Position._meta.dfields['instrument'].get_cache_name()
+        return [p for p in positions if hasattr(p, cache_name)]
+
+    def test_siblings(self):
+        positions = yield self.query(Position).all()
+        self.assertTrue(len(positions) > 1)
+        group = positions[0].dbdata['siblings']
+        self.assertEqual(len(group), len(positions))
+        for p in positions:
+            self.assertTrue(p.dbdata['siblings'] is group)
+        position = yield self.query(Position).get(id=positions[0].id)
+        self.assertFalse('siblings' in position.dbdata)
+        instruments = yield self.query(Instrument).all()
+        self.assertFalse('siblings' in instruments[0].dbdata)
+
+    def test_load(self):
+        positions = yield self.query(Position).all()
+        self.assertEqual(self.loaded(positions), [])
+        instrument = yield positions[0].instrument
+        self.assertEqual(instrument.id, positions[0].instrument_id)
+        self.assertEqual(len(self.loaded(positions)), len(positions))
+        instruments = {}
+        for p in positions:
+            instrument = yield p.instrument
+            self.assertEqual(instrument.id, p.instrument_id)
+            instruments.setdefault(instrument.id, instrument)
+            self.assertTrue(instrument is instruments[instrument.id])
+
+    def test_opt_out(self):
+        positions = yield self.query(Position).batch_related(False).all()
+        self.assertFalse('siblings' in positions[0].dbdata)
+        instrument = yield positions[0].instrument
+        self.assertEqual(instrument.id, positions[0].instrument_id)
+        self.assertEqual(self.loaded(positions), [positions[0]])
+
+    def test_load_only(self):
+        positions = yield self.query(Position).all()
+        p = positions[0]
+        instrument = yield p.load_related_model('instrument',
+                                                load_only=('name',))
+        self.assertEqual(instrument.id, p.instrument_id)
+        self.assertEqual(self.loaded(positions), [p])
+
+    def test_load_related(self):
+        positions = yield self.query(Position).load_related(
+            'instrument').all()
+        self.assertEqual(len(self.loaded(positions)), len(positions))
+
+    def test_readonly(self):
+        positions = yield self.query(Position).readonly().all()
+        instrument = yield positions[-1].instrument
+        self.assertEqual(instrument.id, positions[-1].instrument_id)
+        self.assertEqual(len(self.loaded(positions)), len(positions))
+        self.assertTrue(instrument.session.readonly)
+
+    def test_compact(self):
+        positions = yield self.query(Position).compact().all()
+        self.assertEqual(positions[0]._dbdata, None)
+        instrument = yield positions[0].instrument
+        self.assertEqual(instrument.id, positions[0].instrument_id)
+        self.assertEqual(self.loaded(positions), [positions[0]])
@@ -0,0 +1,161 @@
+'''Bitmap indices.'''
+from stdnet import odm, FieldError
+from stdnet.utils import test
+
+from examples.models import Ticket
+
+
+STATUS = ('open', 'closed', 'pending')
+
+
+class TestBitmapIndex(test.TestCase):
+    model = Ticket
+
+    @classmethod
+    def after_setup(cls):
+        with cls.session().begin() as t:
+            for n in range(60):
+                t.add(cls.model(title='ticket %s' % n,
+                                status=STATUS[n % 3],
+                                urgent=n % 4 == 0,
+                                priority=n % 5))
+        yield t.on_result
+        cls.data = yield cls.query().all()
+
+    def ids(self, **kwargs):
+        return set((t.id for t in self.data if
+                    all((getattr(t, k) == v for k, v in kwargs.items()))))
+
+    def test_meta(self):
+        meta = self.model._meta
+        self.assertTrue(meta.dfields['status'].bitmap)
+        self.assertFalse(meta.dfields['title'].bitmap)
+        self.assertEqual(meta.bitmap_indices,
+                         set(('status', 'urgent', 'priority')))
+        self.assertEqual(meta.as_dict()['bitmaps'],
+                         {'status': True, 'urgent': True, 'priority': True})
+
+    def test_bad_fields(self):
+        self.assertRaises(FieldError, odm.SymbolField, index='bitmap',
+                          unique=True)
+        fields = {'code': odm.SymbolField(primary_key=True),
+                  'status': odm.SymbolField(index='bitmap')}
+        model = type('BadBitmap', (object,), {})
+        self.assertRaises(FieldError, odm.ModelMeta, model, fields,
+                          register=False)
+
+    def test_filter(self):
+        qs = self.query().filter(status='open')
+        self.assertEqual(set(t.id for t in (yield qs.all())),
+                         self.ids(status='open'))
+        n = yield self.query().filter(urgent=True).count()
+        self.assertEqual(n, len(self.ids(urgent=True)))
+        qs = self.query().filter(status='foo')
+        self.assertEqual((yield qs.all()), [])
+
+    def test_in(self):
+        qs = self.query().filter(priority=(1, 3))
+        ids = self.ids(priority=1) | self.ids(priority=3)
+        self.assertEqual(set(t.id for t in (yield qs.all())), ids)
+
+    def test_intersect(self):
+        qs = self.query().filter(status='closed', urgent=True)
+        self.assertEqual(set(t.id for t in (yield qs.all())),
+                         self.ids(status='closed', urgent=True))
+
+    def test_exclude(self):
+        qs = self.query().filter(status=('open', 'closed'))\
+                         .exclude(urgent=True).exclude(priority=0)
+        ids = (self.ids(status='open') | self.ids(status='closed')) -\
+            self.ids(urgent=True) - self.ids(priority=0)
+        self.assertEqual(set(t.id for t in (yield qs.all())), ids)
+
+    def test_union(self):
+        qs = self.query().filter(status='pending').union(
+            self.query().filter(urgent=True))
+        ids = self.ids(status='pending') | self.ids(urgent=True)
+        self.assertEqual(set(t.id for t in (yield qs.all())), ids)
+
+    def test_mixed(self):
+        # the title field has a standard index
+        title = self.data[0].title
+        qs = self.query().filter(title=title).exclude(status='closed')
+        ids = set((t.id for t in self.data if t.title == title and
+                   t.status != 'closed'))
+        self.assertEqual(set(t.id for t in (yield qs.all())), ids)
+
+    def test_exclude_only(self):
+        qs = self.query().exclude(status='open')
+        ids = set((t.id for t in self.data)) - self.ids(status='open')
+        self.assertEqual(set(t.id for t in (yield qs.all())), ids)
+
+    def test_bitmap_query_key(self):
+        bq = self.query().filter(status='open').backend_query()
+        n = yield bq.count()
+        self.assertEqual(n, len(self.ids(status='open')))
+        typ = yield self.backend.client.type(bq.query_key)
+        self.assertEqual(typ, b'string')
+        id = min(self.ids(status='open'))
+        self.assertTrue(id in bq)
+        self.assertFalse(min(self.ids(status='closed')) in bq)
+        self.assertFalse('foo' in bq)
+
+    def test_slice(self):
+        query = lambda: self.query().filter(status=('open', 'pending'))
+        ids = sorted(self.ids(status='open') | self.ids(status='pending'))
+        for slic in (slice(0, 5), slice(5, 12), slice(-4, None),
+                     slice(30, 50)):
+            qs = yield query()[slic]
+            self.assertEqual([t.id for t in qs], ids[slic])
+        qs = yield query().sort_by('-id')[3:8]
+        self.assertEqual([t.id for t in qs], list(reversed(ids))[3:8])
+        qs = yield query().sort_by('-id')[-3:]
+        self.assertEqual([t.id for t in qs], list(reversed(ids))[-3:])
+        for slic in (slice(35, 50), slice(40, 60), slice(50, 70)):
+            qs = yield query().sort_by('-id')[slic]
+            self.assertEqual([t.id for t in qs], list(reversed(ids))[slic])
+        qs = yield query().sort_by('title')[2:6]
+        titles = sorted((t.title for t in self.data if t.id in ids))
+        self.assertEqual([t.title for t in qs], titles[2:6])
+
+    def test_subquery(self):
+        open = self.query().filter(status='open')
+        qs = yield self.query().filter(id=open).all()
+        self.assertEqual(set(t.id for t in qs), self.ids(status='open'))
+        facets = yield open.facets('priority')
+        priorities = {}
+        for t in self.data:
+            if t.status == 'open':
+                priorities[t.priority] = priorities.get(t.priority, 0) + 1
+        self.assertEqual(dict(facets['priority']), priorities)
+
+
+class TestBitmapIndexWrite(test.TestWrite):
+    model = Ticket
+
+    def test_update_and_delete(self):
+        query = self.query()
+        t = yield self.session().add(self.model(title='a', status='open'))
+        qs = yield query.filter(status='open').all()
+        self.assertEqual([i.id for i in qs], [t.id])
+        t.status = 'closed'
+        yield t.save()
+        qs = yield query.filter(status='open').all()
+        self.assertEqual(qs, [])
+        qs = yield query.filter(status='closed').all()
+        self.assertEqual([i.id for i in qs], [t.id])
+        yield t.delete()
+        qs = yield query.filter(status='closed').all()
+        self.assertEqual(qs, [])
+
+    def test_delete_query(self):
+        with self.session().begin() as t:
+            for n in range(10):
+                t.add(self.model(title='t%s' % n,
+                                 status=('open', 'closed')[n % 2]))
+        yield t.on_result
+        yield self.query().filter(status='open').delete()
+        qs = yield self.query().all()
+        self.assertEqual(set((t.status for t in qs)), set(('closed',)))
+        n = yield self.query().filter(status='open').count()
+        self.assertEqual(n, 0)
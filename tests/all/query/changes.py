@@ -0,0 +1,138 @@
+'''Commit only the fields changed since an instance was loaded.'''
+from datetime import datetime
+
+from stdnet import CommitException
+from stdnet.utils import test, pickle
+
+from examples.models import Instrument, Position, TaskData, SimpleModel
+from examples.data import FinanceTest
+
+
+class TestChanges(FinanceTest):
+
+    @classmethod
+    def after_setup(cls):
+        return cls.data.makePositions(cls)
+
+    def test_changes(self):
+        meta = Instrument._meta
+        i = yield self.query(Instrument).get(id=1)
+        self.assertTrue(i.dbdata['original'])
+        self.assertTrue(i.is_valid())
+        self.assertEqual(meta.changes(i), ({}, []))
+        i.ccy = 'XXX'
+        i.description = None
+        self.assertTrue(i.is_valid())
+        self.assertEqual(meta.changes(i),
+                         ({'ccy': 'XXX', 'description': ''}, []))
+        i = Instrument(name='new', ccy='EUR', type='equity')
+        self.assertTrue(i.is_valid())
+        self.assertEqual(meta.changes(i), None)
+
+    def test_partial_commit(self):
+        i = yield self.query(Instrument).get(id=2)
+        i2 = yield self.query(Instrument).get(id=2)
+        i2.description = 'changed by another session'
+        yield i2.save()
+        ccy = i.ccy
+        i.ccy = 'XYZ'
+        yield i.save()
+        i = yield self.query(Instrument).get(id=2)
+        self.assertEqual(i.ccy, 'XYZ')
+        self.assertEqual(i.description, 'changed by another session')
+        # indices are updated
+        ids = yield self.query(Instrument).filter(ccy='XYZ').get_field(
+            'id').all()
+        self.assertEqual(ids, [2])
+        ids = yield self.query(Instrument).filter(ccy=ccy).get_field(
+            'id').all()
+        self.assertFalse(2 in ids)
+        # commit after commit
+        i.ccy = ccy
+        yield i.save()
+        i = yield self.query(Instrument).get(id=2)
+        self.assertEqual(i.ccy, ccy)
+        n = yield self.query(Instrument).filter(ccy='XYZ').count()
+        self.assertEqual(n, 0)
+
+    def test_load_only(self):
+        i = yield self.query(Instrument).load_only('name').get(id=4)
+        i.ccy = 'ABC'
+        self.assertTrue(i.is_valid())
+        self.assertEqual(Instrument._meta.changes(i), ({'ccy': 'ABC'}, []))
+        yield i.save()
+        i2 = yield self.query(Instrument).filter(ccy='ABC').all()
+        self.assertEqual(len(i2), 1)
+        self.assertEqual(i2[0].name, i.name)
+
+    def test_unique(self):
+        i1 = yield self.query(Instrument).get(id=5)
+        i2 = yield self.query(Instrument).get(id=6)
+        name = i2.name
+        i2.name = i1.name
+        yield self.async.assertRaises(CommitException, i2.save)
+        i2 = yield self.query(Instrument).filter(name=name).all()
+        self.assertEqual(len(i2), 1)
+        self.assertEqual(i2[0].id, 6)
+        i1 = yield self.query(Instrument).filter(name=i1.name).all()
+        self.assertEqual(len(i1), 1)
+        self.assertEqual(i1[0].id, 5)
+
+    def test_foreign_key(self):
+        instruments = yield self.query(Instrument).all()
+        p = yield self.query(Position).get(id=1)
+        instrument = [i for i in instruments if i.id != p.instrument_id][0]
+        p.instrument = instrument
+        yield p.save()
+        ids = yield self.query(Position).filter(
+            instrument=instrument).get_field('id').all()
+        self.assertTrue(1 in ids)
+
+    def test_pickle(self):
+        i = yield self.query(Instrument).get(id=7)
+        i = pickle.loads(pickle.dumps(i))
+        self.assertTrue(i.is_valid())
+        self.assertEqual(Instrument._meta.changes(i), None)
+
+
+class TestMutableChanges(test.TestCase):
+    model = TaskData
+
+    def test_in_place(self):
+        task = yield self.session().add(
+            self.model(name='task', timestamp=datetime.now(),
+                       args={'a': [1, 2]}))
+        task = yield self.query().get(id=task.id)
+        task.args['a'].append(3)
+        yield task.save()
+        task = yield self.query().get(id=task.id)
+        self.assertEqual(task.args, {'a': [1, 2, 3]})
+        task.args['b'] = 'foo'
+        yield task.save()
+        task = yield self.query().get(id=task.id)
+        self.assertEqual(task.args, {'a': [1, 2, 3], 'b': 'foo'})
+
+
+class TestRemovedFields(test.TestCase):
+    model = SimpleModel
+
+    def test_remove(self):
+        m = yield self.session().add(self.model(code='remove', group='g',
+                                                number=3))
+        m = yield self.query().get(id=m.id)
+        self.assertEqual(m.group, 'g')
+        m.group = None
+        m.number = None
+        self.assertTrue(m.is_valid())
+        self.assertEqual(self.model._meta.changes(m),
+                         ({'group': ''}, ['number']))
+        yield m.save()
+        m = yield self.query().get(id=m.id)
+        self.assertFalse(m.group)
+        self.assertEqual(m.number, None)
+        n = yield self.query().filter(group='g').count()
+        self.assertEqual(n, 0)
+        m.group = 'h'
+        yield m.save()
+        n = yield self.query().filter(group='h').count()
+        self.assertEqual(n, 1)
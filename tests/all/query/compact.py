@@ -0,0 +1,106 @@
+'''Compact, slot-based, model instances.'''
+import sys
+
+from stdnet.utils import test, pickle
+
+from examples.models import Instrument, Position
+from examples.data import FinanceTest
+
+
+class TestCompact(FinanceTest):
+
+    @classmethod
+    def after_setup(cls):
+        return cls.data.makePositions(cls)
+
+    def test_compact_model(self):
+        meta = Instrument._meta
+        model = meta.compact_model()
+        self.assertEqual(meta.compact_model(), model)
+        self.assertTrue(issubclass(model, Instrument))
+        self.assertEqual(model._meta, meta)
+        self.assertTrue('name' in model.__slots__)
+        self.assertTrue('id' in model.__slots__)
+        self.assertFalse(meta.compact)
+
+    def test_load(self):
+        qs = self.query(Instrument).sort_by('id')
+        instruments = yield qs.all()
+        compact = yield qs.compact().all()
+        model = Instrument._meta.compact_model()
+        self.assertEqual(len(compact), len(instruments))
+        for c, i in zip(compact, instruments):
+            self.assertEqual(type(c), model)
+            self.assertTrue(isinstance(c, Instrument))
+            self.assertEqual(c._dbdata, None)
+            self.assertTrue(c.session)
+            self.assertEqual(c, i)
+            self.assertEqual(i, c)
+            self.assertEqual(hash(c), hash(i))
+            self.assertEqual(c.todict(), i.todict())
+            self.assertTrue(c.has_all_data)
+
+    def test_memory(self):
+        i = yield self.query(Instrument).load_only('name').all()
+        c = yield self.query(Instrument).load_only('name').compact().all()
+        i, c = i[0], c[0]
+        size = sys.getsizeof(i) + sys.getsizeof(i.__dict__) +\
+            sys.getsizeof(i._dbdata)
+        self.assertTrue(sys.getsizeof(c) < size)
+
+    def test_save(self):
+        session = self.session()
+        qs = session.query(Instrument).compact()
+        c = yield qs.get(id=1)
+        self.assertEqual(c._dbdata, None)
+        ccy = c.ccy
+        c.name = 'compact'
+        yield c.save()
+        self.assertTrue(c._dbdata)
+        self.assertTrue(c.get_state().persistent)
+        i = yield self.query(Instrument).get(id=1)
+        self.assertEqual(i.name, 'compact')
+        self.assertEqual(i.ccy, ccy)
+        n = yield self.query(Instrument).filter(name='compact').count()
+        self.assertEqual(n, 1)
+
+    def test_load_only(self):
+        c = yield self.query(Instrument).load_only('name').compact().get(id=2)
+        self.assertFalse(c.has_all_data)
+        self.assertFalse(hasattr(c, 'ccy'))
+        i = yield self.query(Instrument).get(id=2)
+        c.name = 'compact2'
+        yield c.save()
+        i2 = yield self.query(Instrument).get(id=2)
+        self.assertEqual(i2.name, 'compact2')
+        self.assertEqual(i2.ccy, i.ccy)
+
+    def test_load_related(self):
+        qs = self.query(Position).load_related('instrument').compact()
+        positions = yield qs.all()
+        self.assertTrue(positions)
+        model = Instrument._meta.compact_model()
+        for p in positions:
+            self.assertEqual(type(p.instrument), model)
+            self.assertEqual(p.instrument.id, p.instrument_id)
+
+    def test_pickle(self):
+        c = yield self.query(Instrument).compact().get(id=1)
+        c2 = pickle.loads(pickle.dumps(c))
+        self.assertEqual(type(c2), Instrument)
+        self.assertEqual(c2, c)
+        self.assertEqual(c2.name, c.name)
+        self.assertTrue(c2.get_state().persistent)
+
+    def test_meta_compact(self):
+        meta = Instrument._meta
+        model = meta.compact_model()
+        meta.compact = True
+        try:
+            qs = self.query(Instrument)
+            c = yield qs.get(id=1)
+            self.assertEqual(type(c), model)
+            i = yield qs.compact(False).get(id=1)
+            self.assertEqual(type(i), Instrument)
+        finally:
+            meta.compact = False
@@ -0,0 +1,99 @@
+'''Composite indices.'''
+from stdnet import odm, QuerySetError, ImproperlyConfigured
+from stdnet.utils import test
+
+from examples.models import Instrument
+from examples.data import FinanceTest
+
+
+class Listing(odm.StdModel):
+    market = odm.SymbolField(index=False)
+    code = odm.SymbolField(index=False)
+
+    class Meta:
+        indexes = [('market', 'code')]
+
+
+class TestCompositeIndex(FinanceTest):
+
+    @classmethod
+    def after_setup(cls):
+        yield cls.data.create(cls)
+        cls.instruments = yield cls.query().all()
+
+    def ids(self, ccys, types):
+        return set((i.id for i in self.instruments
+                    if i.ccy in ccys and i.type in types))
+
+    def test_meta(self):
+        meta = Instrument._meta
+        self.assertEqual(meta.indexes, [('ccy', 'type')])
+        self.assertEqual(meta.as_dict()['composites'],
+                         {'ccy,type': ('ccy', 'type')})
+        model = type('BadComposite', (object,), {})
+        for indexes in ([('ccy',)], [('ccy', 'foo')], [('id', 'ccy')]):
+            fields = {'ccy': odm.SymbolField(), 'type': odm.SymbolField()}
+            self.assertRaises(ImproperlyConfigured, odm.ModelMeta, model,
+                              fields, register=False, indexes=indexes)
+
+    def test_construct(self):
+        qs = self.query().filter(ccy='EUR', type='equity').construct()
+        self.assertEqual(qs.keyword, 'set')
+        self.assertEqual(qs.name, 'ccy,type')
+        self.assertEqual([v.value for v in qs], ['EUR', 'equity'])
+        qs = self.query().filter(ccy=('EUR', 'USD'), type='bond').construct()
+        self.assertEqual([v.value for v in qs],
+                         ['EUR', 'bond', 'USD', 'bond'])
+        # exclude is a union of its lookups
+        qs = self.query().exclude(ccy='EUR', type='equity').construct()
+        self.assertEqual(qs.keyword, 'diff')
+        # range lookups do not use the composite index
+        qs = self.query().filter(ccy='EUR', type__gt='a').construct()
+        self.assertEqual(qs.keyword, 'intersect')
+
+    def test_filter(self):
+        qs = yield self.query().filter(ccy='EUR', type='equity').all()
+        self.assertEqual(set((i.id for i in qs)),
+                         self.ids(('EUR',), ('equity',)))
+        ccys, types = ('EUR', 'USD', 'JPY'), ('bond', 'future')
+        qs = yield self.query().filter(ccy=ccys, type=types).all()
+        self.assertEqual(set((i.id for i in qs)), self.ids(ccys, types))
+        n = yield self.query().filter(ccy='XYZ', type='equity').count()
+        self.assertEqual(n, 0)
+
+    def test_filter_and_more(self):
+        i = self.instruments[0]
+        qs = self.query().filter(ccy=i.ccy, type=i.type, name=i.name)
+        qs = yield qs.all()
+        self.assertEqual([o.id for o in qs], [i.id])
+
+
+class TestCompositeIndexWrite(test.TestWrite):
+    models = (Instrument, Listing)
+
+    def test_update(self):
+        query = self.query()
+        i = yield self.session().add(Instrument(name='a', ccy='EUR',
+                                                type='equity'))
+        qs = yield query.filter(ccy='EUR', type='equity').all()
+        self.assertEqual([o.id for o in qs], [i.id])
+        i = yield query.get(id=i.id)
+        i.type = 'bond'
+        yield i.save()
+        n = yield query.filter(ccy='EUR', type='equity').count()
+        self.assertEqual(n, 0)
+        qs = yield query.filter(ccy='EUR', type='bond').all()
+        self.assertEqual([o.id for o in qs], [i.id])
+        yield i.delete()
+        n = yield query.filter(ccy='EUR', type='bond').count()
+        self.assertEqual(n, 0)
+
+    def test_not_indexed_fields(self):
+        models = self.mapper
+        yield models.listing.new(market='LSE', code='VOD')
+        yield models.listing.new(market='NYSE', code='VOD')
+        qs = yield models.listing.filter(market='LSE', code='VOD').all()
+        self.assertEqual(len(qs), 1)
+        self.assertEqual(qs[0].market, 'LSE')
+        query = models.listing.filter(market='LSE')
+        self.assertRaises(QuerySetError, query.construct)
@@ -0,0 +1,191 @@
+'''Facet counts of queries.'''
+from collections import defaultdict
+
+from stdnet import FieldError, QuerySetError
+from stdnet.utils import test
+
+from examples.models import Instrument, Instrument2, Position, Ticket
+from examples.data import FinanceTest
+
+
+def counts(instances, name):
+    c = defaultdict(int)
+    for instance in instances:
+        c[getattr(instance, name)] += 1
+    return dict(c)
+
+
+class TestFacets(FinanceTest):
+
+    @classmethod
+    def after_setup(cls):
+        yield cls.data.makePositions(cls)
+        cls.instruments = yield cls.query().all()
+
+    def test_all(self):
+        facets = yield self.query().facets('ccy', 'type')
+        self.assertEqual(set(facets), set(('ccy', 'type')))
+        self.assertEqual(dict(facets['ccy']), counts(self.instruments, 'ccy'))
+        self.assertEqual(dict(facets['type']),
+                         counts(self.instruments, 'type'))
+        c = list(facets['ccy'].values())
+        self.assertEqual(c, sorted(c, reverse=True))
+
+    def test_filter(self):
+        qs = self.query().filter(ccy=('EUR', 'USD'))
+        facets = yield qs.facets('ccy', 'type')
+        instruments = [i for i in self.instruments if i.ccy in ('EUR', 'USD')]
+        self.assertEqual(dict(facets['ccy']), counts(instruments, 'ccy'))
+        self.assertEqual(dict(facets['type']), counts(instruments, 'type'))
+        # facets of an executed query
+        n = yield qs.count()
+        self.assertEqual(n, len(instruments))
+        facets = yield qs.facets('type')
+        self.assertEqual(dict(facets['type']), counts(instruments, 'type'))
+
+    def test_limit(self):
+        facets = yield self.query().facets('ccy', limit=2)
+        expected = counts(self.instruments, 'ccy')
+        self.assertEqual(len(facets['ccy']), 2)
+        top = sorted(expected.values(), reverse=True)[:2]
+        self.assertEqual(list(facets['ccy'].values()), top)
+
+    def test_foreign_key(self):
+        positions = yield self.query(Position).all()
+        facets = yield self.query(Position).facets('instrument')
+        self.assertEqual(dict(facets['instrument']),
+                         counts(positions, 'instrument_id'))
+
+    def test_empty(self):
+        facets = yield self.query().filter(ccy='XXX').facets('type')
+        self.assertEqual(facets, {'type': {}})
+        facets = self.query().filter(id=()).facets('type')
+        self.assertEqual(facets, {'type': {}})
+
+    def test_bad_fields(self):
+        query = self.query()
+        self.assertRaises(QuerySetError, query.facets)
+        self.assertRaises(FieldError, query.facets, 'name')
+        self.assertRaises(FieldError, query.facets, 'description')
+        self.assertRaises(FieldError, query.facets, 'foo')
+        self.assertRaises(TypeError, query.facets, 'ccy', foo=3)
+        self.assertRaises(QuerySetError,
+                          query.get_field('ccy').facets, 'type')
+
+
+class TestSortedFacets(test.TestCase):
+    model = Instrument2
+
+    @classmethod
+    def after_setup(cls):
+        with cls.session().begin() as t:
+            for n in range(30):
+                t.add(cls.model(name='inst%s' % n,
+                                ccy=('EUR', 'USD', 'JPY')[n % 3],
+                                type=('bond', 'equity')[n % 2]))
+        yield t.on_result
+        cls.instruments = yield cls.query().all()
+
+    def test_facets(self):
+        facets = yield self.query().filter(type='bond').facets('ccy')
+        instruments = [i for i in self.instruments if i.type == 'bond']
+        self.assertEqual(dict(facets['ccy']), counts(instruments, 'ccy'))
+
+
+class TestBitmapFacets(test.TestCase):
+    model = Ticket
+
+    @classmethod
+    def after_setup(cls):
+        with cls.session().begin() as t:
+            for n in range(20):
+                t.add(cls.model(title='ticket %s' % n,
+                                status=('open', 'closed')[n % 2],
+                                priority=n % 3))
+        yield t.on_result
+        cls.tickets = yield cls.query().all()
+
+    def test_facets(self):
+        facets = yield self.query().filter(status='open').facets(
+            'priority', 'status')
+        tickets = [t for t in self.tickets if t.status == 'open']
+        self.assertEqual(dict(facets['priority']), counts(tickets, 'priority'))
+        self.assertEqual(dict(facets['status']), {'open': len(tickets)})
+
+    def test_set_query(self):
+        # the query key is a set of ids rather than a bitmap
+        titles = ['ticket %s' % n for n in range(7)]
+        facets = yield self.query().filter(title=titles).facets(
+            'priority', 'status')
+        tickets = [t for t in self.tickets if t.title in titles]
+        self.assertEqual(dict(facets['priority']), counts(tickets, 'priority'))
+        self.assertEqual(dict(facets['status']), counts(tickets, 'status'))
+
+    def test_mixed_fields(self):
+        facets = yield self.query().filter(status='closed').facets(
+            'title', 'priority', limit=3)
+        tickets = [t for t in self.tickets if t.status == 'closed']
+        self.assertEqual(len(facets['title']), 3)
+        for title, count in facets['title'].items():
+            self.assertEqual(count, 1)
+        self.assertEqual(dict(facets['priority']), counts(tickets, 'priority'))
+
+
+class TestFacetsWrite(test.TestWrite):
+    models = (Instrument, Ticket)
+
+    def test_registry(self):
+        query = self.query()
+        i = yield self.session().add(self.model(name='a', ccy='GBP',
+                                                type='bond'))
+        facets = yield query.facets('ccy')
+        self.assertEqual(dict(facets['ccy']), {'GBP': 1})
+        i.ccy = 'CHF'
+        yield i.save()
+        facets = yield query.facets('ccy')
+        self.assertEqual(dict(facets['ccy']), {'CHF': 1})
+        values = yield self.backend.client.hkeys(
+            self.backend.basekey(self.model._meta, 'val', 'ccy'))
+        self.assertEqual(values, [b'CHF'])
+        yield i.delete()
+        facets = yield query.facets('ccy')
+        self.assertEqual(facets, {'ccy': {}})
+
+    def test_bitmap_registry(self):
+        key = self.backend.basekey(Ticket._meta, 'val', 'status')
+        t = yield self.session().add(Ticket(title='a', status='open'))
+        values = yield self.backend.client.hkeys(key)
+        self.assertEqual(values, [b'open'])
+        t.status = 'closed'
+        yield t.save()
+        values = yield self.backend.client.hkeys(key)
+        self.assertEqual(values, [b'closed'])
+        yield t.delete()
+        values = yield self.backend.client.hkeys(key)
+        self.assertEqual(values, [])
+
+    def test_rebuild(self):
+        with self.session().begin() as t:
+            for n in range(6):
+                t.add(self.model(name='i%s' % n, ccy=('EUR', 'USD')[n % 2],
+                                 type='bond'))
+                t.add(Ticket(title='t%s' % n,
+                             status=('open', 'closed')[n % 3 > 0]))
+        yield t.on_result
+        client = self.backend.client
+        # data indexed before the registries were introduced
+        for meta, name in ((self.model._meta, 'ccy'),
+                           (self.model._meta, 'type'),
+                           (Ticket._meta, 'status')):
+            yield client.delete(self.backend.basekey(meta, 'val', name))
+        facets = yield self.query().facets('ccy')
+        self.assertEqual(facets, {'ccy': {}})
+        result = yield self.mapper.rebuild_facets()
+        self.assertEqual(result[self.model._meta.modelkey], 3)
+        # six titles, two status, one priority and one urgent value
+        self.assertEqual(result[Ticket._meta.modelkey], 10)
+        facets = yield self.query().facets('ccy', 'type')
+        self.assertEqual(dict(facets['ccy']), {'EUR': 3, 'USD': 3})
+        self.assertEqual(dict(facets['type']), {'bond': 6})
+        facets = yield self.query(Ticket).facets('status')
+        self.assertEqual(dict(facets['status']), {'open': 2, 'closed': 4})
@@ -0,0 +1,227 @@
+'''Location fields and radius queries.'''
+from math import asin, cos, pi, sin, sqrt
+
+from stdnet import FieldError, FieldValueError, QuerySetError, odm
+from stdnet.utils import test
+
+from examples.models import Venue, Venue2
+
+
+CITIES = (('London', 51.5074, -0.1278),
+          ('Paris', 48.8566, 2.3522),
+          ('Brussels', 50.8503, 4.3517),
+          ('Amsterdam', 52.3676, 4.9041),
+          ('Berlin', 52.52, 13.405),
+          ('Madrid', 40.4168, -3.7038),
+          ('Rome', 41.9028, 12.4964),
+          ('Oxford', 51.752, -1.2577),
+          ('Cambridge', 52.2053, 0.1218),
+          ('Reading', 51.4543, -0.9781),
+          ('New York', 40.7128, -74.006),
+          ('Nowhere', None, None))
+
+
+def distance(lat1, lon1, lat2, lon2):
+    r = pi / 180
+    u = sin((lat2 - lat1) * r / 2)
+    v = sin((lon2 - lon1) * r / 2)
+    return 2 * 6372.797560856 * asin(sqrt(u * u + cos(lat1 * r) *
+                                          cos(lat2 * r) * v * v))
+
+
+class TestGeoField(test.TestCase):
+    model = Venue
+
+    def test_meta(self):
+        field = self.model._meta.dfields['location']
+        self.assertTrue(field.geo)
+        self.assertFalse(field.required)
+        self.assertFalse(field in self.model._meta.indices)
+        self.assertEqual(self.model._meta.as_dict()['geos'],
+                         {'location': True})
+        self.assertFalse(odm.GeoField(index=False).geo)
+        self.assertRaises(FieldError, odm.GeoField, index='bitmap')
+
+    def test_to_python(self):
+        field = self.model._meta.dfields['location']
+        self.assertEqual(field.to_python((51, '-0.5')), (51.0, -0.5))
+        self.assertEqual(field.to_python(b'51.5,-0.12'), (51.5, -0.12))
+        self.assertEqual(field.to_python(None), None)
+        self.assertEqual(field.serialise((51.5, -0.12)), '51.5,-0.12')
+        self.assertRaises(FieldValueError, field.to_python, (90, 0))
+        self.assertRaises(FieldValueError, field.to_python, (0, 181))
+        self.assertRaises(FieldValueError, field.to_python, (1, 2, 3))
+        self.assertRaises(FieldValueError, field.to_python, 'foo')
+
+
+class TestGeoQuery(test.TestCase):
+    model = Venue
+
+    @classmethod
+    def after_setup(cls):
+        with cls.session().begin() as t:
+            for n, (name, lat, lon) in enumerate(CITIES):
+                location = None if lat is None else (lat, lon)
+                v = cls.model(name=name, kind=('pub', 'bar')[n % 2],
+                              location=location)
+                if cls.model is Venue2:
+                    v.rating = n
+                t.add(v)
+        yield t.on_result
+        cls.venues = yield cls.query().all()
+
+    def within(self, lat, lon, radius, venues=None):
+        venues = self.venues if venues is None else venues
+        return sorted((v.name for v in venues if v.location and
+                       distance(lat, lon, *v.location) <= radius))
+
+    def box(self, south, west, north, east, venues=None):
+        venues = self.venues if venues is None else venues
+        return sorted((v.name for v in venues if v.location and
+                       south <= v.location[0] <= north and
+                       west <= v.location[1] <= east))
+
+    def by_distance(self, lat, lon, venues=None):
+        venues = self.venues if venues is None else venues
+        far = float('inf')
+        key = lambda v: (distance(lat, lon, *v.location) if v.location
+                         else far, v.id)
+        return [v.name for v in sorted(venues, key=key)]
+
+    def test_within(self):
+        for radius in (1, 100, 400, 1000, 10000):
+            qs = yield self.query().filter(
+                location__within=(51.5074, -0.1278, radius)).all()
+            self.assertEqual(sorted((v.name for v in qs)),
+                             self.within(51.5074, -0.1278, radius))
+
+    def test_box(self):
+        for bounds in ((51, -2, 53, 1), (40, -5, 53, 15), (-80, -179, 80, 179),
+                       (10, 10, 11, 11)):
+            qs = yield self.query().filter(location__box=bounds).all()
+            self.assertEqual(sorted((v.name for v in qs)), self.box(*bounds))
+        qs = yield self.query().filter(location__box=(40, -5, 53, 15),
+                                       kind='pub').all()
+        pubs = [v for v in self.venues if v.kind == 'pub']
+        self.assertEqual(sorted((v.name for v in qs)),
+                         self.box(40, -5, 53, 15, pubs))
+
+    def test_within_filter(self):
+        qs = yield self.query().filter(location__within=(50, 2, 500),
+                                       kind='pub').all()
+        pubs = [v for v in self.venues if v.kind == 'pub']
+        self.assertEqual(sorted((v.name for v in qs)),
+                         self.within(50, 2, 500, pubs))
+
+    def test_within_union(self):
+        q1 = self.query().filter(location__within=(51.5, -0.12, 100))
+        q2 = self.query().filter(location__within=(41.9, 12.5, 100))
+        qs = yield q1.union(q2).all()
+        expected = set(self.within(51.5, -0.12, 100) +
+                       self.within(41.9, 12.5, 100))
+        self.assertEqual(set((v.name for v in qs)), expected)
+        qs = yield self.query().exclude(
+            location__within=(51.5, -0.12, 100)).all()
+        names = set((v.name for v in self.venues))
+        self.assertEqual(set((v.name for v in qs)),
+                         names - set(self.within(51.5, -0.12, 100)))
+
+    def test_sort_by_distance(self):
+        for lat, lon in ((48.85, 2.35), (52.5, 13.4), (0, 0)):
+            qs = yield self.query().sort_by_distance(lat, lon).all()
+            self.assertEqual([v.name for v in qs],
+                             self.by_distance(lat, lon))
+        self.assertEqual(qs[-1].name, 'Nowhere')
+
+    def test_sort_by_distance_slice(self):
+        expected = self.by_distance(50, 5)
+        qs = yield self.query().sort_by_distance(50, 5)[2:6]
+        self.assertEqual([v.name for v in qs], expected[2:6])
+        qs = yield self.query().sort_by_distance(50, 5)[-3:]
+        self.assertEqual([v.name for v in qs], expected[-3:])
+
+    def test_nearest(self):
+        qs = self.query().filter(location__within=(51.5, -0.12, 150))
+        items = yield qs.sort_by_distance(51.75, -1.25)[:3]
+        venues = [v for v in self.venues if v.name in
+                  self.within(51.5, -0.12, 150)]
+        self.assertEqual([v.name for v in items],
+                         self.by_distance(51.75, -1.25, venues)[:3])
+
+    def test_sort_by(self):
+        qs = self.query().sort_by_distance(50, 5).sort_by('name')
+        items = yield qs.all()
+        self.assertEqual([v.name for v in items],
+                         sorted((v.name for v in self.venues)))
+        self.assertTrue(qs.construct().fingerprint().endswith('name'))
+        qs = self.query().sort_by('name').sort_by_distance(50, 5)
+        self.assertTrue(qs.construct().fingerprint().endswith(
+            'distance=location'))
+
+    def test_errors(self):
+        query = self.query()
+        for lookups in ({'location': (51.5, -0.12)},
+                        {'name__within': (1, 1, 1)},
+                        {'location__within': (51.5, -0.12)},
+                        {'location__within': (51.5, -0.12, 0)},
+                        {'location__within': (91, -0.12, 10)},
+                        {'name__box': (1, 1, 2, 2)},
+                        {'location__box': (51, -1, 52)},
+                        {'location__box': (52, -1, 51, 1)},
+                        {'location__box': (51, 1, 52, -1)},
+                        {'location__box': (51, -1, 91, 1)}):
+            self.assertRaises(QuerySetError, query.filter(**lookups).construct)
+        self.assertRaises(QuerySetError, query.sort_by_distance, 91, 0)
+        self.assertRaises(QuerySetError, query.sort_by_distance, 0, 0,
+                          'name')
+        self.assertRaises(QuerySetError, query.sort_by_distance, 0, 0, 'foo')
+
+
+class TestSortedGeoQuery(TestGeoQuery):
+    model = Venue2
+
+
+class TestGeoWrite(test.TestWrite):
+    model = Venue
+
+    def locations(self):
+        return self.backend.client.zrange(
+            self.backend.basekey(self.model._meta, 'geo', 'location'), 0, -1)
+
+    def test_index(self):
+        query = lambda: self.query().filter(
+            location__within=(51.5, -0.12, 10))
+        v = yield self.session().add(self.model(name='a',
+                                                location=(51.5, -0.12)))
+        qs = yield query().all()
+        self.assertEqual(qs, [v])
+        v.location = (48.85, 2.35)
+        yield v.save()
+        qs = yield query().all()
+        self.assertEqual(qs, [])
+        v.location = None
+        yield v.save()
+        locations = yield self.locations()
+        self.assertEqual(locations, [])
+        v.location = (51.5, -0.12)
+        yield v.save()
+        locations = yield self.locations()
+        self.assertEqual(locations, [str(v.id).encode('utf-8')])
+        yield v.delete()
+        locations = yield self.locations()
+        self.assertEqual(locations, [])
+
+    def test_ties(self):
+        # elements at the same distance are ordered by numeric id
+        with self.session().begin() as t:
+            for n in range(12):
+                t.add(self.model(name='v%s' % n, location=(51.5, -0.12)))
+            for n in range(12, 14):
+                t.add(self.model(name='v%s' % n))
+        yield t.on_result
+        venues = yield self.query().all()
+        expected = sorted((v.id for v in venues))
+        qs = yield self.query().sort_by_distance(48.85, 2.35).all()
+        self.assertEqual([v.id for v in qs], expected)
+        qs = yield self.query().sort_by_distance(48.85, 2.35)[9:13]
+        self.assertEqual([v.id for v in qs], expected[9:13])
@@ -0,0 +1,133 @@
+'''Session identity map.'''
+import gc
+
+from stdnet.odm import IdentityMap
+
+from examples.models import Instrument, Position
+from examples.data import FinanceTest
+
+
+class TestIdentityMap(FinanceTest):
+
+    @classmethod
+    def after_setup(cls):
+        return cls.data.makePositions(cls)
+
+    def identity_session(self, size=100):
+        return self.mapper.session(identity_map=size)
+
+    def test_default(self):
+        self.assertEqual(self.mapper.session().identity_map, None)
+        session = self.identity_session()
+        self.assertEqual(len(session.identity_map), 0)
+        self.assertEqual(session.identity_map.size, 100)
+
+    def test_get(self):
+        session = self.identity_session()
+        i = yield session.query(Instrument).get(id=1)
+        self.assertTrue(i in session.identity_map)
+        description = i.description
+        # update the instance from another session
+        i0 = yield self.query(Instrument).get(id=1)
+        i0.description = 'updated by another session'
+        yield i0.save()
+        # the instance is served from memory
+        i2 = yield session.query(Instrument).get(id=1)
+        self.assertTrue(i2 is i)
+        self.assertEqual(i2.description, description)
+        i3 = yield session.query(Instrument).get(id='1')
+        self.assertTrue(i3 is i)
+
+    def test_missing_ids(self):
+        session = self.identity_session()
+        qs = session.query(Instrument)
+        i1 = yield qs.get(id=1)
+        i2 = yield qs.get(id=2)
+        instruments = yield qs.filter(id__in=(1, 2, 3)).all()
+        self.assertEqual(len(instruments), 3)
+        instruments = dict(((i.id, i) for i in instruments))
+        self.assertTrue(instruments[1] is i1)
+        self.assertTrue(instruments[2] is i2)
+        self.assertTrue(instruments[3] in session.identity_map)
+        self.assertEqual(len(session.identity_map), 3)
+
+    def test_foreign_key(self):
+        session = self.identity_session(10000)
+        instruments = yield session.query(Instrument).all()
+        positions = yield session.query(Position).all()
+        instruments = dict(((i.id, i) for i in instruments))
+        for p in positions[:5]:
+            instrument = yield p.instrument
+            self.assertTrue(instrument is instruments[p.instrument_id])
+
+    def test_partial(self):
+        session = self.identity_session()
+        qs = session.query(Instrument)
+        i = yield qs.load_only('name').get(id=1)
+        self.assertFalse(i in session.identity_map)
+        i = yield qs.compact().get(id=1)
+        self.assertTrue(i in session.identity_map)
+        i2 = yield qs.get(id=1)
+        self.assertTrue(i2 is i)
+        i3 = yield qs.compact(False).get(id=1)
+        self.assertFalse(i3 is i)
+        i = yield qs.readonly().get(id=2)
+        self.assertFalse(i in session.identity_map)
+
+    def test_commit(self):
+        session = self.identity_session()
+        qs = session.query(Instrument)
+        i = yield session.add(Instrument(name='identity1', ccy='XYZ',
+                                         type='future'))
+        i = yield qs.get(id=i.id)
+        self.assertTrue(i in session.identity_map)
+        i.name = 'identity2'
+        yield i.save()
+        self.assertFalse(i in session.identity_map)
+        i2 = yield qs.get(id=i.id)
+        self.assertEqual(i2.name, 'identity2')
+        self.assertTrue(i2 in session.identity_map)
+        yield session.delete(i2)
+        self.assertFalse(i2 in session.identity_map)
+        yield self.async.assertRaises(Instrument.DoesNotExist, qs.get,
+                                      id=i.id)
+
+    def test_delete_query(self):
+        session = self.identity_session()
+        qs = session.query(Instrument)
+        with session.begin() as t:
+            t.add(Instrument(name='delete1', ccy='XYZ', type='future'))
+            t.add(Instrument(name='delete2', ccy='XYZ', type='future'))
+        yield t.on_result
+        instruments = yield qs.filter(ccy='XYZ').all()
+        self.assertEqual(len(instruments), 2)
+        i = instruments[0]
+        self.assertTrue(i in session.identity_map)
+        yield qs.filter(ccy='XYZ').delete()
+        self.assertFalse(i in session.identity_map)
+        result = yield qs.filter(id=i.id).all()
+        self.assertEqual(result, [])
+
+    def test_bounded(self):
+        session = self.identity_session(2)
+        instruments = yield session.query(Instrument).sort_by('id').all()
+        self.assertTrue(len(instruments) > 2)
+        self.assertEqual(len(session.identity_map), 2)
+        self.assertTrue(instruments[-1] in session.identity_map)
+        self.assertFalse(instruments[0] in session.identity_map)
+
+    def test_weak_references(self):
+        identity_map = IdentityMap()
+        i = Instrument(id=1, name='weak', ccy='EUR', type='equity')
+        identity_map.add(i)
+        self.assertTrue(identity_map.get(Instrument._meta, 1) is i)
+        del i
+        gc.collect()
+        self.assertEqual(identity_map.get(Instrument._meta, 1), None)
+        self.assertEqual(len(identity_map), 0)
+
+    def test_expunge(self):
+        session = self.identity_session()
+        i = yield session.query(Instrument).get(id=1)
+        session.expunge()
+        self.assertEqual(len(session.identity_map), 0)
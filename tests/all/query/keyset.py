@@ -0,0 +1,138 @@
+'''Keyset pagination with cursors.'''
+from datetime import date, timedelta
+
+from stdnet import QuerySetError
+from stdnet.utils import test
+
+from examples.models import SportAtDate, SportAtDate2, TestDateModel
+
+
+GROUPS = ('football', 'rugby', 'swimming')
+
+
+class TestKeysetPagination(test.TestCase):
+    models = (SportAtDate, TestDateModel)
+    desc = False
+
+    @classmethod
+    def after_setup(cls):
+        start = date(2012, 1, 1)
+        with cls.session().begin() as t:
+            for n in range(47):
+                # dates with ties
+                t.add(cls.model(person='p%s' % n, name=GROUPS[n % 3],
+                                dt=start + timedelta(days=n % 11)))
+        yield t.on_result
+        cls.data = yield cls.query().all()
+
+    def expected(self, instances, desc=None):
+        desc = self.desc if desc is None else desc
+        # ties are resolved by the id as a string, as in sorted sets
+        key = lambda o: (o.dt, str(o.id))
+        return [o.id for o in sorted(instances, key=key, reverse=desc)]
+
+    def pages(self, query, limit):
+        ids, cursor = [], None
+        while True:
+            items, cursor = yield query().page(limit, cursor)
+            self.assertTrue(len(items) <= limit)
+            ids.extend((o.id for o in items))
+            if not cursor:
+                break
+        yield ids
+
+    def test_pages(self):
+        for limit in (1, 5, 47, 100):
+            ids = yield self.pages(self.query, limit)
+            self.assertEqual(ids, self.expected(self.data))
+
+    def test_filter(self):
+        query = lambda: self.query().filter(name=('football', 'rugby'))
+        ids = yield self.pages(query, 4)
+        instances = [o for o in self.data if o.name != 'swimming']
+        self.assertEqual(ids, self.expected(instances))
+
+    def test_sort_by(self):
+        desc = not self.desc
+        by = '-dt' if desc else 'dt'
+        query = lambda: self.query().sort_by(by)
+        ids = yield self.pages(query, 6)
+        self.assertEqual(ids, self.expected(self.data, desc))
+
+    def test_after(self):
+        items, cursor = yield self.query().page(10)
+        expected = self.expected(self.data)
+        items = yield self.query().after(cursor)[2:5]
+        self.assertEqual([o.id for o in items], expected[12:15])
+        items = yield self.query().after(cursor).all()
+        self.assertEqual([o.id for o in items], expected[10:])
+        items = yield self.query().after(cursor)[-3:]
+        self.assertEqual([o.id for o in items], expected[-3:])
+
+    def test_count(self):
+        items, cursor = yield self.query().page(10)
+        n = yield self.query().after(cursor).count()
+        self.assertEqual(n, len(self.data) - 10)
+        qs = self.query().filter(name='rugby').after(cursor)
+        n = yield qs.count()
+        expected = self.expected(self.data)[10:]
+        rugby = set((o.id for o in self.data if o.name == 'rugby'))
+        self.assertEqual(n, len([id for id in expected if id in rugby]))
+
+    def test_subquery(self):
+        items, cursor = yield self.query().page(20)
+        after = self.query().after(cursor)
+        qs = yield self.query().filter(id=after).all()
+        expected = self.expected(self.data)[20:]
+        self.assertEqual(set((o.id for o in qs)), set(expected))
+        qs = yield self.query().exclude(id=after).all()
+        self.assertEqual(set((o.id for o in qs)),
+                         set(self.expected(self.data)[:20]))
+
+    def test_stable(self):
+        items, cursor = yield self.query().page(10)
+        # add an element before the cursor
+        dates = [o.dt for o in self.data]
+        if self.desc:
+            dt = max(dates) + timedelta(days=1)
+        else:
+            dt = min(dates) - timedelta(days=1)
+        new = yield self.session().add(self.model(person='new', dt=dt,
+                                                  name='rugby'))
+        items, _ = yield self.query().page(5, cursor)
+        expected = self.expected(self.data)
+        self.assertEqual([o.id for o in items], expected[10:15])
+        yield new.delete()
+
+    def test_errors(self):
+        query = self.query()
+        self.assertRaises(QuerySetError, query.page, 0)
+        self.assertRaises(QuerySetError, query.after, 'foo')
+        items, cursor = yield query.page(3)
+        qs = self.query().sort_by('person').after(cursor)
+        yield self.async.assertRaises(QuerySetError, qs.all)
+        qs = self.query(TestDateModel)
+        self.assertRaises(QuerySetError, qs.page, 10)
+
+
+class TestKeysetPaginationDesc(TestKeysetPagination):
+    models = (SportAtDate2, TestDateModel)
+    desc = True
+
+
+class TestKeysetWrite(test.TestWrite):
+    model = SportAtDate
+
+    def test_delete(self):
+        start = date(2012, 1, 1)
+        with self.session().begin() as t:
+            for n in range(12):
+                t.add(self.model(person='p%s' % n, name=GROUPS[n % 3],
+                                 dt=start + timedelta(days=n % 5)))
+        yield t.on_result
+        items, cursor = yield self.query().page(5)
+        yield self.query().after(cursor).delete()
+        qs = yield self.query().all()
+        self.assertEqual([o.id for o in qs], [o.id for o in items])
+        n = yield self.query().after(cursor).count()
+        self.assertEqual(n, 0)
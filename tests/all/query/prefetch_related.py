@@ -0,0 +1,130 @@
+'''Prefetch instances of reverse foreign keys and many-to-many relations.'''
+from stdnet import FieldError
+from stdnet.utils import test
+
+from examples.models import Fund, Position, Role, Profile
+from examples.data import FinanceTest
+
+
+class TestPrefetchRelated(FinanceTest):
+
+    @classmethod
+    def after_setup(cls):
+        return cls.data.makePositions(cls)
+
+    def test_errors(self):
+        qs = self.query(Fund)
+        self.assertRaises(FieldError, qs.prefetch_related, 'foo')
+        self.assertRaises(FieldError, qs.prefetch_related, 'description')
+        qs = qs.prefetch_related('positions')
+        self.assertEqual(qs.data['prefetch_related'], ('positions',))
+        qs = qs.prefetch_related('positions')
+        self.assertEqual(qs.data['prefetch_related'], ('positions',))
+
+    def test_positions(self):
+        session = self.session()
+        funds = yield session.query(Fund).prefetch_related('positions').all()
+        self.assertTrue(funds)
+        cache_name = Fund.positions.get_cache_name()
+        n = 0
+        for fund in funds:
+            self.assertTrue(hasattr(fund, cache_name))
+            positions = yield fund.positions.all()
+            ids = yield session.query(Position).filter(fund=fund).get_field(
+                'id').all()
+            self.assertEqual(set((p.id for p in positions)), set(ids))
+            for p in positions:
+                self.assertEqual(p.fund_id, fund.id)
+                self.assertEqual(p.session, session)
+                self.assertTrue(p.get_state().persistent)
+            n += len(positions)
+        total = yield session.query(Position).count()
+        self.assertEqual(n, total)
+
+    def test_not_cached(self):
+        fund = yield self.query(Fund).get(id=1)
+        self.assertFalse(hasattr(fund, Fund.positions.get_cache_name()))
+        positions = yield fund.positions.all()
+        positions2 = yield fund.positions.query().all()
+        self.assertEqual(set(positions), set(positions2))
+
+    def test_load_only(self):
+        funds = yield self.query(Fund).load_only('name').prefetch_related(
+            'positions').all()
+        for fund in funds:
+            positions = yield fund.positions.all()
+            for p in positions:
+                self.assertEqual(p.fund_id, fund.id)
+                self.assertTrue(p.size is not None)
+
+    def test_readonly(self):
+        funds = yield self.query(Fund).readonly().prefetch_related(
+            'positions').all()
+        positions = yield funds[0].positions.all()
+        self.assertTrue(positions)
+        self.assertTrue(positions[0].session.readonly)
+
+    def test_batch_related(self):
+        funds = yield self.query(Fund).prefetch_related('positions').all()
+        positions = []
+        for fund in funds:
+            positions.extend(fund.positions.all())
+        self.assertTrue(len(positions) > 1)
+        instrument = yield positions[0].instrument
+        self.assertEqual(instrument.id, positions[0].instrument_id)
+        cache_name = Position._meta.dfields['instrument'].get_cache_name()
+        for p in positions:
+            self.assertTrue(hasattr(p, cache_name))
+
+
+class TestPrefetchManyToMany(test.TestCase):
+    models = (Role, Profile)
+
+    @classmethod
+    def after_setup(cls):
+        models = cls.mapper
+        with models.session().begin() as t:
+            for name in ('admin', 'coder', 'tester'):
+                t.add(models.role(name=name))
+            for name in ('p1', 'p2', 'p3'):
+                t.add(models.profile(name=name))
+        yield t.on_result
+        roles = yield models.role.query().sort_by('name').all()
+        profiles = yield models.profile.query().sort_by('name').all()
+        with models.session().begin() as t:
+            profiles[0].roles.add(roles[0])
+            profiles[0].roles.add(roles[1])
+            profiles[1].roles.add(roles[1])
+        yield t.on_result
+
+    def test_roles(self):
+        profiles = yield self.query(Profile).filter(
+            name=('p1', 'p2', 'p3')).sort_by('name').prefetch_related(
+            'roles').all()
+        roles = [sorted((r.name for r in p.roles.all())) for p in profiles]
+        self.assertEqual(roles, [['admin', 'coder'], ['coder'], []])
+        for p in profiles:
+            roles = yield p.roles.query().all()
+            self.assertEqual(set(roles), set(p.roles.all()))
+
+    def test_profiles(self):
+        qs = self.query(Role).filter(name=('admin', 'coder', 'tester'))
+        roles = yield qs.sort_by('name').prefetch_related('profiles').all()
+        profiles = [sorted((p.name for p in r.profiles.all())) for r in roles]
+        self.assertEqual(profiles, [['p1'], ['p1', 'p2'], []])
+        # instances are loaded once
+        p1 = roles[0].profiles.all()[0]
+        self.assertTrue(p1 in roles[1].profiles.all())
+        self.assertTrue([p for p in roles[1].profiles.all() if p is p1])
+
+    def test_add(self):
+        models = self.mapper
+        profile = yield models.profile.new(name='p4')
+        profile = yield self.query(Profile).filter(
+            id=profile.id).prefetch_related('roles').all()
+        profile = profile[0]
+        self.assertEqual(profile.roles.all(), [])
+        role = yield models.role.new(name='designer')
+        yield profile.roles.add(role)
+        roles = yield profile.roles.all()
+        self.assertEqual(roles, [role])
@@ -0,0 +1,82 @@
+'''Read-only queries which do not track instances in the session.'''
+from stdnet import SessionNotAvailable, InvalidTransaction
+
+from examples.models import Instrument, Position
+from examples.data import FinanceTest
+
+
+class TestReadOnly(FinanceTest):
+
+    @classmethod
+    def after_setup(cls):
+        return cls.data.makePositions(cls)
+
+    def test_load(self):
+        session = self.session()
+        self.assertFalse(session.readonly)
+        instruments = yield session.query(Instrument).readonly().all()
+        self.assertTrue(instruments)
+        for i in instruments:
+            self.assertFalse('state' in i._dbdata)
+            self.assertEqual(i.session, session.readonly_session)
+            self.assertTrue(i.session.readonly)
+            self.assertEqual(i.session.session, session)
+            self.assertFalse(i in session)
+        i = yield session.query(Instrument).get(id=instruments[0].id)
+        self.assertTrue('state' in i._dbdata)
+        self.assertEqual(i.session, session)
+
+    def test_save(self):
+        session = self.session()
+        i = yield session.query(Instrument).readonly().get(id=1)
+        i.name = 'readonly'
+        self.assertRaises(SessionNotAvailable, i.save)
+        self.assertRaises(SessionNotAvailable, i.delete)
+        n = yield self.query(Instrument).filter(name='readonly').count()
+        self.assertEqual(n, 0)
+        yield session.add(i)
+        self.assertEqual(i.session, session)
+        self.assertTrue(i.get_state().persistent)
+        n = yield self.query(Instrument).filter(name='readonly').count()
+        self.assertEqual(n, 1)
+        i.name = 'readonly2'
+        yield i.save()
+        i = yield self.query(Instrument).get(id=1)
+        self.assertEqual(i.name, 'readonly2')
+
+    def test_session(self):
+        session = self.mapper.session(readonly=True)
+        self.assertTrue(session.readonly)
+        i = yield session.query(Instrument).get(id=1)
+        self.assertEqual(i.session, session.readonly_session)
+        self.assertRaises(SessionNotAvailable, i.save)
+        i = yield session.query(Instrument).readonly(False).get(id=1)
+        self.assertEqual(i.session, session)
+
+    def test_related(self):
+        session = self.session()
+        positions = yield session.query(Position).readonly().all()
+        self.assertTrue(positions)
+        p = positions[0]
+        instrument = yield p.instrument
+        self.assertEqual(instrument.id, p.instrument_id)
+        self.assertEqual(instrument.session, session.readonly_session)
+        self.assertRaises(SessionNotAvailable, instrument.save)
+
+    def test_compact(self):
+        session = self.session()
+        qs = session.query(Instrument).readonly().compact()
+        i = yield qs.get(id=1)
+        self.assertEqual(type(i), Instrument._meta.compact_model())
+        self.assertEqual(i._dbdata, None)
+        self.assertRaises(SessionNotAvailable, i.save)
+
+    def test_no_session(self):
+        i = Instrument(name='foo', ccy='EUR', type='equity')
+        self.assertRaises(SessionNotAvailable, i.save)
+        self.assertRaises(SessionNotAvailable, i.delete)
+
+    def test_transaction(self):
+        session = self.session().readonly_session
+        self.assertRaises(InvalidTransaction, session.begin)
+        self.assertRaises(InvalidTransaction, session.commit)
@@ -1,6 +1,7 @@
 import datetime
 from random import randint, uniform
 
+from stdnet import FieldError
 from stdnet.utils import test
 
 from examples.models import Node, Role, Profile, Dictionary, PrivateKey, PublicKey
@@ -71,6 +72,43 @@ in this test class so that we can use the manager in a parallel test suite.'''
         for node in qs:
             self.assertEqual(node.parent, root)
 
+    def test_nested_meta(self):
+        query = self.query().load_related('parent__parent', 'weight')
+        self.assertEqual(query.select_related, {'parent': (),
+                                                'parent__parent': ('weight',)})
+        self.assertRaises(FieldError, query.load_related, 'parent__weight')
+        self.assertRaises(FieldError, query.load_related, 'parent__foo')
+
+    def test_nested(self):
+        pcache = self.model._meta.dfields['parent'].get_cache_name()
+        all = yield self.query().load_related('parent__parent').all()
+        grandchildren = [n for n in all if n.parent_id and
+                         getattr(n, pcache).parent_id]
+        self.assertTrue(grandchildren)
+        for node in grandchildren:
+            parent = getattr(node, pcache)
+            self.assertEqual(parent.id, node.parent_id)
+            grandparent = getattr(parent, pcache)
+            self.assertTrue(isinstance(grandparent, self.model))
+            self.assertEqual(grandparent.id, parent.parent_id)
+            self.assertFalse(grandparent.parent_id)
+
+    def test_nested_with_fields(self):
+        pcache = self.model._meta.dfields['parent'].get_cache_name()
+        qs = self.query().load_related('parent', 'weight')\
+                         .load_related('parent__parent', 'weight')
+        all = yield qs.all()
+        grandchildren = [n for n in all if n.parent_id and
+                         getattr(n, pcache).parent_id]
+        self.assertTrue(grandchildren)
+        for node in grandchildren:
+            parent = getattr(node, pcache)
+            self.assertEqual(set(parent._loadedfields),
+                             set(('weight', 'parent')))
+            grandparent = getattr(parent, pcache)
+            self.assertEqual(set(grandparent._loadedfields), set(('weight',)))
+            self.assertEqual(grandparent.weight, 1.0)
+
 
 class TestDeleteSelfRelated(test.TestWrite):
     model = Node
@@ -49,6 +49,36 @@ class TestSort(test.TestCase):
                 self.assertTrue(at1>=at0)
             at0 = at1
 
+    def sorted_ids(self, instances, attr, desc=False):
+        # ties are resolved by the id as a string, as in redis
+        key = lambda o: (o.get_attr_value(attr), str(o.id))
+        return [o.id for o in sorted(instances, key=key, reverse=desc)]
+
+    def multi_sorted_ids(self, instances, *orderings):
+        # ties are resolved by the id, a number for auto ids
+        instances = sorted(instances, key=lambda o: o.id)
+        for ordering in reversed(orderings):
+            desc = ordering.startswith('-')
+            attr = ordering[1:] if desc else ordering
+            instances = sorted(instances, key=lambda o: getattr(o, attr),
+                               reverse=desc)
+        return [o.id for o in instances]
+
+    def _multiSortTest(self):
+        all = yield self.query().all()
+        for orderings in (('name', '-dt'), ('-name', 'person', 'dt'),
+                          ('name', 'person')):
+            expected = self.multi_sorted_ids(all, *orderings)
+            qs = yield self.query().sort_by(*orderings).all()
+            self.assertEqual([o.id for o in qs], expected)
+            qs = yield self.query().sort_by(*orderings)[5:15]
+            self.assertEqual([o.id for o in qs], expected[5:15])
+        query = lambda: self.query().filter(name=('rugby', 'football'))
+        all = yield query().all()
+        expected = self.multi_sorted_ids(all, 'person', '-dt')
+        qs = yield query().sort_by('person', '-dt')[:10]
+        self.assertEqual([o.id for o in qs], expected[:10])
+
 
 class ExplicitOrderingMixin(object):
 
@@ -91,6 +121,22 @@ class ExplicitOrderingMixin(object):
     def testDateSlicingDesc(self):
         return self._slicingTest('dt',True)
 
+    def testSortByMultiple(self):
+        return self._multiSortTest()
+
+    def testSortByMultipleErrors(self):
+        qs = self.query()
+        self.assertRaises(QuerySetError, qs.sort_by, 'name', 'whaaaa')
+        self.assertRaises(QuerySetError, qs.sort_by, None, 'name')
+
+    def testTop(self):
+        all = yield self.query().all()
+        for by in ('dt', '-dt'):
+            expected = self.sorted_ids(all, 'dt', by.startswith('-'))
+            top = yield self.query().top(5, by=by)
+            self.assertEqual([o.id for o in top], expected[:5])
+        self.assertRaises(QuerySetError, self.query().top, 0, by='dt')
+
 
 class TestSortBy(TestSort, ExplicitOrderingMixin):
     '''Test the sort_by in a model without ordering meta attribute.
@@ -135,6 +181,8 @@ class TestSortByForeignKeyField(TestSort):
         self.assertEqual(ordering.nested.name, 'name')
         self.assertEqual(ordering.model, qs.model)
         self.checkOrder(qs, 'group__name')
+        self.assertRaises(QuerySetError, self.query().sort_by,
+                          'group__name', 'name')
 
 
 class TestOrderingModel(TestSort):
@@ -160,6 +208,30 @@ class TestOrderingModel(TestSort):
         qs = self.query().exclude(name='rugby')
         return self.checkOrder(qs, 'dt')
 
+    def testSlice(self):
+        all = yield self.query().all()
+        qs = yield self.query()[:3]
+        self.assertEqual(qs, all[:3])
+        qs = yield self.query()[2:5]
+        self.assertEqual(qs, all[2:5])
+
+    def testSortByMultiple(self):
+        return self._multiSortTest()
+
+    def testSortIndex(self):
+        query = lambda: self.query().filter(name=('football', 'rugby'))
+        all = yield query().all()
+        for by in ('dt', '-dt'):
+            expected = self.sorted_ids(all, 'dt', by.startswith('-'))
+            result = yield query().sort_by(by).all()
+            self.assertEqual([o.id for o in result], expected)
+            result = yield query().sort_by(by)[3:8]
+            self.assertEqual([o.id for o in result], expected[3:8])
+            result = yield query().sort_by(by)[-4:]
+            self.assertEqual([o.id for o in result], expected[-4:])
+            result = yield query().top(5, by=by)
+            self.assertEqual([o.id for o in result], expected[:5])
+
 
 class TestOrderingModelDesc(TestOrderingModel):
     model = SportAtDate2
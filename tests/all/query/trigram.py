@@ -0,0 +1,107 @@
+'''Trigram indices for contains lookups.'''
+from stdnet import odm
+from stdnet.utils import test
+
+from examples.models import Counterparty
+
+
+NAMES = ('Banca Intesa', 'Deutsche Bank', 'BNP Paribas', 'Bank of America',
+         'Barclays', 'Credit Suisse', 'UBS', 'Santander', 'Nomura',
+         'ING Bank', 'Banco Bilbao', 'BANKIA')
+
+
+class SortedCounterparty(odm.StdModel):
+    name = odm.SymbolField(trigram=True)
+    description = odm.CharField(trigram=True)
+    rank = odm.IntegerField(default=0)
+
+    class Meta:
+        ordering = 'rank'
+
+
+class TestTrigramIndex(test.TestCase):
+    model = Counterparty
+
+    @classmethod
+    def after_setup(cls):
+        with cls.session().begin() as t:
+            for rank, name in enumerate(reversed(NAMES)):
+                c = cls.model(name=name, description='%s plc' % name)
+                if cls.model is SortedCounterparty:
+                    c.rank = rank
+                t.add(c)
+        yield t.on_result
+
+    def names(self, qs):
+        return sorted((c.name for c in qs))
+
+    def test_meta(self):
+        meta = self.model._meta
+        self.assertTrue(meta.dfields['name'].trigram)
+        self.assertEqual(meta.as_dict()['trigrams'],
+                         {'name': True, 'description': True})
+
+    def test_contains(self):
+        qs = yield self.query().filter(name__contains='Bank').all()
+        self.assertEqual(self.names(qs),
+                         ['Bank of America', 'Deutsche Bank', 'ING Bank'])
+        qs = yield self.query().filter(name__contains='ank').all()
+        self.assertEqual(self.names(qs), ['Bank of America', 'Deutsche Bank',
+                                          'ING Bank'])
+        qs = yield self.query().filter(name__contains='xyz').all()
+        self.assertEqual(qs, [])
+
+    def test_icontains(self):
+        qs = yield self.query().filter(name__icontains='bank').all()
+        self.assertEqual(self.names(qs), ['BANKIA', 'Bank of America',
+                                          'Deutsche Bank', 'ING Bank'])
+        qs = yield self.query().filter(description__icontains='BANCO B').all()
+        self.assertEqual(self.names(qs), ['Banco Bilbao'])
+
+    def test_short_and_special(self):
+        qs = yield self.query().filter(name__contains='S').all()
+        self.assertEqual(self.names(qs), ['Credit Suisse', 'Santander',
+                                          'UBS'])
+        qs = yield self.query().filter(name__contains='a.').all()
+        self.assertEqual(qs, [])
+
+    def test_multiple(self):
+        qs = self.query().filter(name__contains='Ban',
+                                 description__contains='ca I')
+        qs = yield qs.all()
+        self.assertEqual(self.names(qs), ['Banca Intesa'])
+        qs = self.query().filter(name__icontains='ban').exclude(
+            name__startswith='Ban')
+        qs = yield qs.all()
+        self.assertEqual(self.names(qs), ['BANKIA', 'Deutsche Bank',
+                                          'ING Bank'])
+
+
+class TestSortedTrigramIndex(TestTrigramIndex):
+    model = SortedCounterparty
+
+    def test_ordering(self):
+        qs = yield self.query().filter(name__icontains='ban').all()
+        ranks = [c.rank for c in qs]
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(len(ranks), 6)
+
+
+class TestTrigramIndexWrite(test.TestWrite):
+    model = Counterparty
+
+    def test_update_and_delete(self):
+        query = self.query()
+        c = yield self.session().add(self.model(name='Lehman Brothers'))
+        qs = yield query.filter(name__contains='Lehman').all()
+        self.assertEqual([o.id for o in qs], [c.id])
+        c = yield query.get(id=c.id)
+        c.name = 'Barclays Capital'
+        yield c.save()
+        qs = yield query.filter(name__contains='Lehman').all()
+        self.assertEqual(qs, [])
+        qs = yield query.filter(name__contains='Capital').all()
+        self.assertEqual([o.id for o in qs], [c.id])
+        yield c.delete()
+        qs = yield query.filter(name__contains='Capital').all()
+        self.assertEqual(qs, [])
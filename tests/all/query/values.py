@@ -0,0 +1,74 @@
+'''Test query.values and query.values_list methods.'''
+from datetime import date
+
+from stdnet import QuerySetError, FieldError
+
+from examples.models import Instrument, Position
+from examples.data import FinanceTest
+
+
+class TestValues(FinanceTest):
+
+    @classmethod
+    def after_setup(cls):
+        return cls.data.makePositions(cls)
+
+    def test_values(self):
+        session = self.session()
+        qs = session.query(Instrument).filter(ccy='EUR')
+        instruments = yield qs.all()
+        self.assertTrue(instruments)
+        values = yield session.query(Instrument).filter(
+            ccy='EUR').values('name', 'ccy')
+        self.assertEqual(len(values), len(instruments))
+        self.assertEqual(sorted((v['name'] for v in values)),
+                         sorted((i.name for i in instruments)))
+        for v in values:
+            self.assertEqual(v, {'name': v['name'], 'ccy': 'EUR'})
+
+    def test_all_fields(self):
+        qs = self.query(Instrument)
+        instruments = yield qs.all()
+        values = yield qs.values()
+        self.assertEqual(len(values), len(instruments))
+        instruments = dict(((i.id, i) for i in instruments))
+        for v in values:
+            self.assertEqual(set(v), set(('id', 'name', 'ccy', 'type',
+                                          'description')))
+            instrument = instruments[v['id']]
+            self.assertEqual(v['name'], instrument.name)
+            self.assertEqual(v['type'], instrument.type)
+
+    def test_values_list(self):
+        qs = self.query(Position)
+        positions = yield qs.all()
+        values = yield qs.values_list('id', 'instrument', 'dt', 'size')
+        self.assertEqual(len(values), len(positions))
+        positions = dict(((p.id, p) for p in positions))
+        for v in values:
+            self.assertTrue(isinstance(v, tuple))
+            p = positions[v[0]]
+            self.assertEqual(v, (p.id, p.instrument_id, p.dt, p.size))
+            self.assertTrue(isinstance(v[2], date))
+            self.assertTrue(isinstance(v[3], float))
+
+    def test_flat(self):
+        qs = self.query(Instrument).sort_by('name')
+        names = yield qs.get_field('name').all()
+        values = yield qs.values_list('name', flat=True)
+        self.assertEqual(values, sorted(names))
+        self.assertRaises(QuerySetError, qs.values_list, 'name', 'ccy',
+                          flat=True)
+        self.assertRaises(TypeError, qs.values_list, 'name', foo=True)
+
+    def test_empty(self):
+        qs = self.query(Instrument)
+        values = yield qs.filter(ccy='XXX').values('name')
+        self.assertEqual(values, [])
+        values = yield qs.filter(ccy__in=()).values_list('name')
+        self.assertEqual(values, [])
+
+    def test_bad_fields(self):
+        qs = self.query(Instrument)
+        self.assertRaises(FieldError, qs.values, 'foo')
+        self.assertRaises(FieldError, qs.values_list, 'name', 'positions')